@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""Mesure des performances de l'assembleur.
+
+Des génomes et des reads sont simulés de façon déterministe (taille,
+couverture, taux d'erreur et répétitions configurables), puis chaque
+étape du pipeline est chronométrée (et sa mémoire mesurée) pour une
+série de tailles de génome. Les résultats sont écrits au format JSON
+afin d'être comparés d'un commit à l'autre.
+"""
+
+### Import des modules
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '../debruijn')))
+import debruijn
+
+### Constantes
+TAILLES_DEFAUT = "10000,100000,1000000"
+#Pente (log du temps en fonction du log de la taille) au-delà de
+#laquelle une étape est signalée comme super-linéaire.
+PENTE_MAX = 1.2
+ETAPES_BENCHMARK = ("build_kmer_dict", "build_graph", "clean_graph",
+                    "iter_contigs")
+
+### Liste des fonctions.
+def simulate_genome(taille, graine=0, fraction_repetee=0.0,
+                    taille_repetition=500):
+    """Génère un génome aléatoire de taille bases.
+
+    Une fraction fraction_repetee du génome est constituée de copies
+    d'une même répétition de taille_repetition bases, insérées à des
+    positions tirées au hasard.
+    """
+    hasard = random.Random(graine)
+    genome = [hasard.choice("ACGT") for _ in range(taille)]
+    nbre_copies = int(taille * fraction_repetee) // max(taille_repetition, 1)
+    if nbre_copies:
+        repetition = [hasard.choice("ACGT") for _ in range(taille_repetition)]
+        for _ in range(nbre_copies):
+            debut = hasard.randrange(0, max(taille - taille_repetition, 1))
+            genome[debut:debut + taille_repetition] = repetition
+    return "".join(genome[:taille])
+
+def simulate_reads(genome, nom_fichier, couverture=30, longueur_reads=100,
+                   taux_erreur=0.0, graine=0):
+    """Écrit dans un fichier fastq des reads (brin direct) tirés
+    uniformément sur le génome, avec des substitutions au taux
+    taux_erreur. Retourne le nombre de reads écrits.
+    """
+    hasard = random.Random(graine)
+    nbre_reads = len(genome) * couverture // longueur_reads
+    qualite = "I" * longueur_reads
+    with open(nom_fichier, "w") as fastq:
+        for numero in range(nbre_reads):
+            debut = hasard.randrange(0, len(genome) - longueur_reads + 1)
+            read = list(genome[debut:debut + longueur_reads])
+            for position in range(longueur_reads):
+                if hasard.random() < taux_erreur:
+                    read[position] = hasard.choice("ACGT".replace(read[position], ""))
+            fastq.write("@read_{0}\n{1}\n+\n{2}\n".format(numero, "".join(read),
+                                                         qualite))
+    return nbre_reads
+
+def measure(fonction, *arguments, memoire=True):
+    """Exécute fonction et retourne son résultat, sa durée (s) et le pic
+    de mémoire allouée pendant l'appel (octets, None sans mesure).
+    """
+    if memoire:
+        tracemalloc.start()
+    debut = time.perf_counter()
+    resultat = fonction(*arguments)
+    duree = time.perf_counter() - debut
+    pic = None
+    if memoire:
+        pic = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return resultat, duree, pic
+
+def _stage(memoire, fonction, *arguments):
+    """Mesure une étape (voir measure) pour benchmark_size."""
+    resultat, duree, pic = measure(fonction, *arguments, memoire=memoire)
+    return resultat, {"temps": duree, "memoire": pic}
+
+def benchmark_size(taille, taille_kmer=21, couverture=30, longueur_reads=100,
+                   taux_erreur=0.01, fraction_repetee=0.0, backend="networkx",
+                   memoire=True, graine=0, dossier=None):
+    """Simule un jeu de données de taille bases et mesure chaque étape
+    du pipeline. Retourne un dictionnaire décrivant le jeu de données
+    et, pour chaque étape, sa durée et son pic de mémoire.
+    """
+    genome = simulate_genome(taille, graine, fraction_repetee)
+    with tempfile.TemporaryDirectory(dir=dossier) as temporaire:
+        fastq = os.path.join(temporaire, "reads.fq")
+        nbre_reads = simulate_reads(genome, fastq, couverture, longueur_reads,
+                                    taux_erreur, graine)
+        etapes = {}
+        kmers, etapes["build_kmer_dict"] = _stage(memoire,
+            debruijn.build_kmer_dict, fastq, taille_kmer)
+    graph, etapes["build_graph"] = _stage(memoire, debruijn.build_graph,
+                                          kmers, False, backend)
+    #Nettoyage complet, comme dans main ; la durée de chacune de ses
+    #étapes est conservée dans "details".
+    mesures = debruijn.StageMetrics()
+    graph, etapes["clean_graph"] = _stage(memoire,
+        lambda graph: debruijn.clean_graph(graph, 2 * taille_kmer,
+                                           mesures=mesures), graph)
+    etapes["clean_graph"]["details"] = {mesure["etape"]: mesure["temps"]
+                                        for mesure in mesures.etapes}
+    contigs, etapes["iter_contigs"] = _stage(memoire,
+        lambda graph: list(debruijn.iter_contigs(graph)), graph)
+    return {"taille_genome": taille, "nbre_reads": nbre_reads,
+            "nbre_kmers": len(kmers), "nbre_contigs": len(contigs),
+            "etapes": etapes}
+
+def scaling_slopes(resultats):
+    """Pente, pour chaque étape, de la régression du log du temps sur
+    le log de la taille du génome (1 : linéaire, 2 : quadratique).
+    """
+    pentes = {}
+    for etape in ETAPES_BENCHMARK:
+        points = [(math.log(resultat["taille_genome"]),
+                   math.log(max(resultat["etapes"][etape]["temps"], 1e-9)))
+                  for resultat in resultats]
+        if len(points) < 2:
+            continue
+        moyenne_x = sum(x for x, _ in points) / len(points)
+        moyenne_y = sum(y for _, y in points) / len(points)
+        variance = sum((x - moyenne_x) ** 2 for x, _ in points)
+        pentes[etape] = sum((x - moyenne_x) * (y - moyenne_y)
+                            for x, y in points) / variance
+    return pentes
+
+def git_revision():
+    """Retourne le commit courant (None hors d'un dépôt git)."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], check=True,
+                              capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(ancien, nouveau):
+    """Retourne, pour chaque taille et chaque étape communes à deux
+    fichiers de résultats, le rapport des durées (nouveau / ancien).
+    """
+    anciens = {resultat["taille_genome"]: resultat
+               for resultat in ancien["resultats"]}
+    rapports = {}
+    for resultat in nouveau["resultats"]:
+        reference = anciens.get(resultat["taille_genome"])
+        if reference is None:
+            continue
+        rapports[resultat["taille_genome"]] = {
+            etape: mesure["temps"] / max(reference["etapes"][etape]["temps"], 1e-9)
+            for etape, mesure in resultat["etapes"].items()
+            if etape in reference["etapes"]}
+    return rapports
+
+#Définition de la fonction Main
+def main():
+    """Lance le benchmark sur une série de tailles de génome."""
+    parser = argparse.ArgumentParser(prog='benchmark.py',
+    description="Mesure le temps et la mémoire de chaque étape de l'assembleur.")
+    parser.add_argument('--sizes', type=str, default=TAILLES_DEFAUT,
+    help='tailles de génome séparées par des virgules '
+    '(optionnel - par defaut : {})'.format(TAILLES_DEFAUT))
+    parser.add_argument('--k', type=int, default=21,
+    help='taille des kmer (optionnel - par defaut : 21)')
+    parser.add_argument('--coverage', type=int, default=30,
+    help='couverture des reads (optionnel - par defaut : 30)')
+    parser.add_argument('--read-length', type=int, default=100,
+    help='longueur des reads (optionnel - par defaut : 100)')
+    parser.add_argument('--error-rate', type=float, default=0.01,
+    help='taux de substitution (optionnel - par defaut : 0.01)')
+    parser.add_argument('--repeats', type=float, default=0.0,
+    help='fraction du génome faite de répétitions (optionnel - par defaut : 0)')
+    parser.add_argument('--graph-backend', choices=['networkx', 'array'],
+    default='networkx', help='représentation du graph '
+    '(optionnel - par defaut : networkx)')
+    parser.add_argument('--no-memory', action='store_true',
+    help='ne mesure pas la mémoire (tracemalloc ralentit les étapes)')
+    parser.add_argument('--seed', type=int, default=0,
+    help='graine de la simulation (optionnel - par defaut : 0)')
+    parser.add_argument('--o', type=str, default='benchmark.json',
+    help='fichier JSON des résultats (optionnel - par defaut : benchmark.json)')
+    parser.add_argument('--compare', type=str, default='',
+    help='fichier JSON d\'un benchmark précédent à comparer (optionnel)')
+    args = parser.parse_args()
+
+    resultats = []
+    for taille in (int(taille) for taille in args.sizes.split(',')):
+        resultat = benchmark_size(taille, args.k, args.coverage,
+                                  args.read_length, args.error_rate,
+                                  args.repeats, args.graph_backend,
+                                  not args.no_memory, args.seed)
+        resultats.append(resultat)
+        print("Génome de {} pb :".format(taille))
+        for etape, mesure in resultat["etapes"].items():
+            print("  {:<18} {:>9.3f} s".format(etape, mesure["temps"]))
+    rapport = {"revision": git_revision(),
+               "parametres": {"k": args.k, "couverture": args.coverage,
+                              "longueur_reads": args.read_length,
+                              "taux_erreur": args.error_rate,
+                              "repetitions": args.repeats,
+                              "backend": args.graph_backend,
+                              "graine": args.seed},
+               "resultats": resultats,
+               "pentes": scaling_slopes(resultats)}
+    with open(args.o, "w") as sortie:
+        json.dump(rapport, sortie, indent=2)
+    for etape, pente in rapport["pentes"].items():
+        if pente > PENTE_MAX:
+            print("Étape super-linéaire : {} (pente {:.2f})".format(etape, pente))
+    if args.compare:
+        with open(args.compare) as fichier:
+            ancien = json.load(fichier)
+        for taille, rapports in compare_results(ancien, rapport).items():
+            for etape, rapport_temps in rapports.items():
+                print("{} pb, {} : x{:.2f}".format(taille, etape, rapport_temps))
+
+#Si fichier lancé on execute la boucle main.
+if __name__ == "__main__":
+    main()
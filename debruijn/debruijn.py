@@ -7,74 +7,2665 @@ Ce fichier comporte la globalité des fonctions définies.
 
 ### Import des modules
 import argparse
+import cProfile
+import gc
+import glob
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import multiprocessing
 import os
+import queue
+import re
 import statistics
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
 import random
+from collections.abc import Mapping
+from contextlib import contextmanager, nullcontext
+from itertools import chain
+from numpy.lib.stride_tricks import sliding_window_view
 #import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
+#Mesure du pic de mémoire (RSS) du processus, absente hors Unix.
+try:
+    import resource
+except ImportError:
+    resource = None
+
+### Constantes
+#Journal de l'assembleur : les messages de debug (listes de bulles,
+#chemins...) ne sont formatés que si le niveau DEBUG est actif.
+LOGGER = logging.getLogger("debruijn")
+#Codage 2 bits des nucléotides (255 correspond à une base ambiguë, ex: N).
+NUCLEOTIDES = "ACGT"
+CODE_NUCLEOTIDES = np.full(256, 255, dtype=np.uint8)
+for _code, _base in enumerate(NUCLEOTIDES):
+    CODE_NUCLEOTIDES[ord(_base)] = _code
+    CODE_NUCLEOTIDES[ord(_base.lower())] = _code
+#Au-delà de 32 nucléotides un k-mer ne tient plus dans un uint64, on
+#utilise alors des entiers Python (taille arbitraire).
+TAILLE_KMER_MAX_UINT64 = 32
+#Taille (en octets) des blocs lus dans le fastq et nombre de k-mers
+#accumulés avant de fusionner les comptes.
+TAILLE_BLOC_LECTURE = 2 ** 19
+TAILLE_TAMPON_KMERS = 2 ** 19
+#Décodage par lots (voir decode_kmers) : lettre de chaque code 2 bits et
+#nombre de k-mers décodés à la fois.
+LETTRES_NUCLEOTIDES = np.frombuffer(NUCLEOTIDES.encode("ascii"), dtype=np.uint8)
+TAILLE_LOT_DECODAGE = 2 ** 16
+COMPLEMENT = str.maketrans("ACGTacgtNn", "TGCAtgcaNn")
+#Nombre maximum de noeuds explorés pour délimiter une bulle et nombre
+#maximum de chemins comparés pour la résoudre.
+TAILLE_MAX_BULLE = 1000
+#Nombre de fonctions de hachage et nombre minimal de bits du filtre de
+#Bloom utilisé pour écarter les k-mers vus une seule fois.
+NBRE_HACHAGES_BLOOM = 3
+TAILLE_MIN_BLOOM = 2 ** 20
+MAX_CHEMINS_BULLE = 64
+#Graine du tirage départageant des chemins de même poids et longueur.
+GRAINE_HASARD = 9001
+#Taille des k-mers indexant la référence lors de l'évaluation des
+#contigs, et décalage (en bases) au-delà duquel deux blocs alignés
+#d'un même contig sont considérés comme mal assemblés.
+TAILLE_KMER_EVALUATION = 21
+ECART_MAX_BLOC = 1000
+#Format binaire des tables de k-mers (voir save_kmer_counts) : signature
+#puis k, mode canonique, nombre de k-mers, taille du spectre, seuil
+#d'abondance appliqué et empreinte du fastq.
+SIGNATURE_BASE_KMERS = b"DBKMERS1"
+ENTETE_BASE_KMERS = struct.Struct("<IBxxxQQQ32s")
+#Étapes du pipeline après lesquelles le graph peut être sauvegardé puis
+#repris (voir save_graph et l'option --resume-from).
+ETAPES = ("graph", "bubbles", "tips", "final")
+#Noms des fichiers d'une paire de reads : même nom à l'exception du
+#numéro de lecture (1 ou 2, éventuellement précédé de R) encadré par
+#des séparateurs, ex: lane1_R1_001.fastq.gz et lane1_R2_001.fastq.gz.
+MOTIF_PAIRE = re.compile(r"^(.*[._-]R?)([12])([._-].*)$")
+#Nombre de lots lus d'avance, par fichier, lors d'une lecture parallèle
+#de plusieurs fastq (voir read_fastq_files_batches).
+NBRE_LOTS_AVANCE = 2
+#Comptage hors mémoire (voir count_kmers_out_of_core) : taille des
+#minimiseurs répartissant les super-k-mers entre les partitions,
+#mémoire (octets) estimée par k-mer lors du comptage d'une partition,
+#volume (octets) de super-k-mers accumulés avant une écriture groupée et
+#nombre de k-mers lus à la fois dans chaque partition lors de la fusion.
+TAILLE_MINIMISEUR = 11
+OCTETS_PAR_KMER = 24
+TAILLE_TAMPON_PARTITIONS = 2 ** 24
+TAILLE_BLOC_FUSION = 2 ** 18
+#Suffixes acceptés par --max-memory.
+UNITES_MEMOIRE = {"": 1, "K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30, "T": 2 ** 40}
+#Écriture des contigs (voir save_contigs) : volume (octets) accumulé
+#avant chaque écriture, nombre de lignes à partir duquel un contig est
+#découpé avec numpy, taille maximale des blocs BGZF avant compression
+#et niveau de compression gzip.
+TAILLE_TAMPON_ECRITURE = 2 ** 20
+LIGNES_MIN_DECOUPAGE = 16
+TAILLE_BLOC_BGZF = 65280
+NIVEAU_COMPRESSION = 6
+#Noeuds d'un ArrayGraph (voir node_key) : nombre de bases codées dans la
+#clé de chaque noeud, chiffre en base 4 de chaque nucléotide et nombre
+#de noeuds gardés dans le cache des dernières recherches.
+BASES_CLE_NOEUD = 31
+CHIFFRES_NUCLEOTIDES = str.maketrans(NUCLEOTIDES, "0123")
+TAILLE_CACHE_NOEUDS = 2 ** 16
 
 ### Liste des fonctions.
+def open_fastq(fichier_fastq):
+    """Ouvre un fichier fastq en mode binaire, compressé (gzip) ou non.
+
+    La compression est détectée à partir des premiers octets.
+    """
+    with open(fichier_fastq, "rb") as fastq:
+        entete = fastq.read(2)
+    if entete == b"\x1f\x8b":
+        return gzip.open(fichier_fastq, "rb")
+    return open(fichier_fastq, "rb")
+
+def read_fastq_batches(fichier_fastq, taille_bloc=TAILLE_BLOC_LECTURE,\
+                       debut=0, fin=None):
+    """Lit un fichier fastq par gros blocs et génère, pour chaque bloc,
+    la liste des séquences (bytes) des enregistrements complets.
+
+    Un enregistrement compte exactement quatre lignes (entête,
+    séquence, "+", qualités) : les lignes de qualité commençant par
+    "@" ou "+" ne perturbent donc pas la lecture.
+    debut et fin (octets) permettent de ne lire qu'une partie d'un
+    fichier non compressé ; debut doit être un début d'enregistrement.
+    """
+    reste = b""
+    with open_fastq(fichier_fastq) as fastq:
+        if debut:
+            fastq.seek(debut)
+        position = debut
+        while True:
+            if fin is not None:
+                taille_bloc = min(taille_bloc, fin - position)
+            bloc = fastq.read(taille_bloc)
+            if not bloc:
+                break
+            position += len(bloc)
+            lignes = (reste + bloc).split(b"\n")
+            #La dernière ligne est peut-être incomplète : on ne garde que
+            #des enregistrements entiers et on reporte le reste.
+            nbre_lignes = (len(lignes) - 1) // 4 * 4
+            reste = b"\n".join(lignes[nbre_lignes:])
+            if nbre_lignes:
+                if not lignes[0].startswith(b"@"):
+                    raise ValueError("{} n'est pas un fichier fastq valide"\
+                                     .format(fichier_fastq))
+                yield [ligne.rstrip(b"\r") for ligne in lignes[1:nbre_lignes:4]]
+    lignes = reste.rstrip(b"\r\n").split(b"\n")
+    if len(lignes) >= 2:
+        yield [ligne.rstrip(b"\r") for ligne in lignes[1::4]]
+
 def read_fastq(fichier_fastq):
     """Cette fonction a pour but de récupérer les reads contenus
-    dans un fichier Fastq.
-    """
-    lire = False
-    with open(fichier_fastq, "r") as fastq:
-        for ligne in fastq:
-            if ligne.startswith("@"):
-                lire = True
-            elif ligne.startswith("+"):
-                lire = False
+    dans un fichier Fastq (ou dans plusieurs, lus l'un après l'autre :
+    voir fastq_files).
+    """
+    for fichier in fastq_files(fichier_fastq):
+        for lot in read_fastq_batches(fichier):
+            for sequence in lot:
+                yield sequence.decode("ascii")
+
+def fastq_files(fichiers_fastq):
+    """Retourne la liste des fichiers fastq désignés par un nom, un
+    motif (glob, ex: "lane*_R?.fq.gz") ou une liste de noms et de
+    motifs. Les fichiers d'un même motif sont triés par nom.
+    """
+    if isinstance(fichiers_fastq, (str, os.PathLike)):
+        fichiers_fastq = [fichiers_fastq]
+    fichiers = []
+    for motif in map(os.fspath, fichiers_fastq):
+        if not glob.has_magic(motif):
+            fichiers.append(motif)
+            continue
+        correspondances = sorted(glob.glob(motif))
+        if not correspondances:
+            raise FileNotFoundError("Aucun fichier ne correspond à {}"\
+                                    .format(motif))
+        fichiers.extend(correspondances)
+    return fichiers
+
+def pair_fastq_files(fichiers_fastq):
+    """Regroupe les fichiers fastq par paires R1/R2 d'après leurs noms
+    (voir MOTIF_PAIRE). Retourne une liste de tuples (R1, R2), ou
+    (fichier,) pour un fichier single end, dans l'ordre des fichiers.
+
+    Les paires ainsi formées identifient les mates des lots lus par
+    read_fastq_files_batches.
+    """
+    fichiers = fastq_files(fichiers_fastq)
+    lectures = {}
+    for fichier in fichiers:
+        correspondance = MOTIF_PAIRE.match(os.path.basename(fichier))
+        if correspondance:
+            cle = (os.path.dirname(fichier), correspondance.group(1),\
+                   correspondance.group(3))
+            lectures.setdefault(cle, {})[correspondance.group(2)] = fichier
+    groupes = []
+    vus = set()
+    for fichier in fichiers:
+        correspondance = MOTIF_PAIRE.match(os.path.basename(fichier))
+        paire = None
+        if correspondance:
+            paire = lectures[(os.path.dirname(fichier), correspondance.group(1),\
+                              correspondance.group(3))]
+        if paire is not None and len(paire) == 2:
+            if paire["1"] not in vus:
+                groupes.append((paire["1"], paire["2"]))
+                vus.add(paire["1"])
+        else:
+            groupes.append((fichier,))
+    return groupes
+
+def read_fastq_pairs(fichier_r1, fichier_r2):
+    """Génère les paires de reads (read 1, read 2) de deux fichiers
+    fastq appariés, lus en parallèle.
+    """
+    lecteurs = (read_fastq(fichier_r1), read_fastq(fichier_r2))
+    sentinelle = object()
+    while True:
+        read_1, read_2 = (next(lecteur, sentinelle) for lecteur in lecteurs)
+        if read_1 is sentinelle and read_2 is sentinelle:
+            return
+        if read_1 is sentinelle or read_2 is sentinelle:
+            raise ValueError("{} et {} n'ont pas le même nombre de reads"\
+                             .format(fichier_r1, fichier_r2))
+        yield read_1, read_2
+
+def read_fastq_files_batches(fichiers_fastq, taille_bloc=TAILLE_BLOC_LECTURE):
+    """Lit plusieurs fichiers fastq en même temps et génère leurs lots
+    de séquences (voir read_fastq_batches) dans l'ordre où ils sont
+    prêts.
+
+    Chaque lot est accompagné de l'appariement de ses reads, sous la
+    forme (lot, paire, mate, premier) : paire est le numéro du groupe
+    de fichiers (voir pair_fastq_files), mate vaut 1 ou 2 pour un
+    fichier R1 ou R2 et 0 pour un fichier single end, et premier est
+    le rang dans son fichier du premier read du lot. Le read de rang n
+    du fichier R1 d'une paire a donc pour mate celui de rang n du
+    fichier R2, quel que soit l'ordre d'arrivée des lots.
+
+    Chaque fichier est lu, décompressé et découpé par un thread : la
+    décompression (zlib) et la lecture libèrent le GIL, le débit est
+    donc limité par le disque et la décompression plutôt que par une
+    seule boucle de lecture. Au plus NBRE_LOTS_AVANCE lots par fichier
+    attendent d'être consommés.
+    """
+    fichiers = [(fichier, paire, mate if len(groupe) == 2 else 0)\
+                for paire, groupe in enumerate(pair_fastq_files(fichiers_fastq))\
+                for mate, fichier in enumerate(groupe, 1)]
+    if len(fichiers) == 1:
+        premier = 0
+        for lot in read_fastq_batches(fichiers[0][0], taille_bloc):
+            yield lot, 0, 0, premier
+            premier += len(lot)
+        return
+    lots = queue.Queue(NBRE_LOTS_AVANCE * len(fichiers))
+    arret = threading.Event()
+
+    def lire(fichier, paire, mate):
+        """Lit un fichier dans un thread et transmet ses lots."""
+        try:
+            premier = 0
+            for lot in read_fastq_batches(fichier, taille_bloc):
+                if arret.is_set():
+                    break
+                lots.put((lot, paire, mate, premier))
+                premier += len(lot)
+        except Exception as erreur:
+            lots.put(erreur)
+        finally:
+            lots.put(None)
+
+    lecteurs = [threading.Thread(target=lire, args=parametres, daemon=True)\
+                for parametres in fichiers]
+    for lecteur in lecteurs:
+        lecteur.start()
+    try:
+        nbre_actifs = len(lecteurs)
+        while nbre_actifs:
+            lot = lots.get()
+            if lot is None:
+                nbre_actifs -= 1
+            elif isinstance(lot, Exception):
+                raise lot
             else:
-                if lire:
-                    yield ligne[:-1]
+                yield lot
+    finally:
+        #Si la lecture est interrompue, on vide la file pour débloquer
+        #les threads encore actifs.
+        arret.set()
+        while any(lecteur.is_alive() for lecteur in lecteurs):
+            try:
+                lots.get(timeout=0.1)
+            except queue.Empty:
+                pass
 
-def cut_kmer(sequence, taille_kmer):
+def _next_record_start(fastq, position):
+    """Retourne la position du premier enregistrement fastq commençant
+    à partir de l'octet position.
+
+    Une ligne commençant par "@" peut être une ligne de qualité : on
+    vérifie donc que la ligne située deux lignes plus loin commence
+    par "+".
+    """
+    if position == 0:
+        return 0
+    fastq.seek(position - 1)
+    #Si l'octet précédent n'est pas un retour à la ligne, on est au
+    #milieu d'une ligne : on se place au début de la suivante.
+    if fastq.read(1) != b"\n":
+        fastq.readline()
+    positions = []
+    lignes = []
+    for _ in range(6):
+        positions.append(fastq.tell())
+        ligne = fastq.readline()
+        if not ligne:
+            break
+        lignes.append(ligne)
+    for indice in range(min(4, len(lignes))):
+        if lignes[indice].startswith(b"@") and (indice + 2 >= len(lignes)\
+        or lignes[indice + 2].startswith(b"+")):
+            return positions[indice]
+    return positions[-1]
+
+def fastq_chunk_bounds(fichier_fastq, nbre_morceaux):
+    """Découpe un fichier fastq non compressé en nbre_morceaux plages
+    d'octets (debut, fin) alignées sur des débuts d'enregistrement.
+    """
+    taille = os.path.getsize(fichier_fastq)
+    with open(fichier_fastq, "rb") as fastq:
+        bornes = [_next_record_start(fastq, taille * indice // nbre_morceaux)\
+                  for indice in range(nbre_morceaux)]
+    bornes.append(taille)
+    return [(bornes[i], bornes[i + 1]) for i in range(nbre_morceaux)\
+            if bornes[i] < bornes[i + 1]]
+
+def reverse_complement(sequence):
+    """Retourne le reverse complément d'une séquence."""
+    return sequence.translate(COMPLEMENT)[::-1]
+
+def canonical_kmer(kmer):
+    """Retourne la forme canonique d'un k-mer : le plus petit (ordre
+    lexicographique) entre le k-mer et son reverse complément.
+    """
+    return min(kmer, reverse_complement(kmer))
+
+def cut_kmer(sequence, taille_kmer, canonique=False):
     """Cette fonction va permettre d'obtenir des k-mers de taille désirée à
     partir d'un read renseigné.
+
+    En mode canonique chaque k-mer est renvoyé sous sa forme canonique.
     """
     for indice in range(len(sequence[:-taille_kmer+1])):
-        yield sequence[indice:indice+taille_kmer]
+        if canonique:
+            yield canonical_kmer(sequence[indice:indice+taille_kmer])
+        else:
+            yield sequence[indice:indice+taille_kmer]
+
+def kmer_dtype(taille_kmer):
+    """Retourne le type numpy utilisé pour stocker des k-mers codés
+    sur 2 bits : uint64 jusqu'à k = 32, entiers Python au-delà.
+    """
+    if taille_kmer <= TAILLE_KMER_MAX_UINT64:
+        return np.uint64
+    return object
+
+def encode_kmer(kmer):
+    """Code un k-mer en entier (2 bits par nucléotide, A=0 C=1 G=2 T=3).
+
+    Une ValueError est levée si le k-mer contient une base ambiguë.
+    """
+    code = 0
+    for base in kmer:
+        valeur = CODE_NUCLEOTIDES[ord(base)] if ord(base) < 256 else 255
+        if valeur == 255:
+            raise ValueError("base non codable : {}".format(base))
+        code = (code << 2) | int(valeur)
+    return code
+
+def decode_kmer(code, taille_kmer):
+    """Retrouve la séquence d'un k-mer à partir de son code 2 bits."""
+    code = int(code)
+    bases = []
+    for _ in range(taille_kmer):
+        bases.append(NUCLEOTIDES[code & 3])
+        code >>= 2
+    return "".join(reversed(bases))
+
+def decode_kmers(codes, taille_kmer):
+    """Retrouve les séquences d'un tableau de codes 2 bits.
+
+    Pour des uint64, les bases de tous les codes sont extraites d'un
+    coup (un décalage par position) puis traduites par une table ; la
+    chaîne obtenue est découpée en k-mers.
+    """
+    if codes.dtype == object:
+        return [decode_kmer(code, taille_kmer) for code in codes]
+    texte = kmer_letters(codes, taille_kmer).tobytes().decode("ascii")
+    return [texte[debut:debut + taille_kmer]\
+            for debut in range(0, len(texte), taille_kmer)]
+
+def kmer_letters(codes, taille_kmer):
+    """Retourne les lettres (codes ASCII, une ligne par k-mer) d'un
+    tableau de codes 2 bits uint64.
+    """
+    bases = np.empty((len(codes), taille_kmer), dtype=np.uint8)
+    for position in range(taille_kmer):
+        bases[:, position] = (codes >> np.uint64(2 * (taille_kmer - 1\
+                              - position))) & np.uint64(3)
+    return LETTRES_NUCLEOTIDES[bases]
+
+def cut_kmer_code(sequence, taille_kmer):
+    """Équivalent de cut_kmer renvoyant directement les codes 2 bits.
+
+    Le code est calculé par hachage glissant : chaque nouvelle base
+    décale le code précédent. Les k-mers contenant une base ambiguë
+    sont ignorés.
+    """
+    masque = (1 << (2 * taille_kmer)) - 1
+    code = 0
+    valides = 0
+    for base in sequence:
+        valeur = CODE_NUCLEOTIDES[ord(base)] if ord(base) < 256 else 255
+        if valeur == 255:
+            valides = 0
+            continue
+        code = ((code << 2) | int(valeur)) & masque
+        valides += 1
+        if valides >= taille_kmer:
+            yield code
+
+def reverse_complement_codes(codes, taille_kmer):
+    """Calcule les codes 2 bits des reverse compléments d'un tableau
+    de codes.
+
+    Pour des uint64 le complément est un non binaire, puis l'ordre
+    des groupes de 2 bits est inversé par échanges successifs.
+    """
+    if codes.dtype == object:
+        return np.array([encode_kmer(reverse_complement(\
+            decode_kmer(code, taille_kmer))) for code in codes], dtype=object)
+    codes = ~codes
+    for decalage, masque in ((2, 0x3333333333333333),
+                             (4, 0x0F0F0F0F0F0F0F0F),
+                             (8, 0x00FF00FF00FF00FF),
+                             (16, 0x0000FFFF0000FFFF),
+                             (32, 0x00000000FFFFFFFF)):
+        decalage = np.uint64(decalage)
+        masque = np.uint64(masque)
+        codes = ((codes >> decalage) & masque) | ((codes & masque) << decalage)
+    return codes >> np.uint64(64 - 2 * taille_kmer)
+
+def window_codes(bloc, taille_kmer):
+    """Calcule le code 2 bits (k <= 32) de chaque fenêtre de taille_kmer
+    bases d'une séquence (bytes). Retourne les codes de toutes les
+    positions et le masque des fenêtres valides (sans base ambiguë).
+    """
+    bases = CODE_NUCLEOTIDES[np.frombuffer(bloc, dtype=np.uint8)]
+    nbre_kmers = len(bases) - taille_kmer + 1
+    if nbre_kmers <= 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=bool)
+    #Une fenêtre est valide si elle ne contient aucune base ambiguë.
+    cumul = np.zeros(len(bases) + 1, dtype=np.int32)
+    np.cumsum(bases == 255, out=cumul[1:])
+    valides = cumul[taille_kmer:] == cumul[:-taille_kmer]
+    del cumul
+    bases &= 3
+    codes = np.zeros(nbre_kmers, dtype=np.uint64)
+    for decalage in range(taille_kmer):
+        codes <<= np.uint64(2)
+        codes |= bases[decalage:decalage + nbre_kmers]
+    return codes, valides
+
+def encode_sequences(sequences, taille_kmer, canonique=False):
+    """Calcule les codes 2 bits de tous les k-mers d'un lot de reads.
+
+    Les reads (str ou bytes) sont concaténés (séparés par un caractère
+    non codable) et les codes sont calculés pour toutes les positions
+    à la fois. Les fenêtres chevauchant deux reads ou une base ambiguë
+    sont écartées.
+    """
+    if sequences and isinstance(sequences[0], bytes):
+        bloc = b"\n".join(sequences)
+    else:
+        bloc = "\n".join(sequences).encode("ascii", "replace")
+    if taille_kmer > TAILLE_KMER_MAX_UINT64:
+        codes = []
+        for sequence in bloc.decode("ascii").split("\n"):
+            directs = list(cut_kmer_code(sequence, taille_kmer))
+            if canonique:
+                #Le i-ème k-mer du read correspond au i-ème k-mer en
+                #partant de la fin de son reverse complément.
+                inverses = list(cut_kmer_code(reverse_complement(sequence),\
+                                              taille_kmer))
+                directs = [min(direct, inverse) for direct, inverse\
+                           in zip(directs, reversed(inverses))]
+            codes.extend(directs)
+        return np.array(codes, dtype=object)
+    codes, valides = window_codes(bloc, taille_kmer)
+    codes = codes[valides]
+    if canonique:
+        codes = np.minimum(codes, reverse_complement_codes(codes, taille_kmer))
+    return codes
+
+def merge_counts(codes, comptes):
+    """Regroupe les codes identiques en sommant leurs comptes.
+
+    Retourne les codes triés (uniques) et les comptes associés.
+    """
+    if len(codes) == 0:
+        return codes, comptes
+    ordre = np.argsort(codes, kind="stable")
+    codes = codes[ordre]
+    comptes = comptes[ordre]
+    debuts = np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1])))
+    return codes[debuts], np.add.reduceat(comptes, debuts)
+
+def merge_sorted_counts(codes, comptes, autres_codes, autres_comptes):
+    """Fusionne deux tables triées de codes uniques (voir merge_counts)
+    sans les retrier : les codes absents de la première y sont insérés
+    à leur place, les comptes des codes communs sont additionnés.
+    """
+    positions = np.searchsorted(codes, autres_codes)
+    presents = positions < len(codes)
+    presents[presents] = codes[positions[presents]] == autres_codes[presents]
+    nouveaux = ~presents
+    insertions = positions[nouveaux]
+    #Après insertion, un code de la première table est décalé du nombre
+    #de codes insérés avant lui.
+    communs = positions[presents]
+    communs = communs + np.searchsorted(insertions, communs, side="right")
+    codes = np.insert(codes, insertions, autres_codes[nouveaux])
+    comptes = np.insert(comptes, insertions, autres_comptes[nouveaux])
+    comptes[communs] += autres_comptes[presents].astype(comptes.dtype)
+    return codes, comptes
+
+class KmerCounts(Mapping):
+    """Table d'occurrences des k-mers, stockée sous forme de deux
+    tableaux numpy : les codes 2 bits triés et leurs comptes.
 
-def build_kmer_dict(fichier_fastq, taille_kmer):
+    Elle se comporte comme un dictionnaire en lecture seule dont les
+    clés sont les k-mers (chaînes) afin de rester compatible avec
+    build_graph. En mode canonique, seules les formes canoniques sont
+    stockées mais un k-mer peut être interrogé dans les deux sens.
+
+    histogramme conserve le spectre des abondances calculé lors du
+    comptage (avant tout filtrage des k-mers rares) et comptes_min le
+    seuil d'abondance déjà appliqué à la table.
+    """
+
+    def __init__(self, codes, comptes, taille_kmer, canonique=False,\
+                 histogramme=None, comptes_min=1):
+        self.codes = codes
+        self.comptes = comptes
+        self.taille_kmer = taille_kmer
+        self.canonique = canonique
+        self.histogramme = histogramme
+        self.comptes_min = comptes_min
+
+    def _position(self, kmer):
+        """Retourne l'indice du k-mer dans la table (KeyError sinon)."""
+        if not isinstance(kmer, str) or len(kmer) != self.taille_kmer:
+            raise KeyError(kmer)
+        if self.canonique:
+            kmer = canonical_kmer(kmer)
+        try:
+            code = encode_kmer(kmer)
+        except ValueError:
+            raise KeyError(kmer) from None
+        if self.codes.dtype != object:
+            code = np.uint64(code)
+        indice = int(np.searchsorted(self.codes, code))
+        if indice < len(self.codes) and self.codes[indice] == code:
+            return indice
+        raise KeyError(kmer)
+
+    def __getitem__(self, kmer):
+        return int(self.comptes[self._position(kmer)])
+
+    def __iter__(self):
+        for debut in range(0, len(self.codes), TAILLE_LOT_DECODAGE):
+            yield from decode_kmers(self.codes[debut:debut\
+                                    + TAILLE_LOT_DECODAGE], self.taille_kmer)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def items(self):
+        for debut in range(0, len(self.codes), TAILLE_LOT_DECODAGE):
+            fin = debut + TAILLE_LOT_DECODAGE
+            yield from zip(decode_kmers(self.codes[debut:fin], self.taille_kmer),\
+                           self.comptes[debut:fin].tolist())
+
+    def filtered(self, comptes_min):
+        """Retourne une table ne gardant que les k-mers vus au moins
+        comptes_min fois.
+        """
+        garder = self.comptes >= comptes_min
+        return KmerCounts(self.codes[garder], self.comptes[garder],\
+                          self.taille_kmer, self.canonique,\
+                          self.histogram(), max(comptes_min, self.comptes_min))
+
+    def histogram(self):
+        """Retourne le spectre des abondances (voir kmer_histogram)."""
+        if self.histogramme is None:
+            self.histogramme = kmer_histogram(self.comptes)
+        return self.histogramme
+
+def _mix64(valeurs):
+    """Mélange les bits d'entiers 64 bits (finaliseur de splitmix64)."""
+    valeurs = valeurs ^ (valeurs >> np.uint64(30))
+    valeurs = valeurs * np.uint64(0xBF58476D1CE4E5B9)
+    valeurs = valeurs ^ (valeurs >> np.uint64(27))
+    valeurs = valeurs * np.uint64(0x94D049BB133111EB)
+    return valeurs ^ (valeurs >> np.uint64(31))
+
+def hash_codes(codes):
+    """Retourne un hachage 64 bits de codes de k-mers (uint64 ou
+    entiers Python pour k > 32).
+    """
+    if codes.dtype == object:
+        masque = (1 << 64) - 1
+        codes = np.fromiter(((code ^ (code >> 64)) & masque for code in codes),\
+                            dtype=np.uint64, count=len(codes))
+    return _mix64(codes.astype(np.uint64))
+
+class BloomFilter:
+    """Filtre de Bloom sur des codes de k-mers, stocké dans un tableau
+    de bits numpy.
+
+    Les nbre_hachages positions d'un code sont dérivées de deux
+    hachages (h1 + i * h2, Kirsch et Mitzenmacher).
+    """
+
+    def __init__(self, nbre_bits, nbre_hachages=NBRE_HACHAGES_BLOOM):
+        #Le nombre de bits est arrondi à une puissance de 2.
+        self.puissance = max(6, int(nbre_bits - 1).bit_length())
+        self.nbre_hachages = nbre_hachages
+        self.bits = np.zeros(2 ** self.puissance // 8, dtype=np.uint8)
+
+    def _positions(self, codes):
+        premier = hash_codes(codes)
+        second = _mix64(premier ^ np.uint64(0x9E3779B97F4A7C15)) | np.uint64(1)
+        decalage = np.uint64(64 - self.puissance)
+        return [(premier + np.uint64(i) * second) >> decalage\
+                for i in range(self.nbre_hachages)]
+
+    def add(self, codes):
+        """Ajoute des codes au filtre."""
+        for positions in self._positions(codes):
+            np.bitwise_or.at(self.bits, positions >> np.uint64(3),\
+                             (1 << (positions & np.uint64(7))).astype(np.uint8))
+
+    def contains(self, codes):
+        """Indique, pour chaque code, s'il a (probablement) déjà été ajouté."""
+        presents = np.ones(len(codes), dtype=bool)
+        for positions in self._positions(codes):
+            octets = self.bits[positions >> np.uint64(3)]
+            presents &= ((octets >> (positions & np.uint64(7)).astype(np.uint8))\
+                         & 1).astype(bool)
+        return presents
+
+def kmer_histogram(comptes, nbre_singletons=0):
+    """Retourne le spectre des abondances : l'élément i du tableau est
+    le nombre de k-mers distincts vus i fois. nbre_singletons s'ajoute
+    aux k-mers vus une fois (k-mers restés dans le filtre de Bloom).
+    """
+    histogramme = np.bincount(np.asarray(comptes, dtype=np.int64), minlength=3)
+    histogramme[1] += nbre_singletons
+    return histogramme
+
+def _first_valley(histogramme):
+    """Retourne l'abondance du premier creux du spectre (au moins 2)."""
+    for abondance in range(1, len(histogramme) - 1):
+        if histogramme[abondance] <= histogramme[abondance + 1]:
+            return max(2, abondance)
+    return 2
+
+def abundance_threshold(comptes, nbre_singletons=0):
+    """Choisit automatiquement le nombre minimal d'occurrences d'un
+    k-mer à partir de l'histogramme des abondances : le premier creux
+    de l'histogramme sépare les k-mers issus d'erreurs de séquençage
+    des k-mers du génome. Le seuil vaut au moins 2.
+    """
+    return _first_valley(kmer_histogram(comptes, nbre_singletons))
+
+def spectrum_stats(histogramme):
+    """Déduit du spectre des abondances le seuil séparant erreurs et
+    k-mers solides, le pic et la médiane de la couverture des k-mers
+    solides et une estimation de la taille du génome (nombre de k-mers
+    solides lus divisé par la couverture au pic).
+    """
+    seuil = _first_valley(histogramme)
+    solides = np.asarray(histogramme[seuil:], dtype=np.int64)
+    if not solides.any():
+        return {"seuil_erreurs": seuil, "pic_couverture": 0,\
+                "couverture_mediane": 0, "taille_genome": 0}
+    pic = seuil + int(np.argmax(solides))
+    cumul = np.cumsum(solides)
+    mediane = seuil + int(np.searchsorted(cumul, (cumul[-1] - 1) // 2,\
+                                          side="right"))
+    abondances = np.arange(seuil, len(histogramme), dtype=np.int64)
+    taille = int(round(int((abondances * solides).sum()) / pic))
+    return {"seuil_erreurs": seuil, "pic_couverture": pic,\
+            "couverture_mediane": mediane, "taille_genome": taille}
+
+def save_histogram(histogramme, nom_fichier):
+    """Exporte le spectre des abondances au format TSV (abondance,
+    nombre de k-mers distincts), précédé des estimations de
+    spectrum_stats en commentaires.
+    """
+    with open(nom_fichier, "w") as fichier_sortie:
+        for cle, valeur in spectrum_stats(histogramme).items():
+            fichier_sortie.write("#{0}\t{1}\n".format(cle, valeur))
+        fichier_sortie.write("abondance\tnombre\n")
+        for abondance in np.flatnonzero(histogramme):
+            fichier_sortie.write("{0}\t{1}\n".format(abondance,\
+                                                     histogramme[abondance]))
+
+class KmerCounter:
+    """Compteur de k-mers alimenté par lots de reads.
+
+    Les codes des k-mers sont accumulés dans un tampon puis fusionnés
+    (tri puis regroupement) avec les comptes déjà obtenus dès que le
+    tampon dépasse taille_tampon éléments.
+
+    Si un filtre de Bloom est fourni, la première occurrence de chaque
+    k-mer ne fait que l'inscrire dans le filtre : les k-mers vus une
+    seule fois n'entrent jamais dans la table exacte. Le compte retiré
+    est rajouté dans result() ; un faux positif du filtre peut
+    surestimer un compte de 1.
+    """
+
+    def __init__(self, taille_kmer, canonique=False,\
+                 taille_tampon=TAILLE_TAMPON_KMERS, filtre=None):
+        self.taille_kmer = taille_kmer
+        self.canonique = canonique
+        self.taille_tampon = taille_tampon
+        self.filtre = filtre
+        self.nbre_inscrits = 0
+        self.codes = np.empty(0, dtype=kmer_dtype(taille_kmer))
+        self.comptes = np.empty(0, dtype=np.uint32)
+        self._tampon = []
+        self._nbre_tampon = 0
+
+    def add_sequences(self, sequences):
+        """Ajoute les k-mers d'un lot de reads."""
+        self.add_codes(encode_sequences(sequences, self.taille_kmer,\
+                                        self.canonique))
+
+    def add_codes(self, codes, comptes=None):
+        """Ajoute des codes de k-mers (avec leurs comptes éventuels)."""
+        if len(codes) == 0:
+            return
+        if comptes is None:
+            comptes = np.ones(len(codes), dtype=np.uint32)
+        if self.filtre is not None:
+            codes, comptes = merge_counts(codes, comptes)
+            nouveaux = ~self.filtre.contains(codes)
+            self.filtre.add(codes[nouveaux])
+            self.nbre_inscrits += int(np.count_nonzero(nouveaux))
+            comptes = comptes - nouveaux.astype(np.uint32)
+            codes, comptes = codes[comptes > 0], comptes[comptes > 0]
+            if len(codes) == 0:
+                return
+        self._tampon.append((codes, comptes))
+        self._nbre_tampon += len(codes)
+        if self._nbre_tampon >= self.taille_tampon:
+            self._fusionner()
+
+    def _fusionner(self):
+        """Fusionne le tampon avec les comptes existants : seul le
+        tampon est trié, puis inséré dans la table déjà triée (voir
+        merge_sorted_counts).
+        """
+        if not self._tampon:
+            return
+        codes, comptes = merge_counts(\
+            np.concatenate([lot[0] for lot in self._tampon]),\
+            np.concatenate([lot[1] for lot in self._tampon]).astype(np.uint32))
+        self._tampon = []
+        self._nbre_tampon = 0
+        self.codes, self.comptes = merge_sorted_counts(self.codes, self.comptes,\
+                                                       codes, comptes)
+
+    def result(self):
+        """Retourne la table d'occurrences (KmerCounts)."""
+        self._fusionner()
+        comptes = self.comptes
+        if self.filtre is not None:
+            comptes = comptes + np.uint32(1)
+        return KmerCounts(self.codes, comptes, self.taille_kmer,\
+                          self.canonique)
+
+    def nbre_singletons(self):
+        """Nombre (estimé) de k-mers vus une seule fois et restés dans
+        le filtre de Bloom.
+        """
+        self._fusionner()
+        return max(0, self.nbre_inscrits - len(self.codes))
+
+def fastq_size(fichier_fastq):
+    """Estime la taille (octets) du (ou des) fastq une fois
+    décompressés (un fichier gzip est compté quatre fois).
+    """
+    taille = 0
+    for fichier in fastq_files(fichier_fastq):
+        with open_fastq(fichier) as fastq:
+            taille += os.path.getsize(fichier)\
+                      * (4 if isinstance(fastq, gzip.GzipFile) else 1)
+    return taille
+
+def bloom_size(fichier_fastq):
+    """Estime le nombre de bits du filtre de Bloom à partir de la
+    taille du (ou des) fastq (environ deux bits par nucléotide lu).
+    """
+    return max(TAILLE_MIN_BLOOM, fastq_size(fichier_fastq))
+
+def shard_indices(codes, nbre_shards):
+    """Retourne la partition (entre 0 et nbre_shards - 1) de chaque code
+    de k-mer, tirée de son hachage (voir hash_codes).
+
+    Contrairement aux bits de poids fort du code, le hachage répartit
+    les k-mers uniformément, y compris en mode canonique où les codes
+    ne couvrent qu'une moitié de l'espace.
+    """
+    return (hash_codes(codes) % np.uint64(nbre_shards)).astype(np.int64)
+
+def _shard_file(prefixe, indice):
+    """Nom (sans extension) des fichiers d'une partition de comptes."""
+    return "{}.shard_{}".format(prefixe, indice)
+
+def save_shard(nom, codes, comptes):
+    """Enregistre les comptes (triés) d'une partition."""
+    np.save(nom + ".codes.npy", codes, allow_pickle=True)
+    np.save(nom + ".comptes.npy", comptes)
+
+def load_shard(nom, supprimer=True):
+    """Relit une partition écrite par save_shard, puis supprime ses
+    fichiers si supprimer est vrai.
+    """
+    codes = np.load(nom + ".codes.npy", allow_pickle=True)
+    comptes = np.load(nom + ".comptes.npy")
+    if supprimer:
+        os.remove(nom + ".codes.npy")
+        os.remove(nom + ".comptes.npy")
+    return codes, comptes
+
+def _count_chunk(parametres):
+    """Compte les k-mers d'une plage d'octets d'un fastq (processus
+    fils) et écrit les comptes découpés en nbre_shards partitions dans
+    des fichiers de préfixe prefixe (voir save_shard).
+    """
+    fichier_fastq, debut, fin, taille_kmer, canonique, nbre_shards,\
+    prefixe = parametres
+    compteur = KmerCounter(taille_kmer, canonique)
+    for lot in read_fastq_batches(fichier_fastq, debut=debut, fin=fin):
+        compteur.add_sequences(lot)
+    comptes = compteur.result()
+    #Un masque conserve l'ordre : chaque partition reste triée.
+    partitions = shard_indices(comptes.codes, nbre_shards)
+    for indice in range(nbre_shards):
+        garder = partitions == indice
+        save_shard(_shard_file(prefixe, indice), comptes.codes[garder],\
+                   comptes.comptes[garder])
+
+def _merge_shard(parametres):
+    """Fusionne une partition écrite par plusieurs processus (voir
+    _count_chunk) : ses fichiers, déjà triés, sont mis bout à bout et
+    triés une seule fois (voir merge_counts). Le résultat est écrit
+    dans le fichier de partition de prefixe ; son nom et son nombre de
+    k-mers sont renvoyés.
+    """
+    prefixes, indice, prefixe = parametres
+    morceaux = [load_shard(_shard_file(autre, indice)) for autre in prefixes]
+    codes = np.concatenate([codes for codes, _ in morceaux])
+    comptes = np.concatenate([comptes for _, comptes in morceaux])
+    codes, comptes = merge_counts(codes, comptes)
+    nom = _shard_file(prefixe, indice)
+    save_shard(nom, codes, comptes)
+    return nom, len(codes)
+
+def build_kmer_dict(fichier_fastq, taille_kmer, canonique=False, threads=1,\
+                    comptes_min=1, base=None, memoire_max=None,\
+                    dossier_temporaire=None):
     """Cette fonction va permettre de calculer les occurrences de
     chaque Kmers contenus au sein des reads issus du fastq.
+
+    Les k-mers sont codés sur 2 bits et comptés par lots (voir
+    KmerCounter) ; le résultat se manipule comme un dictionnaire.
+    En mode canonique un k-mer et son reverse complément sont comptés
+    ensemble. Le fichier n'est lu qu'une fois, par blocs : la mémoire
+    utilisée dépend du nombre de k-mers distincts, pas de la taille
+    du fastq.
+
+    fichier_fastq peut aussi désigner plusieurs fichiers (liste de
+    noms ou motifs, voir fastq_files) : ils sont lus en même temps et
+    comptés dans une table commune. Les reads de fichiers appariés
+    (R1/R2) sont simplement mis bout à bout : chaque mate est compté
+    comme un read indépendant. L'appariement accompagne chaque lot lu
+    (voir read_fastq_files_batches) mais n'est pas utilisé par le graph
+    de De Bruijn.
+
+    Avec threads > 1, chaque fichier non compressé est découpé en
+    plages et chaque fichier compressé forme une plage ; chaque plage
+    est comptée par un processus. Les comptes sont partitionnés selon
+    le hachage des k-mers et écrits sur disque (dans
+    dossier_temporaire) ; chaque partition est fusionnée par un
+    processus distinct, puis recopiée dans la table finale, triée une
+    seule fois.
+
+    comptes_min (entier, ou "auto" pour un seuil choisi à partir de
+    l'histogramme des abondances) élimine les k-mers rares, issus
+    d'erreurs de séquençage. Dès que ce seuil dépasse 1, un filtre de
+    Bloom empêche les k-mers vus une seule fois d'entrer dans la table
+    (comptage en série uniquement : en parallèle les k-mers sont
+    filtrés après comptage).
+
+    Le spectre des abondances est calculé au passage et conservé dans
+    l'attribut histogramme de la table retournée.
+
+    Si memoire_max (octets) est donné, le comptage se fait hors
+    mémoire dans dossier_temporaire (voir count_kmers_out_of_core) ;
+    avec base, la table est alors écrite directement dans ce fichier
+    puis projetée en mémoire (voir load_kmer_counts).
+
+    Si base est donné, la table est enregistrée dans ce fichier (voir
+    save_kmer_counts) ; un appel suivant sur le même fastq, avec les
+    mêmes k et mode canonique, la relit au lieu de recompter.
+    """
+    if base:
+        empreinte = file_checksum(fichier_fastq)
+        if os.path.exists(base):
+            entete = read_kmer_counts_header(base)
+            if (entete["taille_kmer"], entete["canonique"],\
+                entete["empreinte"]) == (taille_kmer, canonique, empreinte):
+                comptes = load_kmer_counts(base)
+                if comptes_min == "auto":
+                    comptes_min = _first_valley(comptes.histogram())
+                if comptes.comptes_min <= comptes_min:
+                    return comptes.filtered(comptes_min)\
+                    if comptes_min > comptes.comptes_min else comptes
+        #Hors mémoire, la table est écrite dans base au fil de la fusion.
+        if memoire_max:
+            return count_kmers_out_of_core(fichier_fastq, taille_kmer,\
+                                           canonique, threads, comptes_min,\
+                                           memoire_max, dossier_temporaire,\
+                                           base, empreinte)
+        comptes = _count_kmers(fichier_fastq, taille_kmer, canonique,\
+                               threads, comptes_min, dossier_temporaire)
+        save_kmer_counts(comptes, base, empreinte)
+        return comptes
+    if memoire_max:
+        return count_kmers_out_of_core(fichier_fastq, taille_kmer, canonique,\
+                                       threads, comptes_min, memoire_max,\
+                                       dossier_temporaire)
+    return _count_kmers(fichier_fastq, taille_kmer, canonique, threads,\
+                        comptes_min, dossier_temporaire)
+
+def _count_kmers(fichier_fastq, taille_kmer, canonique, threads, comptes_min,\
+                 dossier_temporaire=None):
+    """Compte en mémoire les k-mers du fastq (voir build_kmer_dict)."""
+    morceaux = []
+    if threads > 1:
+        for fichier in fastq_files(fichier_fastq):
+            with open_fastq(fichier) as fastq:
+                compresse = isinstance(fastq, gzip.GzipFile)
+            #Un fichier compressé ne se découpe pas : il est lu en
+            #entier par un même processus.
+            morceaux.extend([(fichier, 0, None)] if compresse else\
+                            [(fichier, debut, fin) for debut, fin\
+                             in fastq_chunk_bounds(fichier, 2 * threads)])
+    if len(morceaux) < 2:
+        return build_kmer_dicts(fichier_fastq, [taille_kmer], canonique,\
+                                comptes_min)[0]
+    nbre_shards = 4 * threads
+    with tempfile.TemporaryDirectory(dir=dossier_temporaire) as temporaire,\
+    multiprocessing.Pool(threads) as pool:
+        prefixes = [os.path.join(temporaire, "morceau_{}".format(numero))\
+                    for numero in range(len(morceaux))]
+        pool.map(_count_chunk, [(fichier, debut, fin, taille_kmer, canonique,\
+                                 nbre_shards, prefixe) for (fichier, debut,\
+                                 fin), prefixe in zip(morceaux, prefixes)])
+        partitions = pool.map(_merge_shard, [(prefixes, indice,\
+                              os.path.join(temporaire, "table"))\
+                              for indice in range(nbre_shards)])
+        #Les partitions sont disjointes : elles sont recopiées une à une
+        #dans la table finale, allouée d'avance, puis la table est triée
+        #une seule fois. Le tri stable (timsort) fusionne directement les
+        #séquences déjà triées que forment les partitions.
+        nbre_kmers = sum(taille for _, taille in partitions)
+        codes = np.empty(nbre_kmers, dtype=kmer_dtype(taille_kmer))
+        comptes = np.empty(nbre_kmers, dtype=np.uint32)
+        debut = 0
+        for nom, taille in partitions:
+            codes[debut:debut + taille], comptes[debut:debut + taille] =\
+            load_shard(nom)
+            debut += taille
+        ordre = np.argsort(codes, kind="stable")
+        codes = codes[ordre]
+        comptes = comptes[ordre]
+    comptes = KmerCounts(codes, comptes, taille_kmer, canonique)
+    if comptes_min == "auto":
+        comptes_min = _first_valley(comptes.histogram())
+    return comptes.filtered(comptes_min) if comptes_min > 1 else comptes
+
+def build_kmer_dicts(fichier_fastq, liste_k, canonique=False, comptes_min=1):
+    """Compte les k-mers du fastq pour plusieurs tailles de k en une
+    seule lecture du fichier : chaque lot de reads alimente un
+    KmerCounter par valeur de k. Retourne une table (KmerCounts) par
+    valeur de k, dans l'ordre de liste_k (voir build_kmer_dict pour
+    comptes_min).
+
+    Plusieurs fichiers sont lus chacun par un thread (voir
+    read_fastq_files_batches) ; l'ordre des lots ne change pas les
+    comptes, aux faux positifs du filtre de Bloom près.
+    """
+    compteurs = []
+    for taille_kmer in liste_k:
+        filtre = None
+        if comptes_min == "auto" or comptes_min > 1:
+            filtre = BloomFilter(bloom_size(fichier_fastq))
+        compteurs.append(KmerCounter(taille_kmer, canonique, filtre=filtre))
+    for lot, _, _, _ in read_fastq_files_batches(fichier_fastq):
+        for compteur in compteurs:
+            compteur.add_sequences(lot)
+    liste_comptes = []
+    for compteur in compteurs:
+        comptes = compteur.result()
+        comptes.histogramme = kmer_histogram(comptes.comptes,\
+                                             compteur.nbre_singletons())
+        seuil = comptes_min
+        if seuil == "auto":
+            seuil = _first_valley(comptes.histogramme)
+        liste_comptes.append(comptes.filtered(seuil) if seuil > 1 else comptes)
+    return liste_comptes
+
+def super_kmers(sequences, taille_kmer, nbre_partitions,\
+                taille_minimiseur=TAILLE_MINIMISEUR):
+    """Découpe un lot de reads en super-k-mers : suites maximales de
+    k-mers consécutifs (sans base ambiguë) partageant le même
+    minimiseur, le m-mer canonique de plus petit hachage.
+
+    Retourne les super-k-mers (bytes) et, pour chacun, sa partition
+    (entre 0 et nbre_partitions - 1) déduite de son minimiseur. Un
+    k-mer et son reverse complément ont le même minimiseur : ils
+    tombent donc toujours dans la même partition.
+    """
+    if sequences and isinstance(sequences[0], bytes):
+        bloc = b"\n".join(sequences)
+    else:
+        bloc = "\n".join(sequences).encode("ascii", "replace")
+    taille_minimiseur = min(taille_minimiseur, taille_kmer)
+    if len(bloc) < taille_kmer:
+        return [], np.empty(0, dtype=np.int64)
+    codes, valides = window_codes(bloc, taille_minimiseur)
+    codes = np.minimum(codes, reverse_complement_codes(codes, taille_minimiseur))
+    empreintes = hash_codes(codes)
+    empreintes[~valides] = np.iinfo(np.uint64).max
+    #Minimiseur de chaque k-mer : plus petit hachage de ses m-mers.
+    minimums = sliding_window_view(empreintes, taille_kmer - taille_minimiseur\
+                                   + 1).min(axis=1)
+    cumul = np.concatenate(([0], np.cumsum(CODE_NUCLEOTIDES[\
+        np.frombuffer(bloc, dtype=np.uint8)] == 255)))
+    positions = np.flatnonzero(cumul[taille_kmer:] == cumul[:-taille_kmer])
+    if len(positions) == 0:
+        return [], np.empty(0, dtype=np.int64)
+    #Un super-k-mer s'arrête à une base ambiguë, à la fin d'un read ou
+    #lorsque le minimiseur change.
+    coupures = np.flatnonzero((np.diff(positions) != 1)\
+        | (minimums[positions[1:]] != minimums[positions[:-1]])) + 1
+    debuts = positions[np.concatenate(([0], coupures))]
+    fins = positions[np.concatenate((coupures - 1, [len(positions) - 1]))]\
+           + taille_kmer
+    partitions = (minimums[debuts] >> np.uint64(32)) % np.uint64(nbre_partitions)
+    return [bloc[debut:fin] for debut, fin in zip(debuts.tolist(),\
+                                                   fins.tolist())],\
+           partitions.astype(np.int64)
+
+class SuperKmerWriter:
+    """Répartit des super-k-mers entre nbre_partitions fichiers (un
+    super-k-mer par ligne) d'un dossier.
+
+    Les super-k-mers sont accumulés en mémoire et chaque partition est
+    écrite d'un seul bloc dès que taille_tampon octets sont en attente.
+    """
+
+    def __init__(self, dossier, nbre_partitions,\
+                 taille_tampon=TAILLE_TAMPON_PARTITIONS):
+        self.fichiers = [os.path.join(dossier, "partition_{}.txt".format(i))\
+                         for i in range(nbre_partitions)]
+        for fichier in self.fichiers:
+            open(fichier, "wb").close()
+        self.taille_tampon = taille_tampon
+        self._tampons = [[] for _ in range(nbre_partitions)]
+        self._taille = 0
+
+    def add(self, sequences, partitions):
+        """Ajoute des super-k-mers et leurs partitions (voir super_kmers)."""
+        for sequence, partition in zip(sequences, partitions.tolist()):
+            self._tampons[partition].append(sequence)
+            self._taille += len(sequence) + 1
+        if self._taille >= self.taille_tampon:
+            self.flush()
+
+    def flush(self):
+        """Écrit les super-k-mers en attente."""
+        for fichier, tampon in zip(self.fichiers, self._tampons):
+            if tampon:
+                with open(fichier, "ab") as partition:
+                    partition.write(b"\n".join(tampon) + b"\n")
+                tampon.clear()
+        self._taille = 0
+
+def read_partition_batches(fichier, taille_bloc=TAILLE_BLOC_LECTURE):
+    """Génère par lots les super-k-mers (bytes) d'une partition."""
+    reste = b""
+    with open(fichier, "rb") as partition:
+        for bloc in iter(lambda: partition.read(taille_bloc), b""):
+            lignes = (reste + bloc).split(b"\n")
+            reste = lignes.pop()
+            yield lignes
+    if reste:
+        yield [reste]
+
+def _count_partition(parametres):
+    """Compte les k-mers d'une partition (éventuellement dans un
+    processus fils). La table obtenue est enregistrée à côté de la
+    partition, qui est supprimée ; seul son spectre est renvoyé.
     """
-    liste_reads = []
-    for sequence in read_fastq(fichier_fastq):
-        liste_reads.append(sequence)
-    occurrence_kmers = {}
-    for read in liste_reads:
-        for kmer in cut_kmer(read, taille_kmer):
-            if kmer in occurrence_kmers.keys():
-                occurrence_kmers[kmer] += 1
+    fichier, taille_kmer, canonique, filtrer = parametres
+    filtre = BloomFilter(bloom_size(fichier)) if filtrer else None
+    compteur = KmerCounter(taille_kmer, canonique, filtre=filtre)
+    for lot in read_partition_batches(fichier):
+        compteur.add_sequences(lot)
+    comptes = compteur.result()
+    os.remove(fichier)
+    np.save(fichier + ".codes.npy", comptes.codes, allow_pickle=True)
+    np.save(fichier + ".comptes.npy", comptes.comptes)
+    return kmer_histogram(comptes.comptes, compteur.nbre_singletons())
+
+def partition_count(fichier_fastq, memoire_max, threads=1):
+    """Nombre de partitions pour que le comptage de threads partitions
+    à la fois tienne dans memoire_max octets (un k-mer par base lue au
+    plus, la moitié d'un fastq étant faite de bases).
+    """
+    nbre_kmers = fastq_size(fichier_fastq) // 2
+    return max(1, -(-OCTETS_PAR_KMER * nbre_kmers * threads // memoire_max))
+
+def _partition_table(fichier, taille_kmer):
+    """Ouvre la table d'une partition écrite par _count_partition. Les
+    codes (k <= 32) et les comptes sont projetés en mémoire.
+    """
+    projection = "r" if taille_kmer <= TAILLE_KMER_MAX_UINT64 else None
+    return np.load(fichier + ".codes.npy", mmap_mode=projection,\
+                   allow_pickle=True),\
+           np.load(fichier + ".comptes.npy", mmap_mode="r")
+
+def merge_partitions(tables, seuil=1, taille_bloc=TAILLE_BLOC_FUSION):
+    """Fusionne des tables (codes, comptes) triées et disjointes, telles
+    que les partitions du comptage hors mémoire, et génère la table
+    fusionnée par blocs triés, sans les k-mers de compte inférieur à
+    seuil.
+
+    Au plus taille_bloc k-mers sont lus dans chaque table à chaque
+    tour : tous les codes inférieurs au plus petit des derniers codes
+    lus sont définitifs et forment le bloc suivant. La mémoire utilisée
+    dépend du nombre de tables et de taille_bloc, pas de leur taille.
+    """
+    positions = [0] * len(tables)
+    while True:
+        actives = [numero for numero, (codes, _) in enumerate(tables)\
+                   if positions[numero] < len(codes)]
+        if not actives:
+            return
+        borne = min(tables[numero][0][min(positions[numero] + taille_bloc,\
+                                          len(tables[numero][0])) - 1]\
+                    for numero in actives)
+        liste_codes, liste_comptes = [], []
+        for numero in actives:
+            codes, comptes = tables[numero]
+            debut = positions[numero]
+            fin = debut + int(np.searchsorted(codes[debut:debut + taille_bloc],\
+                                              borne, side="right"))
+            garder = np.asarray(comptes[debut:fin]) >= seuil
+            liste_codes.append(np.asarray(codes[debut:fin])[garder])
+            liste_comptes.append(np.asarray(comptes[debut:fin])[garder])
+            positions[numero] = fin
+        codes = np.concatenate(liste_codes)
+        ordre = np.argsort(codes, kind="stable")
+        yield codes[ordre], np.concatenate(liste_comptes)[ordre]
+
+def count_kmers_out_of_core(fichier_fastq, taille_kmer, canonique=False,\
+                            threads=1, comptes_min=1, memoire_max=2 ** 30,\
+                            dossier=None, base=None, empreinte=b""):
+    """Compte les k-mers du fastq sans garder en mémoire les k-mers de
+    tous les reads, lorsque ceux-ci ne tiennent pas en mémoire.
+
+    Les reads sont découpés en super-k-mers (voir super_kmers) écrits
+    dans des fichiers de partition d'un dossier temporaire (créé dans
+    dossier). Un k-mer n'apparaît que dans une partition : chacune est
+    comptée indépendamment (en parallèle avec threads > 1), assez de
+    partitions étant créées pour tenir dans memoire_max octets (voir
+    partition_count). Les partitions triées sont ensuite fusionnées
+    par blocs (voir merge_partitions), sans les k-mers rares (voir
+    build_kmer_dict pour comptes_min).
+
+    Si base est donné, la table fusionnée est écrite au fil de l'eau
+    dans ce fichier (voir write_kmer_counts) puis relue par
+    load_kmer_counts : elle ne passe jamais entière en mémoire. Sinon
+    elle est rassemblée dans une table unique (KmerCounts).
+    """
+    nbre_partitions = partition_count(fichier_fastq, memoire_max, threads)
+    LOGGER.info("Comptage hors mémoire en %s partitions", nbre_partitions)
+    with tempfile.TemporaryDirectory(dir=dossier) as temporaire:
+        ecrivain = SuperKmerWriter(temporaire, nbre_partitions)
+        for lot, _, _, _ in read_fastq_files_batches(fichier_fastq):
+            ecrivain.add(*super_kmers(lot, taille_kmer, nbre_partitions))
+        ecrivain.flush()
+        parametres = [(fichier, taille_kmer, canonique,\
+                       comptes_min == "auto" or comptes_min > 1)\
+                      for fichier in ecrivain.fichiers]
+        if threads > 1 and nbre_partitions > 1:
+            with multiprocessing.Pool(threads) as pool:
+                spectres = pool.map(_count_partition, parametres)
+        else:
+            spectres = [_count_partition(parametre) for parametre in parametres]
+        histogramme = np.zeros(max(len(spectre) for spectre in spectres),\
+                               dtype=np.int64)
+        for spectre in spectres:
+            histogramme[:len(spectre)] += spectre
+        seuil = max(_first_valley(histogramme) if comptes_min == "auto"\
+                    else comptes_min, 1)
+        tables = [_partition_table(fichier, taille_kmer)\
+                  for fichier in ecrivain.fichiers]
+        nbre_kmers = sum(int(np.count_nonzero(comptes >= seuil))\
+                         for _, comptes in tables)
+        blocs = merge_partitions(tables, seuil)
+        if base:
+            write_kmer_counts(base, blocs, taille_kmer, canonique, nbre_kmers,\
+                              histogramme, seuil, empreinte)
+        else:
+            codes = np.empty(nbre_kmers, dtype=kmer_dtype(taille_kmer))
+            comptes = np.empty(nbre_kmers, dtype=np.uint32)
+            position = 0
+            for codes_bloc, comptes_bloc in blocs:
+                codes[position:position + len(codes_bloc)] = codes_bloc
+                comptes[position:position + len(codes_bloc)] = comptes_bloc
+                position += len(codes_bloc)
+        #Les projections doivent être fermées avant de supprimer le
+        #dossier temporaire.
+        del tables, blocs
+    if base:
+        return load_kmer_counts(base)
+    return KmerCounts(codes, comptes, taille_kmer, canonique, histogramme,\
+                      seuil)
+
+def parse_size(taille):
+    """Convertit une taille (ex: "512M", "4G") en octets."""
+    correspondance = re.fullmatch(r"\s*([0-9.]+)\s*([KMGT]?)i?B?\s*",\
+                                  str(taille).upper())
+    if correspondance is None:
+        raise ValueError("Taille invalide : {}".format(taille))
+    return int(float(correspondance.group(1))\
+               * UNITES_MEMOIRE[correspondance.group(2)])
+
+def add_pseudo_reads(kmer_counts, sequences, poids=None):
+    """Ajoute à une table de k-mers ceux de séquences (contigs obtenus
+    avec un k plus petit) traitées comme des reads de confiance.
+
+    Chaque k-mer d'une séquence compte pour poids occurrences. Par
+    défaut c'est la couverture médiane des k-mers solides de la table
+    (voir spectrum_stats), et au moins son seuil d'abondance : les
+    pseudo-reads pèsent comme un k-mer du génome bien couvert, et le
+    nettoyage ne les retire pas avant les chemins d'erreurs. Retourne
+    une nouvelle table.
+    """
+    if poids is None:
+        stats = spectrum_stats(kmer_counts.histogram())
+        poids = max(kmer_counts.comptes_min, stats["couverture_mediane"])
+    codes = encode_sequences(sequences, kmer_counts.taille_kmer,\
+                             kmer_counts.canonique)
+    codes, comptes = merge_counts(\
+        np.concatenate((kmer_counts.codes, codes)),\
+        np.concatenate((kmer_counts.comptes,\
+                        np.full(len(codes), poids, dtype=np.uint32))))
+    return KmerCounts(codes, comptes, kmer_counts.taille_kmer,\
+                      kmer_counts.canonique, kmer_counts.histogram(),\
+                      kmer_counts.comptes_min)
+
+def file_checksum(nom_fichier):
+    """Retourne l'empreinte (blake2b, 32 octets) du contenu d'un fichier,
+    ou du contenu mis bout à bout de plusieurs (voir fastq_files).
+    """
+    empreinte = hashlib.blake2b(digest_size=32)
+    for nom in fastq_files(nom_fichier):
+        with open(nom, "rb") as fichier:
+            for bloc in iter(lambda: fichier.read(TAILLE_BLOC_LECTURE), b""):
+                empreinte.update(bloc)
+    return empreinte.digest()
+
+def _kmer_code_width(taille_kmer):
+    """Nombre d'octets occupés par un code de k-mer sur disque."""
+    if taille_kmer <= TAILLE_KMER_MAX_UINT64:
+        return 8
+    return (2 * taille_kmer + 7) // 8
+
+def _align(position):
+    """Arrondit une position du fichier au multiple de 8 supérieur."""
+    return (position + 7) // 8 * 8
+
+def write_kmer_counts(nom_fichier, blocs, taille_kmer, canonique, nbre_kmers,\
+                      histogramme, comptes_min=1, empreinte=b""):
+    """Écrit une table de nbre_kmers k-mers fournie par blocs triés de
+    (codes, comptes), au format décrit par save_kmer_counts, sans la
+    rassembler en mémoire : codes et comptes de chaque bloc sont écrits
+    directement à leur place dans le fichier.
+
+    La table est écrite dans un fichier temporaire du même dossier qui
+    remplace ensuite nom_fichier d'un coup (os.replace) : une table
+    encore projetée en mémoire (voir load_kmer_counts) garde l'ancien
+    fichier au lieu de le voir tronqué sous elle.
+    """
+    histogramme = np.asarray(histogramme, dtype=np.int64)
+    largeur = _kmer_code_width(taille_kmer)
+    position_codes = len(SIGNATURE_BASE_KMERS) + ENTETE_BASE_KMERS.size
+    position_comptes = position_codes + _align(nbre_kmers * largeur)
+    debut_histogramme = position_comptes + _align(4 * nbre_kmers)
+    descripteur, temporaire = tempfile.mkstemp(\
+        dir=os.path.dirname(os.path.abspath(nom_fichier)),\
+        prefix=os.path.basename(nom_fichier) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(descripteur, "wb") as fichier_sortie:
+            fichier_sortie.write(SIGNATURE_BASE_KMERS)
+            fichier_sortie.write(ENTETE_BASE_KMERS.pack(taille_kmer, canonique,\
+                nbre_kmers, len(histogramme), comptes_min, empreinte))
+            for codes, comptes in blocs:
+                fichier_sortie.seek(position_codes)
+                if codes.dtype == object:
+                    fichier_sortie.write(b"".join(int(code).to_bytes(largeur, "big")\
+                                                  for code in codes))
+                else:
+                    fichier_sortie.write(np.asarray(codes, dtype="<u8").tobytes())
+                fichier_sortie.seek(position_comptes)
+                fichier_sortie.write(np.asarray(comptes, dtype="<u4").tobytes())
+                position_codes += len(codes) * largeur
+                position_comptes += 4 * len(comptes)
+            #Les blocs de remplissage (alignement) sont laissés à zéro.
+            fichier_sortie.seek(debut_histogramme)
+            fichier_sortie.write(histogramme.astype("<i8").tobytes())
+        os.replace(temporaire, nom_fichier)
+    except BaseException:
+        os.remove(temporaire)
+        raise
+
+def save_kmer_counts(kmer_counts, nom_fichier, empreinte=b""):
+    """Enregistre une table de k-mers (KmerCounts) dans un fichier
+    binaire : un entête (k, mode canonique, nombre de k-mers, seuil
+    d'abondance, empreinte du fastq) suivi des codes triés (uint64, ou
+    entiers gros-boutistes sur le nombre d'octets nécessaire au-delà de
+    k = 32), des comptes (uint32) et du spectre des abondances (int64).
+    Chaque tableau est aligné sur 8 octets.
+    """
+    write_kmer_counts(nom_fichier, [(kmer_counts.codes, kmer_counts.comptes)],\
+                      kmer_counts.taille_kmer, kmer_counts.canonique,\
+                      len(kmer_counts.codes), kmer_counts.histogram(),\
+                      kmer_counts.comptes_min, empreinte)
+
+def read_kmer_counts_header(nom_fichier):
+    """Lit l'entête d'un fichier écrit par save_kmer_counts."""
+    with open(nom_fichier, "rb") as fichier:
+        signature = fichier.read(len(SIGNATURE_BASE_KMERS))
+        donnees = fichier.read(ENTETE_BASE_KMERS.size)
+    if signature != SIGNATURE_BASE_KMERS\
+    or len(donnees) != ENTETE_BASE_KMERS.size:
+        raise ValueError("{} n'est pas une table de k-mers".format(nom_fichier))
+    taille_kmer, canonique, nbre_kmers, taille_histogramme, comptes_min,\
+    empreinte = ENTETE_BASE_KMERS.unpack(donnees)
+    return {"taille_kmer": taille_kmer, "canonique": bool(canonique),\
+            "nbre_kmers": nbre_kmers, "taille_histogramme": taille_histogramme,\
+            "comptes_min": comptes_min, "empreinte": empreinte}
+
+def load_kmer_counts(nom_fichier):
+    """Relit une table écrite par save_kmer_counts. Les codes (k <= 32)
+    et les comptes sont projetés en mémoire (numpy.memmap) sans copie.
+    """
+    entete = read_kmer_counts_header(nom_fichier)
+    nbre_kmers = entete["nbre_kmers"]
+    largeur = _kmer_code_width(entete["taille_kmer"])
+    position = len(SIGNATURE_BASE_KMERS) + ENTETE_BASE_KMERS.size
+    debut_comptes = position + _align(nbre_kmers * largeur)
+    debut_histogramme = debut_comptes + _align(4 * nbre_kmers)
+
+    def projection(dtype, debut, nbre):
+        #Un fichier ne peut pas être projeté sur une longueur nulle.
+        if nbre == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(nom_fichier, dtype=dtype, mode="r", offset=debut,\
+                         shape=(nbre,))
+
+    if entete["taille_kmer"] <= TAILLE_KMER_MAX_UINT64:
+        codes = projection("<u8", position, nbre_kmers)
+    else:
+        octets = projection(np.uint8, position, nbre_kmers * largeur)
+        codes = np.array([int.from_bytes(octets[indice:indice + largeur]\
+                                         .tobytes(), "big") for indice\
+                          in range(0, nbre_kmers * largeur, largeur)],\
+                         dtype=object)
+    comptes = projection("<u4", debut_comptes, nbre_kmers)
+    histogramme = np.array(projection("<i8", debut_histogramme,\
+                                      entete["taille_histogramme"]))
+    return KmerCounts(codes, comptes, entete["taille_kmer"],\
+                      entete["canonique"], histogramme, entete["comptes_min"])
+
+def node_key(noeud):
+    """Clé (entier de 63 bits) d'un noeud d'ArrayGraph : un 1 suivi du
+    code 2 bits de ses BASES_CLE_NOEUD premières bases.
+
+    La clé est positive quand elle identifie le noeud (au plus
+    BASES_CLE_NOEUD bases, toutes parmi ACGT) et négative sinon :
+    plusieurs noeuds peuvent alors la partager. Une TypeError est levée
+    si le noeud n'est pas une chaîne.
+    """
+    if not isinstance(noeud, str):
+        raise TypeError("noeud non séquence : {!r}".format(noeud))
+    prefixe = noeud[:BASES_CLE_NOEUD]
+    if prefixe.strip(NUCLEOTIDES):
+        #Base ambiguë : codée comme dans window_codes (sur 2 bits).
+        code = 0
+        for base in prefixe:
+            code = (code << 2) | (int(CODE_NUCLEOTIDES[ord(base)]) & 3\
+                                  if ord(base) < 256 else 3)
+        exacte = False
+    else:
+        code = int(prefixe.translate(CHIFFRES_NUCLEOTIDES), 4) if prefixe else 0
+        exacte = len(noeud) <= BASES_CLE_NOEUD
+    cle = (1 << (2 * len(prefixe))) | code
+    return cle if exacte else -cle
+
+def node_keys(lettres, bornes):
+    """Calcule node_key pour des noeuds stockés bout à bout : lettres
+    (codes ASCII) et bornes (début de chaque noeud, puis la fin du
+    dernier).
+    """
+    longueurs = np.diff(bornes)
+    tailles = np.minimum(longueurs, BASES_CLE_NOEUD)
+    cles = np.ones(len(longueurs), dtype=np.int64)
+    exactes = longueurs <= BASES_CLE_NOEUD
+    acgt = np.zeros(256, dtype=bool)
+    acgt[list(NUCLEOTIDES.encode("ascii"))] = True
+    for position in range(BASES_CLE_NOEUD):
+        presents = np.flatnonzero(tailles > position)
+        if len(presents) == 0:
+            break
+        octets = lettres[bornes[presents] + position]
+        cles[presents] = (cles[presents] << 2) | (CODE_NUCLEOTIDES[octets] & 3)
+        exactes[presents] &= acgt[octets]
+    return np.where(exactes, cles, -cles)
+
+class _VueNoeuds:
+    """Vue sur les noeuds actifs d'un ArrayGraph (itération, test
+    d'appartenance et accès aux attributs comme graph.nodes[noeud]).
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False):
+        if data:
+            return [(noeud, self[noeud]) for noeud in self]
+        return self
+
+    def __iter__(self):
+        graph = self._graph
+        return graph._nommer(np.flatnonzero(graph._actifs[:graph._nbre_noeuds]))
+
+    def __len__(self):
+        return int(np.count_nonzero(self._graph._actifs[:self._graph._nbre_noeuds]))
+
+    def __contains__(self, noeud):
+        return self._graph._identifiant(noeud) is not None
+
+    def __getitem__(self, noeud):
+        identifiant = self._graph._identifiant(noeud)
+        if identifiant is None:
+            raise KeyError(noeud)
+        return self._graph._attributs.setdefault(identifiant, {})
+
+class _VueArete(Mapping):
+    """Attributs d'une arête d'un ArrayGraph ; seul le poids
+    ("weight") est stocké, dans le tableau des poids.
+    """
+
+    def __init__(self, graph, arete):
+        self._graph = graph
+        self._arete = arete
+
+    def __getitem__(self, cle):
+        if cle != "weight":
+            raise KeyError(cle)
+        return int(self._graph._poids[self._arete])
+
+    def __setitem__(self, cle, valeur):
+        if cle != "weight":
+            raise KeyError(cle)
+        self._graph._poids[self._arete] = valeur
+
+    def __iter__(self):
+        yield "weight"
+
+    def __len__(self):
+        return 1
+
+class _VueAretes:
+    """Vue sur les arêtes d'un ArrayGraph : appelable comme
+    graph.edges(data=True) et indexable comme graph.edges[u, v].
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False):
+        graph = self._graph
+        graph._construire()
+        for arete in np.flatnonzero(graph._aretes_actives[:graph._nbre_aretes]):
+            source = graph._nom(graph._sources[arete])
+            cible = graph._nom(graph._cibles[arete])
+            if data:
+                yield source, cible, {"weight": int(graph._poids[arete])}
             else:
-                occurrence_kmers[kmer] = 1
-    return occurrence_kmers
+                yield source, cible
+
+    def __iter__(self):
+        return self()
+
+    def __contains__(self, arete):
+        return self._graph.has_edge(*arete)
+
+    def __getitem__(self, arete):
+        indice = self._graph._arete(*arete)
+        if indice is None:
+            raise KeyError(arete)
+        return _VueArete(self._graph, indice)
+
+class ArrayGraph:
+    """Graph orienté compact, alternative à networkx.DiGraph.
+
+    Les noeuds sont des séquences, numérotées dans l'ordre d'ajout et
+    stockées bout à bout dans un tableau d'octets. Un noeud est retrouvé
+    par sa clé (voir node_key), cherchée avec searchsorted dans l'index
+    trié des clés ; les noeuds ajoutés depuis le dernier tri sont gardés
+    à part jusqu'au suivant et les dernières recherches sont gardées en
+    cache (au plus TAILLE_CACHE_NOEUDS noeuds).
+
+    Les arêtes sont stockées dans des tableaux numpy (source, cible,
+    poids) et indexées sous forme CSR (arêtes sortantes) et CSC (arêtes
+    entrantes). La suppression d'un noeud ne fait que le marquer, lui
+    et ses arêtes, comme supprimé. Seule la petite partie de l'API de
+    networkx utilisée par ce module est fournie, et seul l'attribut
+    "weight" est conservé sur les arêtes.
+    """
+
+    def __init__(self, **attributs):
+        self.graph = dict(attributs)
+        self._lettres = np.zeros(0, dtype=np.uint8)
+        self._bornes = np.zeros(1, dtype=np.int64)
+        self._cles = np.zeros(0, dtype=np.int64)
+        self._nbre_noeuds = 0
+        self._cles_triees = np.zeros(0, dtype=np.int64)
+        self._ordre_cles = np.zeros(0, dtype=np.int64)
+        self._nouveaux = {}
+        self._cache = {}
+        self._attributs = {}
+        self._actifs = np.zeros(0, dtype=bool)
+        self._sources = np.zeros(0, dtype=np.int64)
+        self._cibles = np.zeros(0, dtype=np.int64)
+        self._poids = np.zeros(0, dtype=np.int64)
+        self._aretes_actives = np.zeros(0, dtype=bool)
+        self._nbre_aretes = 0
+        self._a_construire = True
+        self.nodes = _VueNoeuds(self)
+        self.edges = _VueAretes(self)
+
+    @classmethod
+    def from_edges(cls, lettres, longueurs, sources, cibles, poids, **attributs):
+        """Construit un graph d'un bloc à partir des séquences des
+        noeuds (lettres ASCII bout à bout et longueur de chaque noeud)
+        et des tableaux d'identifiants (sources, cibles) et de poids.
+        """
+        graph = cls(**attributs)
+        graph._lettres = np.frombuffer(lettres, dtype=np.uint8).copy()
+        graph._nbre_noeuds = len(longueurs)
+        graph._bornes = np.zeros(graph._nbre_noeuds + 1, dtype=np.int64)
+        np.cumsum(longueurs, out=graph._bornes[1:])
+        graph._cles = node_keys(graph._lettres, graph._bornes)
+        graph._indexer()
+        graph._actifs = np.ones(graph._nbre_noeuds, dtype=bool)
+        graph._sources = np.asarray(sources, dtype=np.int64)
+        graph._cibles = np.asarray(cibles, dtype=np.int64)
+        graph._poids = np.asarray(poids, dtype=np.int64)
+        graph._nbre_aretes = len(graph._sources)
+        graph._aretes_actives = np.ones(graph._nbre_aretes, dtype=bool)
+        return graph
+
+    def __getstate__(self):
+        #Le cache ne voyage pas avec le graph (voir clean_graph).
+        etat = dict(self.__dict__)
+        etat["_cache"] = {}
+        return etat
+
+    def _indexer(self):
+        """Trie les clés de tous les noeuds (voir _chercher)."""
+        self._ordre_cles = np.argsort(self._cles[:self._nbre_noeuds], kind="stable")
+        self._cles_triees = self._cles[self._ordre_cles]
+        self._nouveaux = {}
 
-def build_graph(dico_kmers):
+    def _nom(self, identifiant):
+        """Retourne la séquence d'un noeud."""
+        bornes = self._bornes
+        return self._lettres[bornes[identifiant]:bornes[identifiant + 1]]\
+        .tobytes().decode("ascii")
+
+    def _nommer(self, identifiants):
+        """Génère les séquences des noeuds identifiants, gardées en
+        cache : elles sont le plus souvent cherchées juste après.
+        """
+        cache = self._cache
+        if len(cache) >= TAILLE_CACHE_NOEUDS:
+            cache.clear()
+        for identifiant in identifiants.tolist():
+            nom = self._nom(identifiant)
+            cache[nom] = identifiant
+            yield nom
+
+    def _chercher(self, noeud):
+        """Retourne l'identifiant d'un noeud, actif ou supprimé (None
+        s'il n'a jamais été ajouté).
+        """
+        identifiant = self._cache.get(noeud)
+        if identifiant is not None:
+            return identifiant
+        identifiant = self._nouveaux.get(noeud)
+        if identifiant is None:
+            cle = node_key(noeud)
+            position = int(self._cles_triees.searchsorted(cle))
+            while position < len(self._cles_triees)\
+            and self._cles_triees[position] == cle:
+                candidat = int(self._ordre_cles[position])
+                if cle > 0 or self._nom(candidat) == noeud:
+                    identifiant = candidat
+                    break
+                position += 1
+            if identifiant is None:
+                return None
+        if len(self._cache) >= TAILLE_CACHE_NOEUDS:
+            self._cache.clear()
+        self._cache[noeud] = identifiant
+        return identifiant
+
+    def _identifiant(self, noeud):
+        """Retourne l'identifiant d'un noeud actif (None sinon)."""
+        try:
+            identifiant = self._chercher(noeud)
+        except TypeError:
+            return None
+        if identifiant is None or not self._actifs[identifiant]:
+            return None
+        return identifiant
+
+    @staticmethod
+    def _agrandir(tableau, taille):
+        """Double la capacité d'un tableau si nécessaire."""
+        if taille <= len(tableau):
+            return tableau
+        nouveau = np.zeros(max(taille, 2 * len(tableau), 16), dtype=tableau.dtype)
+        nouveau[:len(tableau)] = tableau
+        return nouveau
+
+    def add_node(self, noeud, **attributs):
+        """Ajoute un noeud (ou réactive un noeud supprimé)."""
+        identifiant = self._chercher(noeud)
+        if identifiant is None:
+            sequence = np.frombuffer(noeud.encode("ascii"), dtype=np.uint8)
+            identifiant = self._nbre_noeuds
+            debut = int(self._bornes[identifiant])
+            fin = debut + len(sequence)
+            self._lettres = self._agrandir(self._lettres, fin)
+            self._lettres[debut:fin] = sequence
+            self._bornes = self._agrandir(self._bornes, identifiant + 2)
+            self._bornes[identifiant + 1] = fin
+            self._cles = self._agrandir(self._cles, identifiant + 1)
+            self._cles[identifiant] = node_key(noeud)
+            self._actifs = self._agrandir(self._actifs, identifiant + 1)
+            self._nbre_noeuds += 1
+            self._nouveaux[noeud] = identifiant
+            #L'index est retrié quand les noeuds ajoutés depuis le
+            #dernier tri sont plus nombreux que ceux qu'il contient.
+            if len(self._nouveaux) > max(TAILLE_CACHE_NOEUDS, len(self._cles_triees)):
+                self._indexer()
+            self._a_construire = True
+        elif not self._actifs[identifiant]:
+            self._attributs.pop(identifiant, None)
+        self._actifs[identifiant] = True
+        if attributs:
+            self._attributs.setdefault(identifiant, {}).update(attributs)
+        return identifiant
+
+    def add_edge(self, source, cible, weight=1):
+        """Ajoute une arête ; si elle existe déjà son poids est remplacé.
+
+        Les index CSR/CSC sont reconstruits paresseusement, à la
+        prochaine consultation : ajouter les arêtes par lots est donc
+        bien plus efficace que d'alterner ajouts et requêtes.
+        """
+        if not self._a_construire:
+            arete = self._arete(source, cible)
+            if arete is not None:
+                self._poids[arete] = weight
+                return
+        indice_source = self._identifiant(source)
+        if indice_source is None:
+            indice_source = self.add_node(source)
+        indice_cible = self._identifiant(cible)
+        if indice_cible is None:
+            indice_cible = self.add_node(cible)
+        arete = self._nbre_aretes
+        self._sources = self._agrandir(self._sources, arete + 1)
+        self._cibles = self._agrandir(self._cibles, arete + 1)
+        self._poids = self._agrandir(self._poids, arete + 1)
+        self._aretes_actives = self._agrandir(self._aretes_actives, arete + 1)
+        self._sources[arete] = indice_source
+        self._cibles[arete] = indice_cible
+        self._poids[arete] = weight
+        self._aretes_actives[arete] = True
+        self._nbre_aretes += 1
+        self._a_construire = True
+
+    def _construire(self):
+        """(Re)construit les index CSR/CSC et les degrés.
+
+        Les arêtes en double (même source et même cible) ne gardent
+        que le dernier poids ajouté, comme avec networkx.
+        """
+        if not self._a_construire:
+            return
+        if self._nouveaux:
+            self._indexer()
+        nbre = self._nbre_aretes
+        actives = np.flatnonzero(self._aretes_actives[:nbre])
+        cles = self._sources[actives] * self._nbre_noeuds + self._cibles[actives]
+        ordre = np.argsort(cles, kind="stable")
+        cles = cles[ordre]
+        doublons = actives[ordre][:-1][cles[1:] == cles[:-1]]
+        self._aretes_actives[doublons] = False
+        actives = np.flatnonzero(self._aretes_actives[:nbre])
+        nbre_noeuds = self._nbre_noeuds
+        self._sortantes = actives[np.argsort(self._sources[actives], kind="stable")]
+        self._entrantes = actives[np.argsort(self._cibles[actives], kind="stable")]
+        self._degres_sortants = np.bincount(self._sources[actives],\
+                                            minlength=nbre_noeuds)
+        self._degres_entrants = np.bincount(self._cibles[actives],\
+                                            minlength=nbre_noeuds)
+        self._debuts_sortants = np.concatenate(([0], np.cumsum(self._degres_sortants)))
+        self._debuts_entrants = np.concatenate(([0], np.cumsum(self._degres_entrants)))
+        self._a_construire = False
+
+    def _aretes_sortantes(self, identifiant):
+        self._construire()
+        aretes = self._sortantes[self._debuts_sortants[identifiant]:\
+                                 self._debuts_sortants[identifiant + 1]]
+        return aretes[self._aretes_actives[aretes]]
+
+    def _aretes_entrantes(self, identifiant):
+        self._construire()
+        aretes = self._entrantes[self._debuts_entrants[identifiant]:\
+                                 self._debuts_entrants[identifiant + 1]]
+        return aretes[self._aretes_actives[aretes]]
+
+    def _arete(self, source, cible):
+        """Retourne l'indice de l'arête source -> cible (None sinon)."""
+        indice_source = self._identifiant(source)
+        indice_cible = self._identifiant(cible)
+        if indice_source is None or indice_cible is None:
+            return None
+        for arete in self._aretes_sortantes(indice_source):
+            if self._cibles[arete] == indice_cible:
+                return int(arete)
+        return None
+
+    def _verifier(self, noeud):
+        identifiant = self._identifiant(noeud)
+        if identifiant is None:
+            raise KeyError(noeud)
+        return identifiant
+
+    def successors(self, noeud):
+        return self._nommer(self._cibles[self._aretes_sortantes(self._verifier(noeud))])
+
+    def predecessors(self, noeud):
+        return self._nommer(self._sources[self._aretes_entrantes(self._verifier(noeud))])
+
+    def out_degree(self, noeud):
+        identifiant = self._verifier(noeud)
+        self._construire()
+        return int(self._degres_sortants[identifiant])
+
+    def in_degree(self, noeud):
+        identifiant = self._verifier(noeud)
+        self._construire()
+        return int(self._degres_entrants[identifiant])
+
+    def has_edge(self, source, cible):
+        return self._arete(source, cible) is not None
+
+    def remove_node(self, noeud):
+        """Marque un noeud et ses arêtes comme supprimés, sans
+        réallouer les tableaux.
+        """
+        identifiant = self._verifier(noeud)
+        sortantes = self._aretes_sortantes(identifiant)
+        entrantes = self._aretes_entrantes(identifiant)
+        np.subtract.at(self._degres_entrants, self._cibles[sortantes], 1)
+        np.subtract.at(self._degres_sortants, self._sources[entrantes], 1)
+        self._aretes_actives[sortantes] = False
+        self._aretes_actives[entrantes] = False
+        self._degres_sortants[identifiant] = 0
+        self._degres_entrants[identifiant] = 0
+        self._actifs[identifiant] = False
+        self._attributs.pop(identifiant, None)
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        self._construire()
+        return int(np.count_nonzero(self._aretes_actives[:self._nbre_aretes]))
+
+    def __contains__(self, noeud):
+        return noeud in self.nodes
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+def simple_paths(graph, source, cible):
+    """Génère les chemins simples de source à cible par un parcours en
+    profondeur, comme nx.all_simple_paths mais pour n'importe quelle
+    représentation du graph. Les successeurs sont parcourus par nom
+    croissant, l'ordre des chemins ne dépend donc pas de celui des
+    arêtes.
+    """
+    if source == cible:
+        yield [source]
+        return
+    chemin = [source]
+    dans_chemin = {source}
+    pile = [iter(sorted(graph.successors(source)))]
+    fin = object()
+    while pile:
+        suivant = next(pile[-1], fin)
+        if suivant is fin:
+            pile.pop()
+            dans_chemin.discard(chemin.pop())
+        elif suivant == cible:
+            yield chemin + [cible]
+        elif suivant not in dans_chemin:
+            chemin.append(suivant)
+            dans_chemin.add(suivant)
+            pile.append(iter(sorted(graph.successors(suivant))))
+
+def build_graph(dico_kmers, canonique=False, backend="networkx"):
     """Cette fonction va permettre de créer un digraph qui permettra,
     à terme, d'aligner les reads.
+
+    En mode canonique le graph est bidirigé : voir build_bidirected_graph.
+    backend choisit la représentation : "networkx" (nx.DiGraph) ou
+    "array" (ArrayGraph).
     """
+    if canonique:
+        return build_bidirected_graph(dico_kmers)
+    if backend == "array":
+        return build_array_graph(dico_kmers)
     graph = nx.DiGraph()
+    #Le ramasse-miettes est suspendu pendant la construction : les
+    #dictionnaires créés pour chaque noeud et chaque arête ne forment
+    #aucun cycle mais le déclencheraient sans cesse.
+    actif = gc.isenabled()
+    gc.disable()
+    try:
+        graph.add_weighted_edges_from((kmer[:-1], kmer[1:], poids)\
+                                      for kmer, poids in dico_kmers.items())
+    finally:
+        if actif:
+            gc.enable()
+    return graph
+
+def build_array_graph(dico_kmers):
+    """Construit le graph de De Bruijn sous forme d'ArrayGraph.
+
+    Pour une table KmerCounts les (k-1)-mers sont obtenus directement
+    à partir des codes ; les noeuds sont numérotés dans le même ordre
+    que celui de build_graph avec networkx.
+    """
+    if isinstance(dico_kmers, KmerCounts) and dico_kmers.codes.dtype != object:
+        taille_noeud = dico_kmers.taille_kmer - 1
+        codes = dico_kmers.codes
+        extremites = np.empty(2 * len(codes), dtype=np.uint64)
+        extremites[0::2] = codes >> np.uint64(2)
+        extremites[1::2] = codes & np.uint64((1 << (2 * taille_noeud)) - 1)
+        codes_noeuds, premiers, inverse = np.unique(extremites,\
+            return_index=True, return_inverse=True)
+        #Les noeuds sont numérotés par ordre de première apparition.
+        ordre = np.argsort(premiers, kind="stable")
+        rangs = np.empty(len(ordre), dtype=np.int64)
+        rangs[ordre] = np.arange(len(ordre))
+        identifiants = rangs[inverse.reshape(-1)]
+        lettres = kmer_letters(codes_noeuds[ordre], taille_noeud)
+        return ArrayGraph.from_edges(lettres, np.full(len(ordre), taille_noeud),\
+                                     identifiants[0::2], identifiants[1::2],\
+                                     dico_kmers.comptes)
+    graph = ArrayGraph()
     for kmer, poids in dico_kmers.items():
         graph.add_edge(kmer[:-1], kmer[1:], weight=poids)
     return graph
 
+def build_bidirected_graph(dico_kmers):
+    """Construit le graph bidirigé associé à des k-mers canoniques.
+
+    Les noeuds sont les (k-1)-mers canoniques. Chaque k-mer donne une
+    seule arête (préfixe -> suffixe) dont l'attribut "orientations"
+    associe au couple (sens du préfixe, sens du suffixe) son poids ;
+    True signifie que le (k-1)-mer est lu sous sa forme canonique.
+    """
+    graph = nx.DiGraph(bidirige=True)
+    for kmer, poids in dico_kmers.items():
+        prefixe = canonical_kmer(kmer[:-1])
+        suffixe = canonical_kmer(kmer[1:])
+        sens = (prefixe == kmer[:-1], suffixe == kmer[1:])
+        if graph.has_edge(prefixe, suffixe):
+            arete = graph.edges[prefixe, suffixe]
+            arete["orientations"][sens] = poids
+            arete["weight"] += poids
+        else:
+            graph.add_edge(prefixe, suffixe, weight=poids,\
+                           orientations={sens: poids})
+    return graph
+
+def bidirected_successors(graph, noeud, sens):
+    """Retourne les successeurs orientés d'un noeud orienté d'un graph
+    bidirigé, sous forme de couples (noeud, sens).
+
+    Une arête u -> v d'orientation (a, b) se lit dans un sens comme
+    (u, a) -> (v, b), et dans l'autre comme (v, non b) -> (u, non a).
+    """
+    voisins = []
+    for suivant in graph.successors(noeud):
+        for sens_noeud, sens_suivant in graph.edges[noeud, suivant]["orientations"]:
+            if sens_noeud == sens and (suivant, sens_suivant) not in voisins:
+                voisins.append((suivant, sens_suivant))
+    for precedent in graph.predecessors(noeud):
+        for sens_precedent, sens_noeud in graph.edges[precedent, noeud]["orientations"]:
+            if sens_noeud != sens and (precedent, not sens_precedent) not in voisins:
+                voisins.append((precedent, not sens_precedent))
+    return voisins
+
+def _extend_bidirected(graph, chemin, visites):
+    """Prolonge un chemin orienté tant qu'il ne rencontre pas
+    d'embranchement ni de noeud déjà visité.
+    """
+    while True:
+        noeud, sens = chemin[-1]
+        suivants = bidirected_successors(graph, noeud, sens)
+        if len(suivants) != 1:
+            return chemin
+        suivant, sens_suivant = suivants[0]
+        if suivant in visites or\
+        len(bidirected_successors(graph, suivant, not sens_suivant)) != 1:
+            return chemin
+        visites.add(suivant)
+        chemin.append((suivant, sens_suivant))
+
+def bidirected_unitig_paths(graph):
+    """Génère les unitigs d'un graph bidirigé, chacun sous forme de
+    chemin de noeuds orientés (noeud, sens).
+
+    Chaque noeud n'appartient qu'à un seul unitig : l'unitig est
+    prolongé dans les deux orientations à partir d'un noeud non
+    visité, quel que soit le brin lu.
+    """
+    visites = set()
+    for noeud in list(graph.nodes):
+        if noeud in visites:
+            continue
+        visites.add(noeud)
+        avant = _extend_bidirected(graph, [(noeud, True)], visites)
+        arriere = _extend_bidirected(graph, [(noeud, False)], visites)
+        yield [(autre, not sens) for autre, sens in reversed(arriere[1:])]\
+        + avant
+
+def bidirected_path_sequence(graph, chemin):
+    """Retourne la séquence épelée par un chemin de noeuds orientés."""
+    morceaux = []
+    for noeud, sens in chemin:
+        sequence = noeud if sens else reverse_complement(noeud)
+        morceaux.append(sequence if not morceaux\
+                        else sequence[node_overlap(graph, noeud):])
+    return "".join(morceaux)
+
+def get_contigs_bidirected(graph, couverture=False):
+    """Génère les contigs (unitigs) d'un graph bidirigé (voir
+    bidirected_unitig_paths), sous forme de tuples (séquence, taille)
+    complétés de la couverture comme dans iter_contigs : poids des
+    arêtes parcourues, dans leur orientation (voir _oriented_weight), si
+    couverture vaut True, comptes des k-mers (canoniques) si c'est la
+    table des k-mers.
+    """
+    for chemin in bidirected_unitig_paths(graph):
+        contig = bidirected_path_sequence(graph, chemin)
+        if couverture is True:
+            yield (contig, len(contig)) + weight_coverage(\
+                graph, [noeud for noeud, _ in chemin],\
+                [_oriented_weight(graph, source, cible)\
+                 for source, cible in zip(chemin, chemin[1:])])
+        elif couverture is not False:
+            yield (contig, len(contig)) + kmer_coverage(couverture, contig)
+        else:
+            yield contig, len(contig)
+
+def compact_bidirected(graph):
+    """Fusionne les unitigs d'un graph bidirigé en un seul noeud, nommé
+    par la forme canonique de leur séquence (voir compact_graph pour
+    les attributs gardés).
+
+    Les arêtes internes aux unitigs disparaissent ; les autres relient
+    les unitigs avec l'orientation sous laquelle chacun est lu.
+    """
+    chemins = list(bidirected_unitig_paths(graph))
+    compact = nx.DiGraph(**graph.graph)
+    if "chevauchement" not in compact.graph and graph.number_of_nodes():
+        compact.graph["chevauchement"] = len(next(iter(graph.nodes))) - 1
+    places = {}
+    noms = []
+    directs = []
+    for numero, chemin in enumerate(chemins):
+        poids_total = 0
+        nbre_aretes = 0
+        histogramme = {}
+        for indice, (noeud, sens) in enumerate(chemin):
+            places[noeud] = (numero, indice, sens)
+            donnees = graph.nodes[noeud]
+            poids_total += donnees.get("poids_total", 0)
+            nbre_aretes += donnees.get("nbre_aretes", 0)
+            for poids, nombre in donnees.get("histogramme_poids", {}).items():
+                histogramme[poids] = histogramme.get(poids, 0) + nombre
+        for source, cible in zip(chemin, chemin[1:]):
+            poids = _oriented_weight(graph, source, cible)
+            poids_total += poids
+            nbre_aretes += 1
+            histogramme[poids] = histogramme.get(poids, 0) + 1
+        sequence = bidirected_path_sequence(graph, chemin)
+        nom = canonical_kmer(sequence)
+        compact.add_node(nom, longueur=len(sequence), poids_total=poids_total,\
+                         nbre_aretes=nbre_aretes, histogramme_poids=histogramme)
+        noms.append(nom)
+        directs.append(nom == sequence)
+    for noeud, suivant, donnees in graph.edges(data=True):
+        numero, indice, sens_chemin = places[noeud]
+        numero_suivant, indice_suivant, sens_chemin_suivant = places[suivant]
+        for (sens, sens_suivant), poids in donnees["orientations"].items():
+            dans_le_sens = sens == sens_chemin
+            #Une arête interne relie deux noeuds consécutifs de l'unitig,
+            #lus dans le sens du chemin ou dans le sens inverse.
+            if numero == numero_suivant\
+            and dans_le_sens == (sens_suivant == sens_chemin_suivant)\
+            and indice_suivant == indice + (1 if dans_le_sens else -1):
+                continue
+            orientation = (directs[numero] == dans_le_sens,\
+                           directs[numero_suivant]\
+                           == (sens_suivant == sens_chemin_suivant))
+            source, cible = noms[numero], noms[numero_suivant]
+            if compact.has_edge(source, cible):
+                arete = compact.edges[source, cible]
+                arete["orientations"][orientation] =\
+                arete["orientations"].get(orientation, 0) + poids
+                arete["weight"] += poids
+            else:
+                compact.add_edge(source, cible, weight=poids,\
+                                 orientations={orientation: poids})
+    return compact
+
+def _oriented_weight(graph, source, cible):
+    """Poids de l'arête orientée source -> cible (noeuds orientés) d'un
+    graph bidirigé, lue dans un sens ou dans l'autre (voir
+    bidirected_successors) ; 0 si elle n'existe pas.
+    """
+    (noeud, sens), (suivant, sens_suivant) = source, cible
+    poids = 0
+    if graph.has_edge(noeud, suivant):
+        poids += graph.edges[noeud, suivant]["orientations"].get(\
+            (sens, sens_suivant), 0)
+    if graph.has_edge(suivant, noeud):
+        poids += graph.edges[suivant, noeud]["orientations"].get(\
+            (not sens_suivant, not sens), 0)
+    return poids
+
+class _VueNoeudsOrientes:
+    """Vue sur les noeuds orientés d'un OrientedGraph : chaque noeud du
+    graph bidirigé y apparaît dans les deux sens et partage ses
+    attributs entre eux.
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False):
+        if data:
+            return [(noeud, self[noeud]) for noeud in self]
+        return self
+
+    def __iter__(self):
+        for noeud in list(self._graph.nodes):
+            yield noeud, True
+            yield noeud, False
+
+    def __len__(self):
+        return 2 * self._graph.number_of_nodes()
+
+    def __contains__(self, noeud):
+        return noeud[0] in self._graph.nodes
+
+    def __getitem__(self, noeud):
+        return self._graph.nodes[noeud[0]]
+
+class _VueAretesOrientees:
+    """Vue sur les arêtes d'un OrientedGraph, indexable comme
+    graph.edges[u, v] (poids seulement).
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __contains__(self, arete):
+        return _oriented_weight(self._graph, *arete) > 0
+
+    def __getitem__(self, arete):
+        poids = _oriented_weight(self._graph, *arete)
+        if not poids:
+            raise KeyError(arete)
+        return {"weight": poids}
+
+class OrientedGraph:
+    """Vue orientée d'un graph bidirigé (voir build_bidirected_graph).
+
+    Les noeuds sont les couples (noeud, sens) et les arêtes celles
+    données par bidirected_successors : la vue se parcourt comme un
+    graph orienté, si bien que simplify_bubbles, pop_bubbles et
+    clip_tips s'y appliquent telles quelles (sans DegreeIndex, voir
+    clean_stage). Retirer un noeud orienté retire son (k-1)-mer du
+    graph bidirigé, c'est-à-dire aussi le noeud de sens opposé : une
+    bulle ou une pointe, vue sur les deux brins, n'est retirée qu'une
+    fois.
+    """
+
+    def __init__(self, graph):
+        self.bidirige = graph
+        self.graph = graph.graph
+        self.nodes = _VueNoeudsOrientes(graph)
+        self.edges = _VueAretesOrientees(graph)
+
+    def successors(self, noeud):
+        return bidirected_successors(self.bidirige, *noeud)
+
+    def predecessors(self, noeud):
+        return [(precedent, not sens) for precedent, sens\
+                in bidirected_successors(self.bidirige, noeud[0], not noeud[1])]
+
+    def out_degree(self, noeud):
+        return len(self.successors(noeud))
+
+    def in_degree(self, noeud):
+        return len(self.predecessors(noeud))
+
+    def has_edge(self, source, cible):
+        return cible in self.successors(source)
+
+    def remove_node(self, noeud):
+        self.bidirige.remove_node(noeud[0])
+
+    def number_of_nodes(self):
+        return 2 * self.bidirige.number_of_nodes()
+
+def node_overlap(graph, noeud):
+    """Retourne le nombre de caractères qu'un noeud partage avec son
+    prédécesseur dans un chemin (k-2 pour un graph de De Bruijn).
+    """
+    return graph.graph.get("chevauchement", len(noeud) - 1)
+
+def _compactable(graph, noeud, suivant):
+    """Indique si l'arête noeud -> suivant est interne à un unitig."""
+    return noeud != suivant and graph.out_degree(noeud) == 1\
+    and graph.in_degree(suivant) == 1
+
+def _unitig_start(graph, noeud):
+    """Indique si un noeud commence un unitig (son arête entrante,
+    s'il n'en a qu'une, ne peut pas être fusionnée).
+    """
+    if graph.in_degree(noeud) != 1:
+        return True
+    precedent = next(iter(graph.predecessors(noeud)))
+    return not _compactable(graph, precedent, noeud)
+
+def _extend_unitig(graph, depart, vus):
+    """Prolonge l'unitig commençant à depart tant que ses arêtes sont
+    fusionnables, en marquant ses noeuds comme vus.
+    """
+    chemin = [depart]
+    vus.add(depart)
+    while graph.out_degree(chemin[-1]) == 1:
+        suivant = next(iter(graph.successors(chemin[-1])))
+        if suivant in vus or not _compactable(graph, chemin[-1], suivant):
+            break
+        vus.add(suivant)
+        chemin.append(suivant)
+    return chemin
+
+def unitig_paths(graph, noeuds=None):
+    """Génère les chemins non branchés maximaux (unitigs) du graph (ou
+    des composantes formées par noeuds), chacun sous forme de liste de
+    noeuds ; chaque noeud appartient à exactement un unitig.
+    """
+    if noeuds is None:
+        noeuds = graph.nodes
+    vus = set()
+    #Les unitigs commencent aux noeuds dont l'arête entrante n'est pas
+    #fusionnable.
+    for depart in [noeud for noeud in noeuds if _unitig_start(graph, noeud)]:
+        if depart not in vus:
+            yield _extend_unitig(graph, depart, vus)
+    #Les noeuds restants forment des cycles isolés, que l'on ouvre à leur
+    #plus petit noeud pour que leur séquence ne dépende pas de l'ordre
+    #du graph.
+    for depart in sorted(noeud for noeud in noeuds if noeud not in vus):
+        if depart not in vus:
+            yield _extend_unitig(graph, depart, vus)
 
-def get_starting_nodes(graph):
-    """Fonction qui permet de relever les noeuds d'entrée."""
+def path_sequence(graph, chemin):
+    """Retourne la séquence épelée par un chemin de noeuds."""
+    morceaux = [chemin[0]]
+    for noeud in chemin[1:]:
+        morceaux.append(noeud[node_overlap(graph, noeud):])
+    return "".join(morceaux)
+
+def _chain_heads(precedent):
+    """Pour des chaînes données par le prédécesseur de chaque élément
+    (-1 en début de chaîne), retourne le début de la chaîne de chaque
+    élément et son rang dans celle-ci, par sauts de pointeurs (une passe
+    par doublement de la distance). Un élément d'un cycle reste sur un
+    autre élément du cycle.
+    """
+    tetes = np.where(precedent < 0, np.arange(len(precedent)), precedent)
+    rangs = (precedent >= 0).astype(np.int64)
+    for _ in range(max(1, len(precedent).bit_length())):
+        suivantes = tetes[tetes]
+        if np.array_equal(suivantes, tetes):
+            break
+        rangs += rangs[tetes]
+        tetes = suivantes
+    return tetes, rangs
+
+def _compact_array_graph(graph, noeuds=None):
+    """compact_graph pour un ArrayGraph, sur ses tableaux d'arêtes.
+
+    Chaque noeud remonte au début de son unitig par sauts de pointeurs
+    (voir _chain_heads) ; les séquences, poids et histogrammes des
+    unitigs sont ensuite assemblés par lots. Le résultat (ordre des
+    noeuds et des arêtes compris) est celui du parcours de compact_graph.
+    """
+    graph._construire()
+    nbre_noeuds = graph._nbre_noeuds
+    if noeuds is None:
+        selection = np.flatnonzero(graph._actifs[:nbre_noeuds])
+    else:
+        selection = np.array([identifiant for identifiant\
+                              in map(graph._identifiant, noeuds)\
+                              if identifiant is not None], dtype=np.int64)
+    choisis = np.zeros(nbre_noeuds, dtype=bool)
+    choisis[selection] = True
+    aretes = np.flatnonzero(graph._aretes_actives[:graph._nbre_aretes])
+    aretes = aretes[choisis[graph._sources[aretes]]]
+    sources, cibles = graph._sources[aretes], graph._cibles[aretes]
+    poids = graph._poids[aretes]
+    #Arêtes internes aux unitigs (voir _compactable) : chaque noeud en
+    #a au plus une entrante et une sortante.
+    internes = (sources != cibles) & (graph._degres_sortants[sources] == 1)\
+    & (graph._degres_entrants[cibles] == 1)
+    precedent = np.full(nbre_noeuds, -1, dtype=np.int64)
+    precedent[cibles[internes]] = sources[internes]
+    poids_entrant = np.zeros(nbre_noeuds, dtype=np.int64)
+    poids_entrant[cibles[internes]] = poids[internes]
+    debuts = selection[precedent[selection] < 0].tolist()
+    tetes, rangs = _chain_heads(precedent)
+    cycliques = selection[precedent[tetes[selection]] >= 0]
+    if len(cycliques):
+        #Les cycles isolés sont ouverts à leur plus petit noeud, comme
+        #dans unitig_paths.
+        suivant = np.full(nbre_noeuds, -1, dtype=np.int64)
+        suivant[sources[internes]] = cibles[internes]
+        vus = set()
+        for depart in sorted(cycliques.tolist(), key=graph._nom):
+            if depart in vus:
+                continue
+            noeud = depart
+            while noeud not in vus:
+                vus.add(noeud)
+                noeud = int(suivant[noeud])
+            precedent[depart] = -1
+            debuts.append(depart)
+        tetes, rangs = _chain_heads(precedent)
+    numeros = np.full(nbre_noeuds, -1, dtype=np.int64)
+    numeros[debuts] = np.arange(len(debuts))
+    #Noeuds rangés unitig par unitig, dans l'ordre du chemin.
+    ordre = selection[np.lexsort((rangs[selection], numeros[tetes[selection]]))]
+    unitigs = numeros[tetes[ordre]]
+    premiers = rangs[ordre] == 0
+    longueurs = graph._bornes[ordre + 1] - graph._bornes[ordre]
+    if "chevauchement" in graph.graph:
+        sauts = np.where(premiers, 0, graph.graph["chevauchement"])
+    else:
+        sauts = np.where(premiers, 0, longueurs - 1)
+    pris = longueurs - sauts
+    decalages = graph._bornes[ordre] + sauts - (np.cumsum(pris) - pris)
+    lettres = graph._lettres[np.repeat(decalages, pris) + np.arange(pris.sum())]
+    segments = np.flatnonzero(premiers)
+    longueurs_unitigs = np.add.reduceat(pris, segments) if len(segments)\
+    else np.zeros(0, dtype=np.int64)
+    poids_internes = np.where(premiers, 0, poids_entrant[ordre])
+    poids_totaux = (np.add.reduceat(poids_internes, segments) if len(segments)\
+                    else np.zeros(0, dtype=np.int64)).tolist()
+    nbre_aretes = (np.diff(np.append(segments, len(ordre))) - 1).tolist()
+    histogrammes = [{} for _ in debuts]
+    #Couples (unitig, poids) des arêtes internes, codés en un entier.
+    base = int(poids_internes.max(initial=0)) + 1
+    couples, nombres = np.unique(unitigs[~premiers] * base\
+                                 + poids_internes[~premiers], return_counts=True)
+    for couple, nombre in zip(couples.tolist(), nombres.tolist()):
+        histogrammes[couple // base][couple % base] = nombre
+    #Attributs hérités d'une compaction précédente.
+    for identifiant, donnees in graph._attributs.items():
+        if not choisis[identifiant] or not graph._actifs[identifiant]:
+            continue
+        unitig = int(numeros[tetes[identifiant]])
+        poids_totaux[unitig] += donnees.get("poids_total", 0)
+        nbre_aretes[unitig] += donnees.get("nbre_aretes", 0)
+        for valeur, nombre in donnees.get("histogramme_poids", {}).items():
+            histogrammes[unitig][valeur] = histogrammes[unitig].get(valeur, 0)\
+            + nombre
+    gardees = ~(internes & (rangs[cibles] > 0))
+    compact = ArrayGraph.from_edges(lettres, longueurs_unitigs,\
+                                    numeros[tetes[sources[gardees]]],\
+                                    numeros[tetes[cibles[gardees]]],\
+                                    poids[gardees], **graph.graph)
+    compact._attributs = {unitig: {"longueur": longueur, "poids_total": total,\
+                                   "nbre_aretes": nombre,\
+                                   "histogramme_poids": histogramme}\
+                          for unitig, (longueur, total, nombre, histogramme)\
+                          in enumerate(zip(longueurs_unitigs.tolist(),\
+                                           poids_totaux, nbre_aretes,\
+                                           histogrammes))}
+    if "chevauchement" not in compact.graph and debuts:
+        compact.graph["chevauchement"] = int(longueurs[0]) - 1
+    return compact
+
+def compact_graph(graph, noeuds=None):
+    """Fusionne les chemins non branchés maximaux (unitigs) du graph en
+    un seul noeud.
+
+    Chaque unitig est nommé par sa séquence et garde la longueur, la
+    somme ("poids_total") et le nombre ("nbre_aretes") des poids des
+    arêtes qu'il contient, ce qui permet à path_average_weight de
+    calculer exactement le même poids moyen que sur le graph initial,
+    ainsi que l'histogramme de ces poids ("histogramme_poids", poids ->
+    nombre d'arêtes) dont path_coverage tire la médiane exacte.
+    Le graph peut être compacté de nouveau après un nettoyage. Si
+    noeuds est donné, seules les composantes qu'ils forment (voir
+    clean_stage) sont compactées et renvoyées.
+
+    Un ArrayGraph est compacté directement sur ses tableaux (voir
+    _compact_array_graph).
+    """
+    if isinstance(graph, ArrayGraph):
+        return _compact_array_graph(graph, noeuds)
+    if noeuds is not None:
+        noeuds = [noeud for noeud in noeuds if noeud in graph.nodes]
+    unitigs = list(unitig_paths(graph, noeuds))
+    unitig_de = {}
+    for numero, chemin in enumerate(unitigs):
+        for noeud in chemin:
+            unitig_de[noeud] = numero
+    compact = graph.__class__(**graph.graph)
+    noms = []
+    for chemin in unitigs:
+        poids_total = graph.nodes[chemin[0]].get("poids_total", 0)
+        nbre_aretes = graph.nodes[chemin[0]].get("nbre_aretes", 0)
+        histogramme = dict(graph.nodes[chemin[0]].get("histogramme_poids", {}))
+        for precedent, noeud in zip(chemin, chemin[1:]):
+            poids = graph.edges[precedent, noeud]["weight"]
+            poids_total += graph.nodes[noeud].get("poids_total", 0) + poids
+            nbre_aretes += graph.nodes[noeud].get("nbre_aretes", 0) + 1
+            histogramme[poids] = histogramme.get(poids, 0) + 1
+            for poids, nombre in graph.nodes[noeud].get("histogramme_poids",\
+                                                        {}).items():
+                histogramme[poids] = histogramme.get(poids, 0) + nombre
+        sequence = path_sequence(graph, chemin)
+        compact.add_node(sequence, longueur=len(sequence),\
+                         poids_total=poids_total, nbre_aretes=nbre_aretes,\
+                         histogramme_poids=histogramme)
+        noms.append(sequence)
+    aretes = graph.edges(data=True) if noeuds is None\
+    else ((noeud, suivant, graph.edges[noeud, suivant]) for noeud in noeuds\
+          for suivant in list(graph.successors(noeud)))
+    for noeud, suivant, donnees in aretes:
+        if unitig_de[noeud] != unitig_de[suivant] or suivant == unitigs[\
+        unitig_de[suivant]][0]:
+            compact.add_edge(noms[unitig_de[noeud]], noms[unitig_de[suivant]],\
+                             weight=donnees["weight"])
+    if "chevauchement" not in compact.graph and unitigs:
+        compact.graph["chevauchement"] = len(unitigs[0][0]) - 1
+    return compact
+
+def save_graph(graph, nom_fichier):
+    """Sauvegarde un graph (networkx ou ArrayGraph) dans un fichier
+    binaire (archive numpy .npz) : séquences des noeuds concaténées,
+    arêtes (identifiants et poids), masques des noeuds et arêtes
+    supprimés, attributs entiers des noeuds, histogrammes des noeuds
+    (voir compact_graph : clés, valeurs et nombre d'entrées de chaque
+    noeud) et attributs du graph.
+
+    Le graph bidirigé (mode canonique) n'est pas pris en charge.
+    """
+    if graph.graph.get("bidirige"):
+        raise ValueError("Le graph bidirigé ne peut pas être sauvegardé")
+    if isinstance(graph, ArrayGraph):
+        backend = "array"
+        nbre_noeuds = graph._nbre_noeuds
+        lettres = graph._lettres[:graph._bornes[nbre_noeuds]]
+        longueurs = np.diff(graph._bornes[:nbre_noeuds + 1])
+        actifs = graph._actifs[:nbre_noeuds]
+        nbre = graph._nbre_aretes
+        sources, cibles = graph._sources[:nbre], graph._cibles[:nbre]
+        poids, aretes_actives = graph._poids[:nbre], graph._aretes_actives[:nbre]
+        attributs = graph._attributs
+    else:
+        backend = "networkx"
+        noms = list(graph.nodes)
+        nbre_noeuds = len(noms)
+        lettres = np.frombuffer("".join(noms).encode("ascii"), dtype=np.uint8)
+        longueurs = np.array([len(nom) for nom in noms], dtype=np.int64)
+        ids = {noeud: identifiant for identifiant, noeud in enumerate(noms)}
+        actifs = np.ones(nbre_noeuds, dtype=bool)
+        aretes = list(graph.edges(data="weight"))
+        sources = np.array([ids[arete[0]] for arete in aretes], dtype=np.int64)
+        cibles = np.array([ids[arete[1]] for arete in aretes], dtype=np.int64)
+        poids = np.array([arete[2] for arete in aretes], dtype=np.int64)
+        aretes_actives = np.ones(len(aretes), dtype=bool)
+        attributs = {ids[noeud]: donnees for noeud, donnees\
+                     in graph.nodes(data=True) if donnees}
+    tableaux = {"backend": np.array(backend),\
+                "attributs_graph": np.array(json.dumps(graph.graph)),\
+                "sequences": lettres, "longueurs": longueurs,\
+                "actifs": actifs, "sources": sources, "cibles": cibles,\
+                "poids": poids, "aretes_actives": aretes_actives}
+    for cle in sorted({cle for donnees in attributs.values() for cle in donnees}):
+        if any(isinstance(donnees.get(cle), dict) for donnees in attributs.values()):
+            tailles = np.zeros(nbre_noeuds, dtype=np.int64)
+            presents = np.zeros(nbre_noeuds, dtype=bool)
+            cles, valeurs = [], []
+            for identifiant in sorted(attributs):
+                if cle in attributs[identifiant]:
+                    histogramme = attributs[identifiant][cle]
+                    tailles[identifiant] = len(histogramme)
+                    presents[identifiant] = True
+                    cles.extend(histogramme.keys())
+                    valeurs.extend(histogramme.values())
+            tableaux["histogramme_" + cle] = np.array([cles, valeurs],\
+                                                      dtype=np.int64).reshape(2, -1)
+            tableaux["tailles_" + cle] = tailles
+            tableaux["present_" + cle] = presents
+            continue
+        valeurs = np.zeros(nbre_noeuds, dtype=np.int64)
+        presents = np.zeros(nbre_noeuds, dtype=bool)
+        for identifiant, donnees in attributs.items():
+            if cle in donnees:
+                valeurs[identifiant] = donnees[cle]
+                presents[identifiant] = True
+        tableaux["attribut_" + cle] = valeurs
+        tableaux["present_" + cle] = presents
+    with open(nom_fichier, "wb") as fichier_sortie:
+        np.savez(fichier_sortie, **tableaux)
+
+def load_graph(nom_fichier):
+    """Recharge un graph sauvegardé par save_graph, dans la même
+    représentation (networkx ou ArrayGraph).
+    """
+    with np.load(nom_fichier) as donnees:
+        tableaux = {cle: donnees[cle] for cle in donnees.files}
+    attributs = {}
+    for cle in tableaux:
+        if cle.startswith("attribut_"):
+            nom_attribut = cle[len("attribut_"):]
+            valeurs = tableaux[cle].tolist()
+            for identifiant in np.flatnonzero(tableaux["present_" + nom_attribut]):
+                attributs.setdefault(int(identifiant), {})[nom_attribut] =\
+                valeurs[identifiant]
+        elif cle.startswith("histogramme_"):
+            nom_attribut = cle[len("histogramme_"):]
+            cles, valeurs = tableaux[cle].tolist()
+            tailles = tableaux["tailles_" + nom_attribut]
+            debuts = (np.cumsum(tailles) - tailles).tolist()
+            for identifiant in np.flatnonzero(tableaux["present_" + nom_attribut]):
+                debut = debuts[identifiant]
+                fin = debut + int(tailles[identifiant])
+                attributs.setdefault(int(identifiant), {})[nom_attribut] =\
+                dict(zip(cles[debut:fin], valeurs[debut:fin]))
+    attributs_graph = json.loads(str(tableaux["attributs_graph"]))
+    actifs = tableaux["actifs"]
+    aretes_actives = tableaux["aretes_actives"]
+    if str(tableaux["backend"]) == "array":
+        graph = ArrayGraph.from_edges(tableaux["sequences"], tableaux["longueurs"],\
+                                      tableaux["sources"], tableaux["cibles"],\
+                                      tableaux["poids"], **attributs_graph)
+        graph._actifs = actifs.copy()
+        graph._aretes_actives = aretes_actives.copy()
+        graph._attributs = attributs
+        return graph
+    sequences = tableaux["sequences"].tobytes().decode("ascii")
+    fins = np.cumsum(tableaux["longueurs"]).tolist()
+    noms = [sequences[debut:fin] for debut, fin in zip([0] + fins, fins)]
+    graph = nx.DiGraph(**attributs_graph)
+    for identifiant in np.flatnonzero(actifs):
+        graph.add_node(noms[identifiant], **attributs.get(int(identifiant), {}))
+    graph.add_weighted_edges_from(\
+        (noms[source], noms[cible], poids) for source, cible, poids\
+        in zip(tableaux["sources"][aretes_actives].tolist(),\
+               tableaux["cibles"][aretes_actives].tolist(),\
+               tableaux["poids"][aretes_actives].tolist()))
+    return graph
+
+
+class DegreeIndex:
+    """Index des noeuds d'entrée (aucun prédécesseur), de sortie (aucun
+    successeur) et de branchement (plus d'un prédécesseur ou plus d'un
+    successeur) d'un graph.
+
+    L'index est construit en un parcours du graph puis tenu à jour à
+    chaque suppression de noeud faite par son intermédiaire (voir
+    remove_paths) : seuls les voisins du noeud supprimé sont
+    reclassés. Ces voisins forment la "frontière", c'est-à-dire les
+    noeuds dont le voisinage a changé depuis le dernier appel à
+    pop_frontier.
+
+    Si noeuds est donné, seuls ces noeuds sont indexés : ils doivent
+    former une union de composantes du graph (voir clean_stage).
+    """
+
+    def __init__(self, graph, noeuds=None):
+        self.graph = graph
+        self.entrees = set()
+        self.sorties = set()
+        self.branchements_entrants = set()
+        self.branchements_sortants = set()
+        self.frontiere = set()
+        for noeud in graph.nodes if noeuds is None else noeuds:
+            self._classer(noeud)
+
+    def _classer(self, noeud):
+        """Place un noeud dans les ensembles correspondant à ses degrés."""
+        degre_entrant = self.graph.in_degree(noeud)
+        degre_sortant = self.graph.out_degree(noeud)
+        for ensemble, present in ((self.entrees, degre_entrant == 0),
+                                  (self.sorties, degre_sortant == 0),
+                                  (self.branchements_entrants, degre_entrant > 1),
+                                  (self.branchements_sortants, degre_sortant > 1)):
+            if present:
+                ensemble.add(noeud)
+            else:
+                ensemble.discard(noeud)
+
+    def _ordonner(self, noeuds):
+        """Retourne des noeuds triés par nom : les bulles et pointes
+        retenues ne dépendent pas de l'ordre des noeuds du graph.
+        """
+        return sorted(noeuds)
+
+    def starting_nodes(self):
+        return self._ordonner(self.entrees)
+
+    def sink_nodes(self):
+        return self._ordonner(self.sorties)
+
+    def branching_nodes(self, entrants=True):
+        """Noeuds à plusieurs prédécesseurs (ou successeurs si
+        entrants vaut False), triés par nom.
+        """
+        if entrants:
+            return self._ordonner(self.branchements_entrants)
+        return self._ordonner(self.branchements_sortants)
+
+    def remove_node(self, noeud):
+        """Supprime un noeud du graph et met l'index à jour."""
+        voisins = set(self.graph.predecessors(noeud))
+        voisins.update(self.graph.successors(noeud))
+        voisins.discard(noeud)
+        self.graph.remove_node(noeud)
+        for ensemble in (self.entrees, self.sorties, self.branchements_entrants,
+                         self.branchements_sortants, self.frontiere):
+            ensemble.discard(noeud)
+        for voisin in voisins:
+            self._classer(voisin)
+        self.frontiere.update(voisins)
+
+    def pop_frontier(self):
+        """Retourne (triée par nom) puis vide la frontière."""
+        frontiere = self._ordonner(self.frontiere)
+        self.frontiere = set()
+        return frontiere
+
+def get_starting_nodes(graph, index=None):
+    """Fonction qui permet de relever les noeuds d'entrée.
+
+    Si un DegreeIndex est fourni, les noeuds sont lus dans l'index
+    au lieu de parcourir tout le graph.
+    """
+    if index is not None:
+        return index.starting_nodes()
     noeuds_entree = []
     for noeud in graph.nodes:
-        if len(list(graph.predecessors(noeud))) == 0:
+        if graph.in_degree(noeud) == 0:
             noeuds_entree.append(noeud)
     return noeuds_entree
 
-def get_sink_nodes(graph):
+def get_sink_nodes(graph, index=None):
     """Fonction qui permet de relever les noeuds de sortie."""
+    if index is not None:
+        return index.sink_nodes()
     noeuds_sortie = []
     for noeud in graph.nodes:
-        if len(list(graph.successors(noeud))) == 0:
+        if graph.out_degree(noeud) == 0:
             noeuds_sortie.append(noeud)
     return noeuds_sortie
 
@@ -85,50 +2676,499 @@ def get_contigs(graph, debuts, fins):
     contigs = []
     for noeud_depart in debuts:
         for noeud_fin in fins:
-            for path in nx.all_simple_paths(graph,\
-            source=noeud_depart, target=noeud_fin):
-                prep_contig = path
-                contig_ecrit = prep_contig[0]
-                for i in range(1, len(prep_contig)):
-                    contig_ecrit += prep_contig[i][-1:]
+            for path in simple_paths(graph,\
+            noeud_depart, noeud_fin):
+                contig_ecrit = path_sequence(graph, path)
                 contigs.append((contig_ecrit, len(contig_ecrit)))
     return contigs
 
-def fill(text, width=80):
-    """Split text with a line return to respect fasta format"""
-    return os.linesep.join(text[i:i+width] for i in range(0, len(text), width))
+def path_coverage(graph, chemin):
+    """Retourne la couverture moyenne et médiane (en k-mers) d'un
+    chemin : poids de ses arêtes et de celles fusionnées dans ses
+    noeuds (voir compact_graph).
+
+    La médiane est tirée des histogrammes des poids des noeuds
+    compactés ; elle vaut None si l'un d'eux n'en a pas (graph compacté
+    par une version antérieure), plutôt que d'être approchée.
+    """
+    return weight_coverage(graph, chemin,\
+                           [graph.edges[precedent, noeud]["weight"]\
+                            for precedent, noeud in zip(chemin, chemin[1:])])
 
-def save_contigs(liste_contigs, nom_fichier):
+def weight_coverage(graph, chemin, poids_aretes):
+    """Calcul de path_coverage à partir des noeuds d'un chemin et des
+    poids des arêtes qui les relient.
+    """
+    histogramme = {}
+    for noeud in chemin:
+        donnees = graph.nodes[noeud]
+        if donnees.get("nbre_aretes", 0) and histogramme is not None:
+            if "histogramme_poids" not in donnees:
+                histogramme = None
+                continue
+            for poids, nombre in donnees["histogramme_poids"].items():
+                histogramme[poids] = histogramme.get(poids, 0) + nombre
+    poids_total = sum(graph.nodes[noeud].get("poids_total", 0)\
+                      for noeud in chemin)
+    nbre = sum(graph.nodes[noeud].get("nbre_aretes", 0) for noeud in chemin)
+    for poids in poids_aretes:
+        poids_total += poids
+        nbre += 1
+        if histogramme is not None:
+            histogramme[poids] = histogramme.get(poids, 0) + 1
+    if not nbre:
+        return 0.0, 0.0
+    if histogramme is None:
+        return poids_total / nbre, None
+    #Médiane : valeurs de rangs (nbre - 1) // 2 et nbre // 2.
+    rangs = [(nbre - 1) // 2, nbre // 2]
+    milieux = []
+    cumul = 0
+    for poids, nombre in sorted(histogramme.items()):
+        cumul += nombre
+        while rangs and rangs[0] < cumul:
+            milieux.append(poids)
+            rangs.pop(0)
+    return poids_total / nbre, (milieux[0] + milieux[1]) / 2
+
+def kmer_coverage(kmer_counts, sequence):
+    """Retourne la couverture moyenne et médiane d'une séquence : les
+    comptes de ses k-mers dans kmer_counts (KmerCounts), c'est-à-dire
+    les poids des arêtes qu'elle parcourt avant toute compaction.
+    """
+    if len(kmer_counts.codes) == 0:
+        return 0.0, 0.0
+    codes = encode_sequences([sequence], kmer_counts.taille_kmer,\
+                             kmer_counts.canonique)
+    indices = np.minimum(np.searchsorted(kmer_counts.codes, codes),\
+                         len(kmer_counts.codes) - 1)
+    comptes = kmer_counts.comptes[indices][kmer_counts.codes[indices] == codes]
+    if len(comptes) == 0:
+        return 0.0, 0.0
+    return float(np.mean(comptes)), float(np.median(comptes))
+
+def iter_contigs(graph, couverture=False):
+    """Génère les contigs du graph, un par chemin non branché maximal,
+    sous forme de tuples (séquence, taille).
+
+    Si couverture vaut True, chaque tuple porte aussi la couverture
+    moyenne et médiane du contig, calculées à partir des poids des
+    arêtes parcourues (voir path_coverage) ; si couverture est la table
+    des k-mers ayant servi à construire le graph, à partir des comptes
+    de ses k-mers (voir kmer_coverage).
+
+    Contrairement à get_contigs, chaque noeud n'est parcouru qu'une
+    fois : le coût est linéaire même s'il reste des embranchements.
+    """
+    for chemin in unitig_paths(graph):
+        contig = path_sequence(graph, chemin)
+        if couverture is True:
+            yield (contig, len(contig)) + path_coverage(graph, chemin)
+        elif couverture is not False:
+            yield (contig, len(contig)) + kmer_coverage(couverture, contig)
+        else:
+            yield contig, len(contig)
+
+class BgzfWriter:
+    """Fichier binaire compressé au format BGZF (bgzip) : une suite de
+    membres gzip d'au plus TAILLE_BLOC_BGZF octets décompressés, lisible
+    par gzip et indexable par les outils htslib.
+    """
+
+    def __init__(self, nom_fichier, niveau=NIVEAU_COMPRESSION):
+        self._fichier = open(nom_fichier, "wb")
+        self.niveau = niveau
+        self._tampon = bytearray()
+
+    def _ecrire_bloc(self, donnees):
+        """Écrit un bloc BGZF (entête gzip avec le champ BC donnant la
+        taille du bloc, données compressées, CRC et taille)."""
+        compresseur = zlib.compressobj(self.niveau, zlib.DEFLATED, -15)
+        compresse = compresseur.compress(donnees) + compresseur.flush()
+        self._fichier.write(struct.pack("<BBBBIBBHBBHH", 31, 139, 8, 4, 0, 0,\
+                                        255, 6, 66, 67, 2, len(compresse) + 25))
+        self._fichier.write(compresse)
+        self._fichier.write(struct.pack("<II", zlib.crc32(donnees),\
+                                        len(donnees)))
+
+    def write(self, donnees):
+        self._tampon += donnees
+        while len(self._tampon) >= TAILLE_BLOC_BGZF:
+            self._ecrire_bloc(bytes(self._tampon[:TAILLE_BLOC_BGZF]))
+            del self._tampon[:TAILLE_BLOC_BGZF]
+
+    def close(self):
+        """Écrit les données restantes et le bloc vide de fin de fichier."""
+        if self._tampon:
+            self._ecrire_bloc(bytes(self._tampon))
+        self._ecrire_bloc(b"")
+        self._fichier.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+def open_output(nom_fichier, compression=None):
+    """Ouvre un fichier de sortie en écriture binaire, compressé si
+    compression vaut "gzip" ou "bgzip" (par défaut : d'après
+    l'extension, .gz ou .bgz).
+    """
+    if compression is None:
+        compression = {".gz": "gzip", ".bgz": "bgzip"}.get(\
+            os.path.splitext(nom_fichier)[1])
+    if compression == "gzip":
+        return gzip.open(nom_fichier, "wb", compresslevel=NIVEAU_COMPRESSION)
+    if compression == "bgzip":
+        return BgzfWriter(nom_fichier)
+    return open(nom_fichier, "wb")
+
+def save_contigs(liste_contigs, nom_fichier, largeur=80, compression=None,\
+                 fichier_stats=None):
     """Cette fonction permet d'exporter les contigs dans un fichier
     au format FASTA
+
+    liste_contigs peut être un générateur (voir iter_contigs) : chaque
+    contig est écrit dès qu'il est produit. Les contigs donnés avec
+    leur couverture (voir iter_contigs) la portent dans leur entête ;
+    une couverture absente ou None est omise. Le texte est accumulé
+    dans un tampon écrit par gros blocs, les lignes de largeur bases
+    étant découpées dans une memoryview de la séquence sans copie
+    intermédiaire ; avec une largeur de 0 chaque séquence tient sur une
+    seule ligne. Le fichier peut être compressé (voir open_output).
+
+    Si fichier_stats est donné, le résumé de l'assemblage y est écrit
+    (voir contig_stats). Retourne le nombre de contigs écrits.
+    """
+    if largeur < 0:
+        raise ValueError("largeur de ligne négative : {}".format(largeur))
+    longueurs = []
+    couvertures = []
+    tampon = bytearray()
+    with open_output(nom_fichier, compression) as fichier_sortie:
+        for numero, (contig, longueur, *couverture) in enumerate(liste_contigs):
+            moyenne = couverture[0] if couverture else None
+            #La médiane est omise lorsqu'elle n'est pas connue
+            #exactement (voir path_coverage).
+            mediane = couverture[1] if len(couverture) > 1 else None
+            entete = ">contig_{0} len={1}".format(numero, longueur)
+            if moyenne is not None:
+                entete += " cov_mean={0:.2f}".format(moyenne)
+                if mediane is not None:
+                    entete += " cov_median={0:.2f}".format(mediane)
+            tampon += (entete + "\n").encode("ascii")
+            couvertures.append(moyenne)
+            sequence = memoryview(contig.encode("ascii"))
+            nbre_lignes = len(sequence) // largeur if largeur else 0
+            if nbre_lignes < LIGNES_MIN_DECOUPAGE:
+                for ligne in range(nbre_lignes):
+                    tampon += sequence[ligne * largeur:(ligne + 1) * largeur]
+                    tampon += b"\n"
+            else:
+                #Les lignes complètes d'un long contig sont découpées
+                #d'un coup dans un tableau (une ligne par rangée) auquel
+                #on ajoute la colonne des retours à la ligne.
+                lignes = np.empty((nbre_lignes, largeur + 1), dtype=np.uint8)
+                lignes[:, :largeur] = np.frombuffer(\
+                    sequence[:nbre_lignes * largeur], dtype=np.uint8)\
+                    .reshape(nbre_lignes, largeur)
+                lignes[:, largeur] = ord("\n")
+                tampon += lignes.data
+            if not largeur or len(sequence) % largeur or not len(sequence):
+                tampon += sequence[nbre_lignes * largeur:]
+                tampon += b"\n"
+            longueurs.append(longueur)
+            if len(tampon) >= TAILLE_TAMPON_ECRITURE:
+                fichier_sortie.write(tampon)
+                tampon.clear()
+        fichier_sortie.write(tampon)
+    if fichier_stats:
+        #La couverture moyenne n'est résumée que si tous les contigs
+        #la portent.
+        save_contig_stats(contig_stats(longueurs, couvertures\
+                                       if couvertures and None not in couvertures\
+                                       else None), fichier_stats)
+    return len(longueurs)
+
+def contig_stats(longueurs, couvertures=None):
+    """Résumé d'un assemblage : nombre de contigs, longueur totale, plus
+    long contig, N50 et, si les couvertures moyennes des contigs sont
+    données, couverture moyenne pondérée par la longueur.
+    """
+    total = sum(longueurs)
+    stats = {"nbre_contigs": len(longueurs), "longueur_totale": total,\
+             "plus_long": max(longueurs, default=0),\
+             "n50": nx_length(longueurs, total)}
+    if couvertures is not None:
+        stats["couverture_moyenne"] = round(sum(\
+            longueur * couverture for longueur, couverture\
+            in zip(longueurs, couvertures)) / total, 2) if total else 0.0
+    return stats
+
+def save_contig_stats(stats, nom_fichier):
+    """Exporte le résumé d'un assemblage (voir contig_stats) au format
+    TSV (statistique, valeur).
     """
     with open(nom_fichier, "w") as fichier_sortie:
-        numero = 0
-        for contigs in liste_contigs:
-            fichier_sortie.write(">contig_{0} len={1}\n".format(numero, contigs[1]))
-            fichier_sortie.write("{0}\n".format(fill(contigs[0])))
-            numero += 1
+        for cle, valeur in stats.items():
+            fichier_sortie.write("{0}\t{1}\n".format(cle, valeur))
+
+def read_fasta(fichier_fasta):
+    """Génère les enregistrements (nom, séquence) d'un fichier fasta,
+    éventuellement compressé (gzip ou bgzip)."""
+    nom = None
+    lignes = []
+    with open_fastq(fichier_fasta) as fasta:
+        for ligne in fasta:
+            ligne = ligne.decode("ascii").strip()
+            if ligne.startswith(">"):
+                if nom is not None:
+                    yield nom, "".join(lignes)
+                nom = ligne[1:]
+                lignes = []
+            elif ligne:
+                lignes.append(ligne)
+    if nom is not None:
+        yield nom, "".join(lignes)
+
+class ReferenceIndex:
+    """Index des k-mers d'un génome de référence : les codes des
+    k-mers présents une seule fois sont triés avec leur position, une
+    recherche se fait donc par dichotomie sur tout un tableau de codes.
+    """
+
+    def __init__(self, sequence, taille_kmer=TAILLE_KMER_EVALUATION):
+        self.taille_kmer = taille_kmer
+        self.sequence = sequence.upper().encode("ascii")
+        codes, valides = window_codes(self.sequence, taille_kmer)
+        positions = np.flatnonzero(valides)
+        codes = codes[positions]
+        ordre = np.argsort(codes, kind="stable")
+        codes, positions = codes[ordre], positions[ordre]
+        #Les k-mers répétés ne permettent pas de situer un contig.
+        uniques = np.ones(len(codes), dtype=bool)
+        doublons = codes[1:] == codes[:-1]
+        uniques[1:] &= ~doublons
+        uniques[:-1] &= ~doublons
+        self.codes = codes[uniques]
+        self.positions = positions[uniques]
+
+    def lookup(self, codes):
+        """Retourne la position dans la référence de chaque code (-1
+        s'il est absent ou répété).
+        """
+        if len(self.codes) == 0:
+            return np.full(len(codes), -1, dtype=np.int64)
+        indices = np.minimum(np.searchsorted(self.codes, codes),\
+                             len(self.codes) - 1)
+        trouves = self.codes[indices] == codes
+        return np.where(trouves, self.positions[indices], -1)
+
+def _aligned_blocks(index, sequence):
+    """Aligne une séquence sur la référence indexée.
+
+    Les k-mers de la séquence (et de son reverse complément) retrouvés
+    dans la référence sont regroupés en blocs de diagonale (position
+    dans la référence moins position dans la séquence) constante, à
+    ECART_MAX_BLOC près pour tolérer les indels. Chaque bloc donne son
+    intervalle dans la séquence (sens direct), son intervalle dans la
+    référence, son brin et le nombre de bases identiques sur le nombre
+    de bases comparées.
+    """
+    taille_kmer = index.taille_kmer
+    longueur = len(sequence)
+    reference = np.frombuffer(index.sequence, dtype=np.uint8)
+    blocs = []
+    for direct, brin in ((True, sequence), (False, reverse_complement(sequence))):
+        octets = brin.upper().encode("ascii")
+        codes, valides = window_codes(octets, taille_kmer)
+        requetes = np.flatnonzero(valides)
+        cibles = index.lookup(codes[requetes])
+        requetes, cibles = requetes[cibles >= 0], cibles[cibles >= 0]
+        if len(requetes) == 0:
+            continue
+        diagonales = cibles - requetes
+        coupures = np.flatnonzero(np.abs(np.diff(diagonales)) > ECART_MAX_BLOC) + 1
+        bases = np.frombuffer(octets, dtype=np.uint8)
+        for debut, fin in zip(np.concatenate(([0], coupures)),\
+                              np.concatenate((coupures, [len(requetes)]))):
+            positions = np.arange(requetes[debut], requetes[fin - 1] + taille_kmer)
+            #Chaque base est comparée à la référence sur la diagonale du
+            #dernier k-mer retrouvé avant elle.
+            diagonale = diagonales[debut:fin][np.searchsorted(\
+                requetes[debut:fin], positions, side="right") - 1]
+            dans_reference = (positions + diagonale >= 0)\
+            & (positions + diagonale < len(reference))
+            positions, diagonale = positions[dans_reference], diagonale[dans_reference]
+            identiques = int(np.count_nonzero(bases[positions] ==\
+                                              reference[positions + diagonale]))
+            debut_brin, fin_brin = int(requetes[debut]),\
+            int(requetes[fin - 1]) + taille_kmer
+            if not direct:
+                debut_brin, fin_brin = longueur - fin_brin, longueur - debut_brin
+            blocs.append({"debut": debut_brin, "fin": fin_brin,\
+                          "debut_reference": int(cibles[debut:fin].min()),\
+                          "fin_reference": int(cibles[debut:fin].max()) + taille_kmer,\
+                          "direct": direct, "identiques": identiques,\
+                          "comparees": len(positions)})
+    return sorted(blocs, key=lambda bloc: (bloc["debut"], -bloc["fin"]))
+
+def nx_length(longueurs, total, fraction=0.5):
+    """Retourne la longueur N50 (ou NG50 si total est la taille du
+    génome) : la longueur du contig qui fait dépasser fraction * total
+    en cumulant les contigs du plus long au plus court (0 si jamais).
+    """
+    cumul = 0
+    for longueur in sorted(longueurs, reverse=True):
+        cumul += longueur
+        if cumul >= fraction * total:
+            return longueur
+    return 0
+
+def evaluate_contigs(contigs, reference, taille_kmer=TAILLE_KMER_EVALUATION):
+    """Évalue des contigs (séquences) par rapport à un génome de
+    référence (séquence, ou liste de séquences pour un génome
+    segmenté).
+
+    Retourne un dictionnaire : nombre et longueur totale des contigs,
+    N50 et NG50, fraction du génome couverte par les contigs alignés,
+    identité des blocs alignés, nombre de mal-assemblages (jonctions
+    entre deux blocs d'un contig changeant de brin ou décalés de plus
+    de ECART_MAX_BLOC bases) et durée de chaque étape ("temps").
+    """
+    temps = {}
+    debut = time.perf_counter()
+    if isinstance(reference, str):
+        reference = [reference]
+    taille_genome = sum(len(sequence) for sequence in reference)
+    index = ReferenceIndex("N".join(reference), taille_kmer)
+    temps["indexation"] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    longueurs = []
+    couverture = np.zeros(len(index.sequence), dtype=bool)
+    identiques = comparees = mal_assemblages = 0
+    for contig in contigs:
+        longueurs.append(len(contig))
+        blocs = []
+        for bloc in _aligned_blocks(index, contig):
+            #Un bloc inclus dans un bloc précédent (répétition) est ignoré.
+            if blocs and bloc["fin"] <= blocs[-1]["fin"]:
+                continue
+            blocs.append(bloc)
+            couverture[bloc["debut_reference"]:bloc["fin_reference"]] = True
+            identiques += bloc["identiques"]
+            comparees += bloc["comparees"]
+        mal_assemblages += max(0, len(blocs) - 1)
+    temps["alignement"] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    rapport = {"nbre_contigs": len(longueurs),\
+               "longueur_totale": sum(longueurs),\
+               "n50": nx_length(longueurs, sum(longueurs)),\
+               "ng50": nx_length(longueurs, taille_genome),\
+               "fraction_genome": int(np.count_nonzero(couverture)) / taille_genome\
+               if taille_genome else 0.0,\
+               "identite": identiques / comparees if comparees else 0.0,\
+               "mal_assemblages": mal_assemblages}
+    temps["statistiques"] = time.perf_counter() - debut
+    rapport["temps"] = temps
+    return rapport
+
+def print_evaluation(rapport):
+    """Affiche le rapport de evaluate_contigs."""
+    print("Contigs : {} ({} pb au total)".format(rapport["nbre_contigs"],\
+                                                rapport["longueur_totale"]))
+    print("N50 : {} pb, NG50 : {} pb".format(rapport["n50"], rapport["ng50"]))
+    print("Fraction du génome couverte : {:.2%}".format(rapport["fraction_genome"]))
+    print("Identité : {:.2%}".format(rapport["identite"]))
+    print("Mal-assemblages : {}".format(rapport["mal_assemblages"]))
+    for etape, duree in rapport["temps"].items():
+        print("Temps ({}) : {:.3f} s".format(etape, duree))
 
 def std(liste_valeurs):
     """Calcul l'écart-type de la liste de valeurs"""
     return statistics.stdev(liste_valeurs)
 
 
+def path_edge_ids(graph, chemins):
+    """Numérote les arêtes consécutives de chemins.
+
+    Retourne le tableau concaténé des identifiants des arêtes de
+    chaque chemin, l'indice du début de chaque chemin dans ce tableau
+    et le tableau des poids indexé par ces identifiants. Pour un
+    ArrayGraph ce sont ses propres indices d'arêtes et son tableau de
+    poids ; pour networkx, chaque arête distincte (souvent partagée
+    par plusieurs chemins d'une bulle) n'est lue qu'une fois.
+    """
+    debuts = np.zeros(len(chemins), dtype=np.int64)
+    identifiants = []
+    if isinstance(graph, ArrayGraph):
+        for numero, chemin in enumerate(chemins):
+            debuts[numero] = len(identifiants)
+            identifiants.extend(graph._arete(noeud, suivant)\
+                                for noeud, suivant in zip(chemin, chemin[1:]))
+        return np.array(identifiants, dtype=np.int64), debuts, graph._poids
+    numeros = {}
+    poids = []
+    for numero, chemin in enumerate(chemins):
+        debuts[numero] = len(identifiants)
+        for arete in zip(chemin, chemin[1:]):
+            identifiant = numeros.get(arete)
+            if identifiant is None:
+                identifiant = numeros[arete] = len(poids)
+                poids.append(graph.edges[arete]["weight"])
+            identifiants.append(identifiant)
+    return np.array(identifiants, dtype=np.int64), debuts,\
+    np.array(poids, dtype=np.float64)
+
+def path_weight_stats(graph, chemins):
+    """Calcule en une fois les statistiques de poids de plusieurs
+    chemins.
+
+    Retourne un dictionnaire de tableaux, un élément par chemin :
+    "moyenne" (poids moyen, en comptant les arêtes internes des
+    unitigs traversés comme dans un graph non compacté), "ecart_type"
+    (voir std) et "minimum" des poids des arêtes du chemin. Un chemin
+    d'un seul noeud, sans arête, a des statistiques nulles.
+    """
+    identifiants, debuts, poids = path_edge_ids(graph, chemins)
+    valeurs = np.asarray(poids[identifiants], dtype=np.float64)
+    nbre_aretes = np.diff(np.append(debuts, len(valeurs))).astype(np.float64)
+    #reduceat rendrait pour un segment vide la valeur du suivant : seuls
+    #les segments non vides sont réduits, chacun s'arrêtant au début du
+    #suivant.
+    non_vides = nbre_aretes > 0
+    sommes = np.zeros(len(chemins))
+    minimums = np.zeros(len(chemins))
+    if non_vides.any():
+        sommes[non_vides] = np.add.reduceat(valeurs, debuts[non_vides])
+        minimums[non_vides] = np.minimum.reduceat(valeurs, debuts[non_vides])
+    for numero, chemin in enumerate(chemins):
+        for noeud in chemin[1:-1]:
+            donnees = graph.nodes[noeud]
+            sommes[numero] += donnees.get("poids_total", 0)
+            nbre_aretes[numero] += donnees.get("nbre_aretes", 0)
+    fins = np.append(debuts[1:], len(valeurs))
+    ecarts = np.array([std(valeurs[debut:fin].tolist()) if fin - debut > 1\
+                       else 0.0 for debut, fin in zip(debuts, fins)])
+    moyennes = np.divide(sommes, nbre_aretes, out=np.zeros(len(chemins)),\
+                         where=nbre_aretes > 0)
+    return {"moyenne": moyennes, "ecart_type": ecarts, "minimum": minimums}
+
 def path_average_weight(graph, chemin):
     """Cette fonction permet de retourner le poids moyen d'un
-    chemin.
+    chemin, calculé sur ses arêtes consécutives (voir
+    path_weight_stats).
+
+    Les arêtes internes aux unitigs (graph compacté) traversés par le
+    chemin sont comptées comme si le graph n'était pas compacté.
     """
-    poids = 0
-    nbre_edges = 0
-    edges = graph.subgraph(chemin).edges(data=True)
-    #On va récupérer les poids de chaque lien.
-    for u_value, v_value, e_value in edges:
-        poids += e_value['weight']
-        nbre_edges += 1
-    poids = poids/nbre_edges
-    return poids
+    return float(path_weight_stats(graph, [chemin])["moyenne"][0])
 
-def remove_paths(graph, liste_chemins, delete_entry_node=False, delete_sink_node=False):
+def remove_paths(graph, liste_chemins, delete_entry_node=False,\
+delete_sink_node=False, index=None, noeuds_conserves=()):
     """Fonction qui va permettre de nettoyer le graph de chemins
     indésirables.
 
@@ -136,207 +3176,778 @@ def remove_paths(graph, liste_chemins, delete_entry_node=False, delete_sink_node
     et terminaux.
     Ensuite on enlève les noeuds un par un en vérifiant au préalable que
     le noeud est présent.
+    Si un DegreeIndex est fourni, les suppressions passent par lui afin
+    qu'il reste à jour. Les noeuds de noeuds_conserves (ceux d'un chemin
+    gardé qui croise un chemin retiré) ne sont jamais supprimés.
     """
+    supprimer = graph.remove_node if index is None else index.remove_node
     for chemin in liste_chemins:
         if delete_entry_node == False and delete_sink_node == False:
             for noeud in chemin[1:-1]:
-                if noeud in graph.nodes:
-                    graph.remove_node(noeud)
+                if noeud in graph.nodes and noeud not in noeuds_conserves:
+                    supprimer(noeud)
         elif delete_entry_node and delete_sink_node == False:
             for noeud in chemin[:-1]:
-                if noeud in graph.nodes:
-                    graph.remove_node(noeud)
+                if noeud in graph.nodes and noeud not in noeuds_conserves:
+                    supprimer(noeud)
         elif delete_entry_node == False and delete_sink_node:
             for noeud in chemin[1:]:
-                if noeud in graph.nodes:
-                    graph.remove_node(noeud)
+                if noeud in graph.nodes and noeud not in noeuds_conserves:
+                    supprimer(noeud)
         elif delete_entry_node and delete_sink_node:
             for noeud in chemin[:]:
-                if noeud in graph.nodes:
-                    graph.remove_node(noeud)
+                if noeud in graph.nodes and noeud not in noeuds_conserves:
+                    supprimer(noeud)
     return graph
 
 def select_best_path(graph, ensemble_chemins, ensemble_longueurs,\
-poids_moyen, delete_entry_node=False, delete_sink_node=False):
+poids_moyen, delete_entry_node=False, delete_sink_node=False, index=None,\
+rng=None):
     """Fonction qui va permettre d'identifier le meilleur chemin.
 
-    On vérifie dans un premier poids les poids. On ne sélectionne
-    que ceux qui ont le plus au poids.
-    Si la liste générée est composée de plus de un chemin alors on
-    test la longueur des chemins restants. On ne récupère que les
-    chemins les plus long.
-    Si la liste générée est composée de plusieurs chemins alors on
-    en tire une au hasard.
+    Les chemins sont classés en une passe sur le triplet (poids moyen,
+    longueur, tirage au hasard) : le plus lourd est conservé, puis à
+    poids égal le plus long, puis en cas d'égalité parfaite un chemin
+    tiré au hasard avec rng (random.Random). Sans rng, le tirage
+    utilise un générateur local de graine GRAINE_HASARD afin que le
+    résultat soit reproductible sans toucher à l'état global du module
+    random.
     Les chemins non conservés sont envoyés à la fonction remove_paths.
     """
-    a_retirer = []
-    taille_max = max(poids_moyen)
-    chemin_fort_poids = []
-    #On recherche les chemins qui ont un poids correspondant
-    #au poids maximum (de préférence un seul ...)
-    for i in range(len(ensemble_chemins)):
-        if poids_moyen[i] == taille_max:
-            chemin_fort_poids.append(ensemble_chemins[i])
-    #On récupère les chemins à conserver puis on ajoute
-    #les autres à la liste "a_retirer"
-    for chemin in chemin_fort_poids:
-        ensemble_chemins.remove(chemin)
-    a_retirer = ensemble_chemins + a_retirer
-    #S'il y a plus qu'un chemin qui a le poids maximum on regarde
-    #la taille de ceux le poids maximum.
-    if len(chemin_fort_poids) > 1:
-        longueur_max = max(ensemble_longueurs)
-        grands_chemins = []
-        for i in range(len(chemin_fort_poids)):
-            if ensemble_longueurs[i] == longueur_max:
-                grands_chemins.append(chemin_fort_poids[i])
-        #On récupère les chemins à conserver puis on ajoute
-        #les autres à la liste "a_retirer"
-        for chemin in grands_chemins:
-            chemin_fort_poids.remove(chemin)
-        a_retirer = chemin_fort_poids + a_retirer
-        #S'il y a plusieurs chemins qui ont la taille maximum
-        #on tire un chemin au hasard parmis ceux ayant le poids
-        #maximum et la plus grande taille.
-        if len(grands_chemins) > 1:
-            random.seed(9001)
-            choix = random.randint(0, len(grands_chemins))
-            print(choix)
-            choix_chemin = grands_chemins[choix]
-            #On récupère les chemins à conserver puis on ajoute
-            #les autres à la liste "a_retirer"
-            grands_chemins.remove(choix_chemin[0])
-            a_retirer = grands_chemins + a_retirer
-    #On enlève tous les chemins qui ont été ajoutés à la liste "a_retirer"
-    graph = remove_paths(graph, a_retirer, delete_entry_node, delete_sink_node)
+    if len(ensemble_chemins) == 0:
+        return graph
+    poids = np.asarray(poids_moyen, dtype=np.float64)
+    longueurs = np.asarray(ensemble_longueurs, dtype=np.int64)
+    ex_aequo = (poids == poids.max()) & (longueurs == longueurs[poids == poids.max()].max())
+    if np.count_nonzero(ex_aequo) > 1:
+        if rng is None:
+            rng = random.Random(GRAINE_HASARD)
+        tirage = np.array([rng.random() for _ in range(len(poids))])
+        meilleur = int(np.lexsort((tirage, longueurs, poids))[-1])
+    else:
+        meilleur = int(np.flatnonzero(ex_aequo)[0])
+    a_retirer = [chemin for i, chemin in enumerate(ensemble_chemins) if i != meilleur]
+    #On enlève tous les chemins qui n'ont pas été retenus, sans toucher
+    #aux noeuds qu'ils partagent avec le chemin conservé.
+    graph = remove_paths(graph, a_retirer, delete_entry_node, delete_sink_node,\
+    index, set(ensemble_chemins[meilleur]))
     return graph
 
-def find_bubbles(graph):
+def superbubble_exit(graph, debut, taille_max=TAILLE_MAX_BULLE):
+    """Recherche la sortie de la superbulle commençant au noeud debut.
+
+    Un noeud n'est visité que lorsque tous ses prédécesseurs l'ont été
+    (Onodera et al., 2013) ; la bulle est fermée lorsqu'il ne reste
+    qu'un seul noeud en attente et que tous les noeuds rencontrés ont
+    été visités. L'exploration est abandonnée (None) en cas de pointe,
+    de cycle passant par debut, ou au-delà de taille_max noeuds.
+    Retourne le noeud de sortie et le nombre de noeuds de la bulle.
+    """
+    visites = set()
+    en_attente = {debut}
+    pile = [debut]
+    while pile:
+        noeud = pile.pop()
+        visites.add(noeud)
+        en_attente.discard(noeud)
+        if len(visites) > taille_max or graph.out_degree(noeud) == 0:
+            return None
+        for suivant in sorted(graph.successors(noeud)):
+            if suivant == debut:
+                return None
+            en_attente.add(suivant)
+            if all(precedent in visites for precedent\
+                   in graph.predecessors(suivant)):
+                pile.append(suivant)
+        if len(pile) == 1 and len(en_attente) == 1:
+            sortie = pile[0]
+            if graph.has_edge(sortie, debut):
+                return None
+            return sortie, len(visites) + 1
+    return None
+
+def find_bubbles(graph, index=None, taille_max=TAILLE_MAX_BULLE, noeuds=None):
     """Fonction qui va permettre de trouver les bulles au sein
     de l'arbre. Elle retournera les origines et les fins de ces
     bulles.
+
+    Chaque noeud ayant plusieurs successeurs est l'entrée candidate
+    d'une superbulle dont la sortie est cherchée par superbubble_exit.
+    Les bulles sont renvoyées des plus petites aux plus grandes afin
+    de résoudre les bulles imbriquées en premier. Si noeuds est donné,
+    seules les bulles dont l'entrée en fait partie sont cherchées.
     """
+    if noeuds is not None:
+        candidats = sorted(noeud for noeud in noeuds if noeud in graph.nodes\
+                           and graph.out_degree(noeud) > 1)
+    elif index is not None:
+        candidats = index.branching_nodes(entrants=False)
+    else:
+        candidats = sorted(noeud for noeud in graph.nodes\
+                           if graph.out_degree(noeud) > 1)
     bulles = []
-    ensemble_noeuds = list(graph.nodes)
-    for i in range(len(ensemble_noeuds)):
-    #On recherche si un noeud a plusieurs successeurs.
-        if len(list(graph.successors(ensemble_noeuds[i]))) > 1:
-            debut = ensemble_noeuds[i]
-            #print("le noeud est:{}".format(ensemble_noeuds[i]))
-            j = 1
-            fin = ""
-            #Si oui, on recherche le prochain noeud qui a plusieurs
-            #prédécesseurs.
-            #Tant qu'il n'y a qu'un predecesseur et que j est plus petit
-            #que le nombre de noeuds "restants" on test si un noeud a plus
-            #d'un predecesseur; ce qui permettrait d'encadrer la bulle
-            fin_trouvee = False
-            while fin_trouvee == False and j < (len(ensemble_noeuds)-i):
-                if len(list(graph.predecessors(ensemble_noeuds[i+j]))) > 1:
-                    #print(j)
-                    fin = ensemble_noeuds[i+j]
-                    #print(fin)
-                    fin_trouvee = True
-                j += 1
-            #Si on a récupéré un noeud qui a des successeurs et un noeud
-            #qui a des prédécesseurs on récupère les coordonnées.
-            if fin != "":
-                bulles.append([debut, fin])
-    print(bulles)
+    for debut in candidats:
+        resultat = superbubble_exit(graph, debut, taille_max)
+        if resultat is not None:
+            bulles.append((resultat[1], len(bulles), [debut, resultat[0]]))
+    bulles = [bulle for _, _, bulle in sorted(bulles)]
+    LOGGER.debug("Bulles : %s", bulles)
     #On retourne les coordonnées qui encadrent les bulles.
     return bulles
 
+def bubble_paths(graph, debut, fin, limite=MAX_CHEMINS_BULLE):
+    """Retourne au plus limite chemins de debut à fin.
 
+    Dans une superbulle tous les chemins partant de debut mènent à fin
+    sans cycle : le parcours reste donc borné à la bulle.
+    """
+    chemins = []
+    for chemin in simple_paths(graph, debut, fin):
+        chemins.append(chemin)
+        if len(chemins) >= limite:
+            break
+    return chemins
 
-def solve_bubble(graph, debut, fin):
+def solve_bubble(graph, debut, fin, index=None, rng=None):
     """Fonction permettant de nettoyer le graph de résoudre
-    la bulle contenue entre les deux bornes.
+    la bulle contenue entre les deux bornes (rng : voir
+    select_best_path).
     """
-    ensemble_chemins = []
-    for path in nx.all_simple_paths(graph,\
-    source=debut, target=fin):
-        ensemble_chemins.append(path)
-    print(ensemble_chemins)
+    ensemble_chemins = bubble_paths(graph, debut, fin)
+    LOGGER.debug("Chemins de la bulle : %s", ensemble_chemins)
     if len(ensemble_chemins) >= 2 and type(ensemble_chemins[1]) is list:
-        poids_moyen = []
-        ensemble_longueurs = []
-        for chemin in ensemble_chemins:
-            poids_moyen.append(path_average_weight(graph, chemin))
-            ensemble_longueurs.append(len(chemin))
-        print(poids_moyen)
+        poids_moyen = path_weight_stats(graph, ensemble_chemins)["moyenne"]
+        ensemble_longueurs = [len(chemin) for chemin in ensemble_chemins]
+        LOGGER.debug("Poids moyens : %s", poids_moyen)
         graph = select_best_path(graph, ensemble_chemins,\
         ensemble_longueurs, poids_moyen, delete_entry_node=False,\
-        delete_sink_node=False)
+        delete_sink_node=False, index=index, rng=rng)
     return graph
 
-def simplify_bubbles(graph):
+def simplify_bubbles(graph, index=None, noeuds=None, rng=None,\
+                     statistiques=None):
     """Fonction permettant de nettoyer le graph de toutes
-    les éventuelles bulles présentes dans le graph."""
-    liste_bulles = find_bubbles(graph)
+    les éventuelles bulles présentes dans le graph (ou de celles
+    débutant dans noeuds, voir find_bubbles). Le nombre de bulles
+    retirées (au moins un noeud supprimé) est ajouté à
+    statistiques["bulles"] si donné."""
+    liste_bulles = find_bubbles(graph, index, noeuds=noeuds)
     for bulle in liste_bulles:
         if bulle[0] in graph.nodes and bulle[1] in graph.nodes:
-            graph = solve_bubble(graph, bulle[0], bulle[1])
+            taille = graph.number_of_nodes()
+            graph = solve_bubble(graph, bulle[0], bulle[1], index, rng)
+            if statistiques is not None and graph.number_of_nodes() < taille:
+                statistiques["bulles"] = statistiques.get("bulles", 0) + 1
 
     return graph
 
-def solve_entry_tips(graph, entrees):
-    """Fonction qui permet d'enlever les entrées indésirables."""
-    print(entrees)
-    bornes_initiales = []
-    #On cherche les noeuds avec des intersections en partant du début
-    for noeuds_entree in entrees:
-        ensemble_noeuds = list(graph.nodes)
-        fin = ""
-        for i in range(len(ensemble_noeuds)):
-            if len(list(graph.predecessors(ensemble_noeuds[i]))) > 1:
-                fin = ensemble_noeuds[i]
-        if fin != "":
-            bornes_initiales.append([noeuds_entree, fin])
-    print(bornes_initiales)
-    #Définitions des chemins et valeurs associées
-    ensemble_chemins = []
-    poids_moyen = []
-    ensemble_longueurs = []
-    for borne in bornes_initiales:
-        for path in nx.all_simple_paths(graph,\
-                source=borne[0], target=borne[1]):
-            ensemble_chemins.append(path)
-            poids_moyen.append(path_average_weight(graph, path))
-            ensemble_longueurs.append(len(path))
-    #Nettoyage du graph
-    graph = select_best_path(graph, ensemble_chemins,\
-    ensemble_longueurs, poids_moyen, delete_entry_node=True,\
-    delete_sink_node=False)
+def _path_length(graph, noeud):
+    """Nombre d'arêtes fusionnées dans un noeud (voir compact_graph)."""
+    return graph.nodes[noeud].get("nbre_aretes", 0)
+
+def _bubble_branch(parents, noeud):
+    """Remonte les parents depuis noeud jusqu'à l'entrée de la bulle."""
+    chemin = [noeud]
+    while parents[chemin[-1]] is not None:
+        chemin.append(parents[chemin[-1]])
+    return chemin[::-1]
+
+def bounded_bubble(graph, debut, longueur_max, taille_max=TAILLE_MAX_BULLE):
+    """Recherche par parcours en largeur borné la première bulle partant
+    du noeud debut.
+
+    Les noeuds sont visités par distance croissante (en arêtes, y
+    compris celles fusionnées dans les noeuds), de sorte que les deux
+    chemins d'une bulle comptent au plus longueur_max arêtes, en
+    retenant pour chacun la branche de debut par laquelle il a été
+    atteint. Dès qu'un noeud est atteint par deux branches différentes,
+    les deux chemins depuis debut (disjoints hormis leurs extrémités)
+    sont renvoyés. Contrairement à superbubble_exit, les noeuds
+    intérieurs peuvent avoir des voisins hors de la bulle (bulles qui
+    se chevauchent ou branches d'erreurs entrantes). Retourne None si
+    aucune bulle n'est trouvée en moins de taille_max noeuds.
+    """
+    parents = {debut: None}
+    branches = {debut: None}
+    distances = {debut: 0}
+    file = [(0, 0, debut)]
+    ordre = 1
+    while file:
+        distance, _, noeud = heapq.heappop(file)
+        if len(parents) > taille_max:
+            return None
+        for suivant in sorted(graph.successors(noeud)):
+            if suivant == debut:
+                continue
+            branche = suivant if noeud == debut else branches[noeud]
+            if suivant in parents:
+                if branches[suivant] != branche:
+                    return (_bubble_branch(parents, suivant),\
+                            _bubble_branch(parents, noeud) + [suivant])
+                continue
+            parents[suivant] = noeud
+            branches[suivant] = branche
+            distances[suivant] = distance + 1 + _path_length(graph, suivant)
+            if distances[suivant] < longueur_max:
+                heapq.heappush(file, (distances[suivant], ordre, suivant))
+                ordre += 1
+    return None
+
+def pop_bubbles(graph, longueur_max, index=None, noeuds=None, rng=None,\
+                statistiques=None):
+    """Retire les bulles de moins de longueur_max arêtes trouvées par
+    bounded_bubble depuis chaque noeud ayant plusieurs successeurs (ou
+    depuis ceux de noeuds s'il est donné).
+
+    Complète simplify_bubbles pour les bulles que la recherche de
+    superbulles rejette, par exemple quand une branche d'erreur de
+    faible poids rejoint l'intérieur de la bulle. Le chemin le moins
+    couvert est retiré (voir select_best_path) et la recherche reprend
+    depuis le même noeud tant qu'elle retire des noeuds. Le nombre de
+    bulles retirées est ajouté à statistiques["bulles"] si donné.
+    """
+    if noeuds is not None:
+        candidats = sorted(noeud for noeud in noeuds if noeud in graph.nodes)
+    elif index is not None:
+        candidats = index.branching_nodes(entrants=False)
+    else:
+        candidats = sorted(graph.nodes)
+    for debut in candidats:
+        while debut in graph.nodes and graph.out_degree(debut) > 1:
+            bulle = bounded_bubble(graph, debut, longueur_max)
+            if bulle is None:
+                break
+            taille = graph.number_of_nodes()
+            poids_moyen = path_weight_stats(graph, bulle)["moyenne"]
+            graph = select_best_path(graph, bulle,\
+            [len(chemin) - 1 + sum(_path_length(graph, noeud)\
+                                   for noeud in chemin[1:-1])\
+             for chemin in bulle], poids_moyen, index=index, rng=rng)
+            if graph.number_of_nodes() == taille:
+                #Le chemin retiré est une arête directe : rien à supprimer.
+                break
+            if statistiques is not None:
+                statistiques["bulles"] = statistiques.get("bulles", 0) + 1
     return graph
 
-def solve_out_tips(graph, sorties):
-    """Fonction qui permet d'enlever les entrées indésirables"""
-    #établissement des bornes de chemins de sortie.
-    bornes_initiales = []
-    for noeuds_sortie in sorties:
-        ensemble_noeuds = list(graph.nodes)
-        debut = ""
-        for i in range(len(ensemble_noeuds)):
-            if len(list(graph.successors(ensemble_noeuds[i]))) > 1:
-                debut = ensemble_noeuds[i]
-        if debut != "":
-            bornes_initiales.append([debut, noeuds_sortie])
-    #Définitions des chemins et valeurs associées
-    ensemble_chemins = []
-    poids_moyen = []
-    ensemble_longueurs = []
-    for borne in bornes_initiales:
-        for path in nx.all_simple_paths(graph,\
-                source=borne[0], target=borne[1]):
-            ensemble_chemins.append(path)
-            poids_moyen.append(path_average_weight(graph, path))
-            ensemble_longueurs.append(len(path))
-    #Nettoyage du graph
-    graph = select_best_path(graph, ensemble_chemins,\
-    ensemble_longueurs, poids_moyen, delete_entry_node=False,\
-    delete_sink_node=True)
+def tip_path(graph, noeud, entree=True, longueur_max=None):
+    """Retourne le chemin reliant une extrémité du graph au premier
+    noeud de branchement rencontré en allant vers l'intérieur.
+
+    Pour une entrée (noeud sans prédécesseur) on suit les successeurs
+    jusqu'au premier noeud ayant plusieurs prédécesseurs ; pour une
+    sortie on remonte les prédécesseurs jusqu'au premier noeud ayant
+    plusieurs successeurs, et le chemin est renvoyé dans le sens du
+    graph (du branchement vers la sortie). Retourne None si l'extrémité
+    ne rejoint aucun branchement (ou pas en moins de longueur_max
+    arêtes).
+    """
+    if entree:
+        avancer, degre_avant, degre_arriere = graph.successors,\
+        graph.out_degree, graph.in_degree
+    else:
+        avancer, degre_avant, degre_arriere = graph.predecessors,\
+        graph.in_degree, graph.out_degree
+    chemin = [noeud]
+    vus = {noeud}
+    while degre_avant(chemin[-1]) == 1:
+        suivant = next(iter(avancer(chemin[-1])))
+        if suivant in vus:
+            return None
+        chemin.append(suivant)
+        vus.add(suivant)
+        if degre_arriere(suivant) > 1:
+            return chemin if entree else chemin[::-1]
+        if longueur_max is not None and len(chemin) > longueur_max:
+            return None
+    return None
+
+def tip_statistics(graph, chemin, entree=True):
+    """Retourne la longueur (en k-mers) et le poids moyen d'une pointe,
+    en comptant les arêtes internes des unitigs qui seraient retirés.
+    """
+    retires = chemin[:-1] if entree else chemin[1:]
+    poids = 0
+    nbre_aretes = 0
+    for noeud, suivant in zip(chemin, chemin[1:]):
+        poids += graph.edges[noeud, suivant]["weight"]
+        nbre_aretes += 1
+    for noeud in retires:
+        poids += graph.nodes[noeud].get("poids_total", 0)
+        nbre_aretes += graph.nodes[noeud].get("nbre_aretes", 0)
+    return nbre_aretes, poids / nbre_aretes
+
+def _group_tips(graph, extremites, entree, longueur_max=None):
+    """Regroupe les pointes partant des extrémités par noeud de
+    branchement atteint.
+    """
+    groupes = {}
+    for extremite in extremites:
+        #Dans un OrientedGraph, une sortie peut avoir été retirée avec
+        #l'entrée de sens opposé.
+        if extremite not in graph.nodes:
+            continue
+        chemin = tip_path(graph, extremite, entree, longueur_max)
+        if chemin is not None:
+            jonction = chemin[-1] if entree else chemin[0]
+            groupes.setdefault(jonction, []).append(chemin)
+    return groupes
+
+def _solve_tips(graph, extremites, entree, index):
+    """Compare entre elles les pointes rejoignant un même branchement
+    et ne garde que la meilleure (voir select_best_path).
+    """
+    for chemins in _group_tips(graph, extremites, entree).values():
+        if len(chemins) < 2:
+            continue
+        statistiques = [tip_statistics(graph, chemin, entree) for chemin in chemins]
+        graph = select_best_path(graph, chemins,\
+        [len(chemin) for chemin in chemins],\
+        [poids for _, poids in statistiques], delete_entry_node=entree,\
+        delete_sink_node=not entree, index=index)
     return graph
 
+def solve_entry_tips(graph, entrees, index=None):
+    """Fonction qui permet d'enlever les entrées indésirables.
+
+    Chaque entrée est suivie jusqu'au premier noeud ayant plusieurs
+    prédécesseurs ; les entrées rejoignant le même noeud sont comparées
+    et seule la meilleure est gardée.
+    """
+    return _solve_tips(graph, entrees, True, index)
+
+def solve_out_tips(graph, sorties, index=None):
+    """Fonction qui permet d'enlever les sorties indésirables.
+
+    Symétrique de solve_entry_tips.
+    """
+    return _solve_tips(graph, sorties, False, index)
+
+def clip_tips(graph, longueur_min, couverture_min=0, index=None, noeuds=None):
+    """Retire en un seul passage toutes les pointes (entrées et sorties)
+    plus courtes que longueur_min k-mers ou de poids moyen inférieur à
+    couverture_min.
+
+    Chaque pointe est parcourue depuis son extrémité jusqu'au premier
+    branchement, soit un coût proportionnel à la taille du graph. Si
+    toutes les branches arrivant à un branchement sont des pointes, la
+    meilleure (poids moyen puis longueur) est toujours conservée.
+    Retourne le graph et le nombre de pointes retirées.
+
+    Si noeuds est donné, seules les pointes partant de ces noeuds sont
+    examinées, sans parcourir le reste du graph ; sans couverture_min,
+    elles ne sont suivies que sur longueur_min arêtes.
+    """
+    longueur_max = None
+    if noeuds is not None:
+        noeuds = sorted(noeud for noeud in noeuds if noeud in graph.nodes)
+        liste_extremites = ([noeud for noeud in noeuds if graph.in_degree(noeud) == 0],\
+                            [noeud for noeud in noeuds if graph.out_degree(noeud) == 0])
+        if not couverture_min:
+            longueur_max = longueur_min
+    else:
+        if index is None:
+            index = DegreeIndex(graph)
+        liste_extremites = (index.starting_nodes(), index.sink_nodes())
+    nbre_retirees = 0
+    for entree, extremites in zip((True, False), liste_extremites):
+        groupes = _group_tips(graph, extremites, entree, longueur_max)
+        a_retirer = []
+        for jonction, chemins in groupes.items():
+            statistiques = [tip_statistics(graph, chemin, entree) for chemin in chemins]
+            candidats = list(range(len(chemins)))
+            degre = graph.in_degree(jonction) if entree else graph.out_degree(jonction)
+            if len(chemins) == degre:
+                meilleur = max(candidats, key=lambda i: (statistiques[i][1],\
+                                                         statistiques[i][0]))
+                candidats.remove(meilleur)
+            for i in candidats:
+                longueur, poids = statistiques[i]
+                if longueur < longueur_min or poids < couverture_min:
+                    a_retirer.append(chemins[i])
+        graph = remove_paths(graph, a_retirer, delete_entry_node=entree,\
+                             delete_sink_node=not entree, index=index)
+        nbre_retirees += len(a_retirer)
+    return graph, nbre_retirees
+
+def weak_components(graph):
+    """Génère les composantes faiblement connexes du graph, chacune
+    sous forme de liste de noeuds.
+    """
+    vus = set()
+    for depart in graph.nodes:
+        if depart in vus:
+            continue
+        vus.add(depart)
+        composante = [depart]
+        pile = [depart]
+        while pile:
+            noeud = pile.pop()
+            for voisin in chain(graph.successors(noeud), graph.predecessors(noeud)):
+                if voisin not in vus:
+                    vus.add(voisin)
+                    composante.append(voisin)
+                    pile.append(voisin)
+        yield composante
+
+def split_components(graph, nbre_parts):
+    """Répartit les composantes faiblement connexes du graph entre au
+    plus nbre_parts groupes de noeuds de tailles proches (chaque
+    composante, de la plus grande à la plus petite, rejoint le groupe
+    le moins chargé).
+    """
+    composantes = sorted(weak_components(graph), key=len, reverse=True)
+    parts = [[] for _ in range(min(nbre_parts, len(composantes)))]
+    for composante in composantes:
+        min(parts, key=len).extend(composante)
+    return parts
+
+def merge_graphs(graphs, modele):
+    """Réunit des graphs disjoints en un graph de même type et de mêmes
+    attributs que modele.
+    """
+    graph = modele.__class__(**modele.graph)
+    for partie in graphs:
+        graph.graph.update(partie.graph)
+        for noeud, donnees in partie.nodes(data=True):
+            graph.add_node(noeud, **donnees)
+        for noeud, suivant, donnees in partie.edges(data=True):
+            graph.add_edge(noeud, suivant, weight=donnees["weight"])
+    return graph
+
+def graph_size(graph):
+    """Retourne le nombre de noeuds et d'arêtes du graph."""
+    return {"noeuds": graph.number_of_nodes(),\
+            "aretes": graph.number_of_edges()}
+
+def peak_rss():
+    """Pic de mémoire résidente (octets) du processus et de ses
+    processus fils terminés, None si la mesure n'est pas disponible.
+    """
+    if resource is None:
+        return None
+    #ru_maxrss est en kilo-octets sous Linux, en octets sous macOS.
+    unite = 1 if os.uname().sysname == "Darwin" else 1024
+    return unite * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,\
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+class StageMetrics:
+    """Mesures des étapes du pipeline : durée, mémoire résidente (RSS),
+    et tout compteur ajouté par l'étape (taille du graph, bulles et
+    pointes retirées...).
+
+    Le pic de RSS n'est connu que pour toute la vie du processus :
+    rss_pic_processus est ce pic à la fin de l'étape (il reste le même
+    pour toutes les étapes qui suivent le pic), et rss_hausse ce dont
+    l'étape l'a fait monter (0 si elle est restée sous un pic atteint
+    plus tôt).
+
+    Chaque étape est encadrée par stage(), qui fournit le dictionnaire
+    de ses mesures et les journalise (niveau INFO) à la fin. Si profil
+    est un préfixe de fichier, l'étape est de plus profilée avec
+    cProfile (profil.<étape>.prof) et son pic d'allocations Python est
+    mesuré avec tracemalloc. Les étapes ne doivent pas s'imbriquer.
+    """
+
+    def __init__(self, profil=""):
+        self.profil = profil
+        self.etapes = []
+
+    @contextmanager
+    def stage(self, nom):
+        """Mesure le bloc encadré comme l'étape nom."""
+        mesure = {"etape": nom}
+        profileur = None
+        if self.profil:
+            tracemalloc.start()
+            profileur = cProfile.Profile()
+            profileur.enable()
+        pic_avant = peak_rss()
+        debut = time.perf_counter()
+        try:
+            yield mesure
+        finally:
+            mesure["temps"] = time.perf_counter() - debut
+            if profileur is not None:
+                profileur.disable()
+                profileur.dump_stats("{}.{}.prof".format(self.profil, nom))
+                mesure["pic_python"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            mesure["rss_pic_processus"] = peak_rss()
+            mesure["rss_hausse"] = None if pic_avant is None\
+                else mesure["rss_pic_processus"] - pic_avant
+            self.etapes.append(mesure)
+            LOGGER.info("Étape %s : %s", nom, ", ".join(\
+                "{}={:.3f}".format(cle, valeur) if isinstance(valeur, float)\
+                else "{}={}".format(cle, valeur)\
+                for cle, valeur in mesure.items() if cle != "etape"))
+
+    def save(self, nom_fichier):
+        """Écrit les mesures des étapes au format JSON."""
+        with open(nom_fichier, "w") as sortie:
+            json.dump({"etapes": self.etapes,\
+                       "temps_total": sum(mesure["temps"]\
+                                          for mesure in self.etapes)},\
+                      sortie, indent=2)
+
+def clean_stage(graph, etape, longueur_pointe, couverture_pointe=0,\
+                statistiques=None, noeuds=None):
+    """Exécute une étape du nettoyage (voir clean_graph). Les nombres
+    de bulles et de pointes retirées sont ajoutés à statistiques si
+    donné.
+
+    Si noeuds est donné (une union de composantes faiblement connexes,
+    voir split_components), seule cette partie du graph est nettoyée,
+    sur place, et renvoyée compactée : le reste du graph n'est ni lu ni
+    copié.
+    """
+    if statistiques is None:
+        statistiques = {}
+    #Un graph bidirigé est nettoyé à travers sa vue orientée (voir
+    #OrientedGraph), tour après tour jusqu'à ce que sa taille ne change
+    #plus, puis compacté (voir compact_bidirected).
+    if graph.graph.get("bidirige"):
+        if etape == "graph":
+            return compact_bidirected(graph)
+        vue = OrientedGraph(graph)
+        taille = None
+        while taille != graph_size(graph):
+            taille = graph_size(graph)
+            if etape in ("bubbles", "final"):
+                simplify_bubbles(vue, statistiques=statistiques)
+                pop_bubbles(vue, longueur_pointe, statistiques=statistiques)
+            if etape in ("tips", "final"):
+                _, nbre_retirees = clip_tips(vue, longueur_pointe,\
+                                             couverture_pointe)
+                statistiques["pointes"] = statistiques.get("pointes", 0)\
+                                          + nbre_retirees
+        return compact_bidirected(graph)
+    #Les chemins non branchés sont fusionnés avant tout nettoyage.
+    if etape == "graph":
+        return compact_graph(graph, noeuds)
+    #Chaque tour retire toutes les bulles (superbulles puis bulles
+    #bornées, voir pop_bubbles) ou toutes les pointes courtes d'un coup :
+    #de nouvelles bulles ou pointes peuvent alors apparaître. L'étape
+    #"final" alterne bulles et pointes. Un même DegreeIndex sert à tous
+    #les tours : le premier parcourt tout le graph, les suivants ne
+    #reprennent que les noeuds dont le voisinage a changé au tour
+    #précédent (frontière), jusqu'à ce qu'elle soit vide. Le graph n'est
+    #compacté qu'à la fin.
+    index = DegreeIndex(graph, noeuds)
+    frontiere = None
+    while frontiere is None or frontiere:
+        if etape in ("bubbles", "final"):
+            graph = simplify_bubbles(graph, index, frontiere,\
+                                     statistiques=statistiques)
+            graph = pop_bubbles(graph, longueur_pointe, index, frontiere,\
+                                statistiques=statistiques)
+        if etape in ("tips", "final"):
+            graph, nbre_retirees = clip_tips(graph, longueur_pointe,\
+                                             couverture_pointe, index,\
+                                             frontiere)
+            statistiques["pointes"] = statistiques.get("pointes", 0)\
+                                      + nbre_retirees
+        frontiere = index.pop_frontier()
+    return compact_graph(graph, noeuds)
+
+#Graph en cours de nettoyage, transmis une fois à chaque processus
+#(voir clean_graph).
+_GRAPH_A_NETTOYER = None
+
+def _share_graph(graph):
+    """Initialise un processus de nettoyage avec le graph courant."""
+    global _GRAPH_A_NETTOYER
+    _GRAPH_A_NETTOYER = graph
+
+def _clean_part(parametres):
+    """Nettoie, dans un processus, la partie du graph formée par un
+    groupe de composantes (voir clean_graph). Retourne la partie
+    nettoyée et les nombres de bulles et pointes retirées.
+
+    La partie est nettoyée sur place dans la copie du graph propre au
+    processus : les groupes étant disjoints, ceux traités ensuite par
+    le même processus n'en sont pas affectés.
+    """
+    noeuds, etape, longueur_pointe, couverture_pointe = parametres
+    statistiques = {}
+    partie = clean_stage(_GRAPH_A_NETTOYER, etape, longueur_pointe,\
+                         couverture_pointe, statistiques, noeuds)
+    return partie, statistiques
+
+def clean_graph(graph, longueur_pointe, couverture_pointe=0, reprise=None,\
+                apres_etape=None, threads=1, mesures=None):
+    """Nettoie un graph orienté : compaction, bulles, pointes puis de
+    nouveau bulles (étapes de ETAPES).
+
+    Si reprise est le nom d'une étape, le graph est supposé issu de
+    cette étape et seules les suivantes sont exécutées. apres_etape,
+    s'il est donné, est appelé avec le graph et le nom de chaque étape
+    terminée (voir save_graph).
+
+    Avec threads > 1, chaque étape est exécutée en parallèle sur des
+    groupes de composantes faiblement connexes (voir split_components) :
+    les bulles et pointes d'une composante ne dépendent pas des autres,
+    et leur choix ne dépend pas de l'ordre des noeuds (voir
+    DegreeIndex), le graph obtenu est donc le même qu'en série (seul
+    l'ordre des noeuds peut changer). Le graph est transmis aux
+    processus à leur création, seuls les noms des noeuds de chaque
+    groupe leur sont envoyés et seules les parties compactées sont
+    renvoyées.
+
+    Si mesures (voir StageMetrics) est donné, chaque étape y est
+    chronométrée avec la taille du graph obtenu et le nombre de bulles
+    et pointes retirées.
+    """
+    etapes = [etape for etape in ETAPES if reprise is None\
+              or ETAPES.index(etape) > ETAPES.index(reprise)]
+    groupes = None
+    for etape in etapes:
+        with mesures.stage(etape) if mesures is not None\
+        else nullcontext({}) as mesure:
+            statistiques = {"bulles": 0, "pointes": 0}
+            #Les arêtes d'un graph bidirigé portent leurs orientations,
+            #que merge_graphs ne recopie pas : il est nettoyé en série.
+            #Le nettoyage ne fait que scinder les composantes : chaque
+            #partie nettoyée reste un groupe de composantes pour l'étape
+            #suivante, le graph n'est donc découpé qu'une fois.
+            if groupes is None:
+                groupes = split_components(graph, 4 * threads)\
+                if threads > 1 and not graph.graph.get("bidirige") else []
+            if len(groupes) < 2:
+                graph = clean_stage(graph, etape, longueur_pointe,\
+                                    couverture_pointe, statistiques)
+            else:
+                #Les objets du graph sont gelés avant la création des
+                #processus : le ramasse-miettes des processus fils ne les
+                #parcourt plus, et ne copie donc plus leurs pages mémoire.
+                gc.freeze()
+                try:
+                    with multiprocessing.Pool(threads, initializer=_share_graph,\
+                                              initargs=(graph,)) as pool:
+                        resultats = pool.map(_clean_part, [(noeuds, etape,\
+                                             longueur_pointe, couverture_pointe)\
+                                             for noeuds in groupes])
+                finally:
+                    gc.unfreeze()
+                for _, compteurs in resultats:
+                    for cle, valeur in compteurs.items():
+                        statistiques[cle] += valeur
+                graph = merge_graphs([partie for partie, _ in resultats], graph)
+                groupes = [list(partie.nodes) for partie, _ in resultats]
+            mesure.update(statistiques)
+            mesure.update(graph_size(graph))
+        if apres_etape is not None:
+            apres_etape(graph, etape)
+    return graph
+
+def multi_k_assembly(fichier_fastq, liste_k, comptes_min=1, longueur_pointe=0,\
+                     couverture_pointe=0, backend="networkx", threads=1):
+    """Assemblage itératif sur des valeurs croissantes de k.
+
+    Les k-mers de toutes les valeurs de k sont comptés en une seule
+    lecture du fastq (voir build_kmer_dicts). Le graph du plus petit k
+    est nettoyé, puis ses contigs sont ajoutés comme pseudo-reads aux
+    comptes du k suivant (voir add_pseudo_reads), et ainsi de suite.
+    Retourne le graph nettoyé du plus grand k.
+    """
+    liste_comptes = build_kmer_dicts(fichier_fastq, liste_k,\
+                                     comptes_min=comptes_min)
+    contigs = []
+    graph = None
+    for taille_kmer, comptes in zip(liste_k, liste_comptes):
+        if contigs:
+            comptes = add_pseudo_reads(comptes, contigs)
+        graph = clean_graph(build_graph(comptes, backend=backend),\
+                            longueur_pointe or 2 * taille_kmer,\
+                            couverture_pointe, threads=threads)
+        contigs = [contig for contig, taille in iter_contigs(graph)\
+                   if taille > taille_kmer]
+    return graph
+
+class Assembler:
+    """Assemblage incrémental : les reads sont ajoutés par lots et le
+    graph de De Bruijn (non compacté) est tenu à jour.
+
+    Chaque lot ne met à jour que les arêtes de ses k-mers, puis les
+    bulles et pointes ne sont cherchées qu'autour des noeuds modifiés
+    (à longueur_pointe arêtes près) : le coût d'un lot dépend de sa
+    taille et non du volume de reads déjà vus. Un k-mer retiré lors du
+    nettoyage repart de zéro s'il réapparaît dans un lot suivant.
+    """
+
+    def __init__(self, taille_kmer=21, longueur_pointe=0, couverture_pointe=0,\
+                 backend="networkx"):
+        self.taille_kmer = taille_kmer
+        self.longueur_pointe = longueur_pointe or 2 * taille_kmer
+        self.couverture_pointe = couverture_pointe
+        self.graph = ArrayGraph() if backend == "array" else nx.DiGraph()
+        self.nbre_reads = 0
+
+    def add_reads(self, reads, nettoyer=True):
+        """Ajoute un lot de reads (str ou bytes) au graph puis nettoie
+        la région modifiée. Retourne le nombre de k-mers distincts du
+        lot.
+        """
+        reads = list(reads)
+        self.nbre_reads += len(reads)
+        codes = encode_sequences(reads, self.taille_kmer)
+        codes, comptes = merge_counts(codes, np.ones(len(codes), dtype=np.uint32))
+        #Les poids existants sont mis à jour avant d'ajouter les
+        #nouvelles arêtes d'un bloc (voir ArrayGraph.add_edge).
+        nouvelles = []
+        modifies = set()
+        for code, compte in zip(codes, comptes.tolist()):
+            kmer = decode_kmer(code, self.taille_kmer)
+            prefixe, suffixe = kmer[:-1], kmer[1:]
+            if self.graph.has_edge(prefixe, suffixe):
+                self.graph.edges[prefixe, suffixe]["weight"] += compte
+            else:
+                nouvelles.append((prefixe, suffixe, compte))
+            modifies.add(prefixe)
+            modifies.add(suffixe)
+        for prefixe, suffixe, compte in nouvelles:
+            self.graph.add_edge(prefixe, suffixe, weight=compte)
+        if nettoyer:
+            self.clean(modifies)
+        return len(codes)
+
+    def _region(self, noeuds):
+        """Noeuds situés à moins de longueur_pointe arêtes (dans un
+        sens ou dans l'autre) de noeuds.
+        """
+        region = {noeud for noeud in noeuds if noeud in self.graph.nodes}
+        frontiere = list(region)
+        for _ in range(self.longueur_pointe):
+            suivante = []
+            for noeud in frontiere:
+                for voisin in chain(self.graph.successors(noeud),\
+                                    self.graph.predecessors(noeud)):
+                    if voisin not in region:
+                        region.add(voisin)
+                        suivante.append(voisin)
+            if not suivante:
+                break
+            frontiere = suivante
+        return region
+
+    def clean(self, noeuds=None):
+        """Retire bulles puis pointes autour de noeuds (de tout le
+        graph si noeuds vaut None), comme clean_graph.
+        """
+        region = None if noeuds is None else self._region(noeuds)
+        self.graph = simplify_bubbles(self.graph, noeuds=region)
+        self.graph = pop_bubbles(self.graph, self.longueur_pointe,\
+                                 noeuds=region)
+        nbre_retirees = 1
+        while nbre_retirees:
+            self.graph, nbre_retirees = clip_tips(self.graph,\
+                self.longueur_pointe, self.couverture_pointe, noeuds=region)
+        self.graph = simplify_bubbles(self.graph, noeuds=region)
+
+    def contigs(self):
+        """Retourne les contigs courants (voir iter_contigs)."""
+        return list(iter_contigs(self.graph))
+
 #Définition de la fonction Main
 def main():
     """La fonction main() correspond à ce qui sera executé si le code
@@ -344,66 +3955,206 @@ def main():
     """
     parser = argparse.ArgumentParser(prog='debruij.py',\
     description='Assembleur de séquence basé sur la méthode de De Bruij.')
-    parser.add_argument('--i', type=str, help='fichier fastq, single end')
+    parser.add_argument('--i', type=str, nargs='+',\
+    help='fichier(s) fastq, éventuellement compressés (gzip) : noms ou '\
+    'motifs (ex: "lane*_R?.fq.gz"), lus en même temps ; les reads de '\
+    'fichiers R1/R2 sont comptés comme des reads indépendants '\
+    '(l\'appariement n\'est pas utilisé)')
     parser.add_argument('--k', type=int, default=21,\
     help='taille des kmer (optionnel - par defaut : 21)')
+    parser.add_argument('--k-list', type=str, default='',\
+    help='tailles de k croissantes séparées par des virgules (ex: '\
+    '21,33,55) : les contigs obtenus à chaque k servent de reads pour le '\
+    'suivant ; toutes les tailles sont comptées en mémoire, incompatible '\
+    'avec --kmer-db, --hist, --max-memory, --tmp-dir, --checkpoint-dir et '\
+    '--resume-from (optionnel)')
     parser.add_argument('--r', type=str, default='',\
-    help='genome de reference (optionnel)')
-    parser.add_argument('--o', type=str, default='',\
-    help='fichier contig (optionnel)')
+    help='genome de reference : les contigs obtenus (ou, sans --i, ceux '\
+    'de --o) sont évalués par rapport à lui (optionnel)')
+    parser.add_argument('--o', type=str, default='Final.fna',\
+    help='fichier des contigs, compressé si son nom finit par .gz (gzip) '\
+    'ou .bgz (bgzip) ; un résumé (N50, longueur totale...) est écrit à côté '\
+    'avec l\'extension .stats (optionnel - par defaut : Final.fna)')
+    parser.add_argument('--canonical', action='store_true',\
+    help='compte les k-mers sous leur forme canonique (brin neutre) et '\
+    'construit un graph bidirigé, avec networkx uniquement ; incompatible '\
+    'avec --k-list, --checkpoint-dir et --resume-from. Plus lent que le '\
+    'mode orienté : le graph est nettoyé en série, à travers une vue '\
+    'orientée (optionnel)')
+    parser.add_argument('--graph-backend', choices=['networkx', 'array'],\
+    default='networkx', help='représentation du graph '\
+    '(optionnel - par defaut : networkx)')
+    parser.add_argument('--min-count', type=str, default='1',\
+    help='nombre minimal d\'occurrences d\'un k-mer, ou "auto" pour le '\
+    'déduire de l\'histogramme des abondances (optionnel - par defaut : 1)')
+    parser.add_argument('--kmer-db', type=str, default='',\
+    help='fichier où enregistrer la table des k-mers ; relu au lieu de '\
+    'recompter si le fastq n\'a pas changé (optionnel)')
+    parser.add_argument('--hist', type=str, default='',\
+    help='fichier TSV où exporter le spectre des abondances des k-mers '\
+    '(optionnel)')
+    parser.add_argument('--checkpoint-dir', type=str, default='',\
+    help='dossier où sauvegarder le graph après chaque étape ({}) '\
+    '(optionnel)'.format(', '.join(ETAPES)))
+    parser.add_argument('--resume-from', choices=ETAPES, default=None,\
+    help='reprend le pipeline à partir du graph sauvegardé après cette '\
+    'étape dans --checkpoint-dir (optionnel)')
+    parser.add_argument('--tip-length', type=int, default=0,\
+    help='longueur (en k-mers) sous laquelle une pointe est retirée '\
+    '(optionnel - par defaut : 2k)')
+    parser.add_argument('--tip-coverage', type=float, default=0,\
+    help='poids moyen sous lequel une pointe est retirée '\
+    '(optionnel - par defaut : 0)')
+    parser.add_argument('--threads', type=int, default=1,\
+    help='nombre de processus pour le comptage des k-mers et le nettoyage '\
+    '(optionnel - par defaut : 1)')
+    parser.add_argument('--max-memory', type=parse_size, default=None,\
+    help='mémoire disponible pour le comptage (ex: 4G) : les reads sont '\
+    'répartis par minimiseur dans des fichiers comptés l\'un après '\
+    'l\'autre (ou en parallèle avec --threads) (optionnel)')
+    parser.add_argument('--tmp-dir', type=str, default=None,\
+    help='dossier des fichiers temporaires de --max-memory '\
+    '(optionnel - par defaut : dossier temporaire du système)')
+    parser.add_argument('--metrics', type=str, default='',\
+    help='fichier JSON où écrire la durée, le pic de mémoire, la taille du '\
+    'graph et les bulles et pointes retirées de chaque étape (optionnel)')
+    parser.add_argument('--profile', type=str, default='',\
+    help='préfixe des fichiers cProfile écrits pour chaque étape ; mesure '\
+    'aussi les allocations avec tracemalloc (optionnel)')
+    parser.add_argument('--log-level', default='WARNING',\
+    choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],\
+    help='niveau du journal : INFO affiche les mesures de chaque étape, '\
+    'DEBUG les bulles et chemins traités (optionnel - par defaut : WARNING)')
     args = parser.parse_args()
+    if args.canonical:
+        #Le graph bidirigé n'existe qu'avec networkx et ne peut pas être
+        #sauvegardé (voir save_graph).
+        for option, utilisee in (("--k-list", args.k_list),\
+                                 ("--graph-backend array",\
+                                  args.graph_backend == "array"),\
+                                 ("--checkpoint-dir", args.checkpoint_dir),\
+                                 ("--resume-from", args.resume_from)):
+            if utilisee:
+                parser.error("{} ne fonctionne pas en mode --canonical"\
+                             .format(option))
+    if args.k_list:
+        #Toutes les tailles de k sont comptées ensemble en mémoire (voir
+        #multi_k_assembly) : ni table enregistrée, ni histogramme, ni
+        #comptage hors mémoire, ni sauvegarde des étapes.
+        for option, utilisee in (("--kmer-db", args.kmer_db),\
+                                 ("--hist", args.hist),\
+                                 ("--max-memory", args.max_memory),\
+                                 ("--tmp-dir", args.tmp_dir),\
+                                 ("--checkpoint-dir", args.checkpoint_dir),\
+                                 ("--resume-from", args.resume_from)):
+            if utilisee:
+                parser.error("{} ne fonctionne pas avec --k-list"\
+                             .format(option))
+    logging.basicConfig(level=args.log_level, format="%(levelname)s %(message)s")
+    mesures = StageMetrics(args.profile)
+    comptes_min = args.min_count if args.min_count == 'auto'\
+    else int(args.min_count)
+    dossier_sauvegarde = args.checkpoint_dir or '.'
+    fichier_stats = re.sub(r"\.b?gz$", "", args.o) + ".stats"
 
-    liste_reads = []
-    for sequence in read_fastq(args.i):
-        liste_reads.append(sequence)
-
-    liste_kmers = []
-    for read in liste_reads:
-        for kmers in cut_kmer(read, args.k):
-            liste_kmers.append(kmers)
+    def evaluer(fichier_contigs):
+        """Évalue les contigs par rapport à la référence si demandé,
+        puis écrit les mesures des étapes si demandé."""
+        if args.r:
+            with mesures.stage("evaluation"):
+                reference = [sequence for _, sequence in read_fasta(args.r)]
+                rapport = evaluate_contigs(\
+                    (sequence for _, sequence in read_fasta(fichier_contigs)),\
+                    reference)
+            print_evaluation(rapport)
+        if args.metrics:
+            mesures.save(args.metrics)
 
-    occurrence_kmers = build_kmer_dict(args.i, args.k)
-    graph = build_graph(occurrence_kmers)
-    #debuts = get_starting_nodes(graph)
-    #fins = get_sink_nodes(graph)
-    #liste_contigs = get_contigs(graph, debuts, fins)
-    #save_contigs(liste_contigs, "Export_contigs.fna")
+    if args.r and not args.i and not args.resume_from:
+        evaluer(args.o)
+        return
 
-    graph = simplify_bubbles(graph)
-    #print(len(graph.nodes))
+    def sauvegarder(graph, etape):
+        """Sauvegarde le graph après une étape si demandé."""
+        if args.checkpoint_dir:
+            os.makedirs(args.checkpoint_dir, exist_ok=True)
+            save_graph(graph, os.path.join(args.checkpoint_dir,\
+                                           etape + ".npz"))
 
-    #debuts = get_starting_nodes(graph)
-    #fins = get_sink_nodes(graph)
-    #liste_contigs = get_contigs(graph, debuts, fins)
-    #save_contigs(liste_contigs, "Inter.fna")
-
-    #recherche des entrées indésirables.
-    noeuds_entree = get_starting_nodes(graph)
-    while len(noeuds_entree) > 1:
-        graph = solve_entry_tips(graph, noeuds_entree)
-        noeuds_entree = get_starting_nodes(graph)
+    liste_k = sorted(int(k) for k in args.k_list.split(',')) if args.k_list\
+    else []
+    longueur_pointe = args.tip_length if args.tip_length else 2 * args.k
+    #Sans table de k-mers (multi-k, reprise), la couverture des contigs
+    #est calculée à partir des poids du graph (voir iter_contigs).
+    couverture = True
+    if liste_k:
+        with mesures.stage("multi_k") as mesure:
+            graph = multi_k_assembly(args.i, liste_k, comptes_min,\
+                                     args.tip_length, args.tip_coverage,\
+                                     args.graph_backend, args.threads)
+            mesure.update(graph_size(graph))
+    elif args.resume_from:
+        with mesures.stage("chargement") as mesure:
+            graph = load_graph(os.path.join(dossier_sauvegarde,\
+                                            args.resume_from + ".npz"))
+            mesure.update(graph_size(graph))
+        graph = clean_graph(graph, longueur_pointe, args.tip_coverage,\
+                            args.resume_from, sauvegarder, args.threads,\
+                            mesures)
+    else:
+        LOGGER.info("Lecture de %s", ", ".join(fastq_files(args.i)))
+        with mesures.stage("comptage") as mesure:
+            occurrence_kmers = build_kmer_dict(args.i, args.k, args.canonical,\
+                                               args.threads, comptes_min,\
+                                               args.kmer_db, args.max_memory,\
+                                               args.tmp_dir)
+            mesure["kmers"] = len(occurrence_kmers)
+        if args.hist:
+            save_histogram(occurrence_kmers.histogram(), args.hist)
+        couverture = occurrence_kmers
+        with mesures.stage("construction") as mesure:
+            graph = build_graph(occurrence_kmers, args.canonical,\
+                                args.graph_backend)
+            mesure.update(graph_size(graph))
+        if args.canonical:
+            #Le graph bidirigé est nettoyé à travers sa vue orientée
+            #(voir clean_stage) puis ses unitigs sont exportés.
+            graph = clean_graph(graph, longueur_pointe, args.tip_coverage,\
+                                mesures=mesures)
+            with mesures.stage("contigs") as mesure:
+                nbre_contigs = save_contigs(get_contigs_bidirected(graph,\
+                                                                   couverture),\
+                                            args.o, fichier_stats=fichier_stats)
+                mesure["contigs"] = nbre_contigs
+            print("Cela amène à {} contigs généré(s).".format(nbre_contigs))
+            evaluer(args.o)
+            return
+        #debuts = get_starting_nodes(graph)
+        #fins = get_sink_nodes(graph)
+        #liste_contigs = get_contigs(graph, debuts, fins)
+        #save_contigs(liste_contigs, "Export_contigs.fna")
+        graph = clean_graph(graph, longueur_pointe, args.tip_coverage,\
+                            apres_etape=sauvegarder, threads=args.threads,\
+                            mesures=mesures)
     noeuds_entree = get_starting_nodes(graph)
-
-    noeuds_terminaux = get_sink_nodes(graph)
-    while len(noeuds_terminaux) > 1:
-        graph = solve_out_tips(graph, noeuds_terminaux)
-        noeuds_terminaux = get_sink_nodes(graph)
     noeuds_terminaux = get_sink_nodes(graph)
-    #print("#####")
-    graph = simplify_bubbles(graph)
     #for noeud in graph.nodes:
     #    if len(list(graph.predecessors(noeud))) > 1:
     #        print("Il y a un petiot ici {}".format(noeud))
     #        graph = simplify_bubbles(graph)
-    final_contig = get_contigs(graph, noeuds_entree, noeuds_terminaux)
+    #Les contigs sont écrits au fur et à mesure de leur parcours.
+    with mesures.stage("contigs") as mesure:
+        nbre_contigs = save_contigs(iter_contigs(graph, couverture),\
+                                    args.o, fichier_stats=fichier_stats)
+        mesure["contigs"] = nbre_contigs
     print("\n\n\nIl reste {} noeuds d'entrée.".format(len(noeuds_entree)))
     print("Il reste {} noeuds de sortie.".format(len(noeuds_terminaux)))
-    print("Cela amène à {} contigs généré(s).".format(len(final_contig)))
-    if len(final_contig) > 1:
+    print("Cela amène à {} contigs généré(s).".format(nbre_contigs))
+    if nbre_contigs > 1:
         print(".\n..\n...\nMalheureusement ... :'(")
     else:
         print(".\n..\n...\nOn y est !!! :D")
-    save_contigs(final_contig, "Final.fna")
+    evaluer(args.o)
 
 #Si fichier lancé on execute la boucle main.
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+import gzip
 import os
 import sys
 # Path of debruijn package
@@ -7,4 +8,17 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
                                                 '../debruijn')))
 import debruijn
-#import debruijn_comp
\ No newline at end of file
+#import debruijn_comp
+# Path for benchmarks
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '../benchmarks')))
+
+
+def write_fastq(chemin, sequences, compresse=False):
+    """Write sequences as a fastq file (gzip-compressed if compresse)
+    and return its path as a string"""
+    contenu = "".join("@r{}\n{}\n+\n{}\n".format(i, sequence, "J" * len(sequence))
+                      for i, sequence in enumerate(sequences)).encode()
+    with open(str(chemin), "wb") as fastq:
+        fastq.write(gzip.compress(contenu) if compresse else contenu)
+    return str(chemin)
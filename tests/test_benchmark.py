@@ -0,0 +1,32 @@
+"""Tests for the benchmark suite"""
+import pytest
+import os
+from .context import debruijn
+from benchmark import simulate_genome
+from benchmark import simulate_reads
+from benchmark import benchmark_size
+from benchmark import scaling_slopes
+from benchmark import ETAPES_BENCHMARK
+from debruijn import read_fastq
+
+
+def test_simulate(tmp_path):
+    genome = simulate_genome(2000, graine=1, fraction_repetee=0.5, taille_repetition=100)
+    assert len(genome) == 2000
+    assert genome == simulate_genome(2000, graine=1, fraction_repetee=0.5, taille_repetition=100)
+    assert genome != simulate_genome(2000, graine=2)
+    fastq = str(tmp_path / "reads.fq")
+    assert simulate_reads(genome, fastq, couverture=10, longueur_reads=50) == 400
+    reads = list(read_fastq(fastq))
+    assert len(reads) == 400
+    assert all(read in genome for read in reads)
+
+def test_benchmark_size():
+    resultat = benchmark_size(1000, couverture=10, memoire=False)
+    assert set(resultat["etapes"]) == set(ETAPES_BENCHMARK)
+    assert resultat["nbre_reads"] == 100
+    assert set(resultat["etapes"]["clean_graph"]["details"]) == set(debruijn.ETAPES)
+    assert all(mesure["temps"] >= 0 for mesure in resultat["etapes"].values())
+    resultats = [{"taille_genome": taille, "etapes": {etape: {"temps": taille * 1e-6}
+                  for etape in ETAPES_BENCHMARK}} for taille in (1000, 10000)]
+    assert round(scaling_slopes(resultats)["build_graph"], 6) == 1.0
@@ -3,12 +3,27 @@ import pytest
 import os
 import networkx as nx
 import hashlib
+import gzip
 from .context import debruijn
 #from .context import debruijn_comp
 from debruijn import get_starting_nodes
 from debruijn import get_sink_nodes
 from debruijn import get_contigs
 from debruijn import save_contigs
+from debruijn import remove_paths
+from debruijn import DegreeIndex
+from debruijn import iter_contigs
+from debruijn import read_fasta
+from debruijn import reverse_complement
+from debruijn import evaluate_contigs
+from debruijn import nx_length
+from debruijn import build_kmer_dict
+from debruijn import build_graph
+from debruijn import compact_graph
+from debruijn import save_graph
+from debruijn import load_graph
+from debruijn import kmer_coverage
+from debruijn import contig_stats
 
 
 def test_get_starting_nodes():
@@ -27,6 +42,20 @@ def test_get_sink_nodes():
     assert 6 in nodes
     assert 7 in nodes
 
+def test_degree_index():
+    graph = nx.DiGraph()
+    graph.add_edges_from([(1, 2), (3, 2), (2, 4), (4, 5), (5, 6), (5, 7)])
+    index = DegreeIndex(graph)
+    assert get_starting_nodes(graph, index) == [1, 3]
+    assert get_sink_nodes(graph, index) == [6, 7]
+    assert index.branching_nodes(entrants=True) == [2]
+    assert index.branching_nodes(entrants=False) == [5]
+    remove_paths(graph, [(5, 7)], False, True, index)
+    assert get_sink_nodes(graph, index) == get_sink_nodes(graph) == [6]
+    assert index.branching_nodes(entrants=False) == []
+    assert index.pop_frontier() == [5]
+    assert index.pop_frontier() == []
+
 def test_get_contigs():
     graph = nx.DiGraph()
     graph.add_edges_from([("TC", "CA"), ("AC", "CA"), ("CA", "AG"), ("AG", "GC"), ("GC", "CG"), ("CG", "GA"), ("GA", "AT"), ("GA", "AA")])
@@ -38,6 +67,14 @@ def test_get_contigs():
         assert contig[1] == 8
 
 
+def test_iter_contigs():
+    graph = nx.DiGraph()
+    graph.add_edges_from([("TC", "CA"), ("AC", "CA"), ("CA", "AG"), ("AG", "GC"), ("GC", "CG"), ("CG", "GA"), ("GA", "AT"), ("GA", "AA")])
+    contigs = iter_contigs(graph)
+    assert next(contigs) == ("TC", 2)
+    assert sorted(contigs) == [("AA", 2), ("AC", 2), ("AT", 2), ("CAGCGA", 6)]
+
+
 # def test_get_contigs_comp():
 #     graph = nx.DiGraph()
 #     graph.add_edges_from([(("AG", "TC"), ("CA", "GT")), (("AC", "TG"), ("CA", "GT")), (("CA", "GT"), ("AG", "TC")), 
@@ -56,4 +93,84 @@ def test_save_contigs():
     contig = [("TCAGCGAT", 8), ("TCAGCGAA",8), ("ACAGCGAT", 8), ("ACAGCGAA", 8)]
     save_contigs(contig, test_file)
     with open(test_file, 'rb') as contig_test:
-        assert hashlib.md5(contig_test.read()).hexdigest() == "ca84dfeb5d58eca107e34de09b3cc997"
\ No newline at end of file
+        assert hashlib.md5(contig_test.read()).hexdigest() == "ca84dfeb5d58eca107e34de09b3cc997"
+
+
+def test_save_contigs_coverage_and_compression(tmp_path):
+    fastq = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "eva71_hundred_reads.fq"))
+    kmer_dict = build_kmer_dict(fastq, 21)
+    graph = build_graph(kmer_dict)
+    #Poids des arêtes et comptes des k-mers donnent la même couverture,
+    #avant comme après compaction (histogrammes des poids des noeuds),
+    #y compris pour un graph compacté deux fois puis sauvegardé.
+    contigs = sorted(iter_contigs(graph, True))
+    assert contigs == sorted(iter_contigs(graph, kmer_dict))
+    compacts = sorted(iter_contigs(compact_graph(graph), kmer_dict))
+    assert compacts == sorted(iter_contigs(compact_graph(graph), True))
+    save_graph(compact_graph(compact_graph(graph)), str(tmp_path / "graph.npz"))
+    assert compacts == sorted(iter_contigs(load_graph(str(tmp_path / "graph.npz")), True))
+    #Sans histogramme, la médiane n'est pas approchée mais omise.
+    ancien = compact_graph(graph)
+    for _, donnees in ancien.nodes(data=True):
+        donnees.pop("histogramme_poids")
+    assert all(contig[3] is None for contig in iter_contigs(ancien, True))
+    save_contigs(iter_contigs(ancien, True), str(tmp_path / "ancien.fna"))
+    with open(str(tmp_path / "ancien.fna")) as sortie:
+        assert "cov_median" not in sortie.readline()
+    assert kmer_coverage(kmer_dict, "ACGT") == (0.0, 0.0)
+    texte = None
+    for nom in ("contigs.fna", "contigs.fna.gz", "contigs.fna.bgz"):
+        fichier = str(tmp_path / nom)
+        assert save_contigs(compacts, fichier, largeur=60, fichier_stats=str(tmp_path / "contigs.stats")) == len(compacts)
+        with open(fichier, "rb") as sortie:
+            contenu = sortie.read()
+        if nom != "contigs.fna":
+            assert contenu[:2] == b"\x1f\x8b"
+            contenu = gzip.decompress(contenu)
+        texte = texte or contenu
+        assert contenu == texte
+        assert [sequence for _, sequence in read_fasta(fichier)] == [contig[0] for contig in compacts]
+    #Un fichier bgzip se termine par le bloc vide standard.
+    with open(str(tmp_path / "contigs.fna.bgz"), "rb") as sortie:
+        assert sortie.read().endswith(bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000"))
+    entete = texte.split(b"\n")[0].decode()
+    assert entete == ">contig_0 len={} cov_mean={:.2f} cov_median={:.2f}".format(*compacts[0][1:])
+    assert max(len(ligne) for ligne in texte.split(b"\n")) == 60
+    with open(str(tmp_path / "contigs.stats")) as fichier:
+        stats = dict(ligne.rstrip("\n").split("\t") for ligne in fichier)
+    longueurs = [contig[1] for contig in compacts]
+    assert int(stats["nbre_contigs"]) == len(compacts)
+    assert int(stats["longueur_totale"]) == sum(longueurs)
+    assert int(stats["n50"]) == nx_length(longueurs, sum(longueurs))
+    assert contig_stats([]) == {"nbre_contigs": 0, "longueur_totale": 0, "plus_long": 0, "n50": 0}
+    #Largeur 0 : une ligne par séquence ; couverture partielle ou absente.
+    fichier = str(tmp_path / "lignes.fna")
+    contigs = [("ACGT" * 30, 120, 3.5), ("TTGCA", 5, None, None), ("GGA", 3)]
+    assert save_contigs(contigs, fichier, largeur=0, fichier_stats=fichier + ".stats") == 3
+    with open(fichier) as sortie:
+        assert sortie.read().split("\n") == [">contig_0 len=120 cov_mean=3.50", "ACGT" * 30,
+                                               ">contig_1 len=5", "TTGCA", ">contig_2 len=3", "GGA", ""]
+    with open(fichier + ".stats") as sortie:
+        assert "couverture_moyenne" not in sortie.read()
+    with pytest.raises(ValueError):
+        save_contigs(contigs, fichier, largeur=-1)
+
+def test_evaluate_contigs():
+    reference = next(read_fasta(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "eva71.fna"))))[1]
+    rapport = evaluate_contigs([reference], reference)
+    assert rapport["fraction_genome"] == 1.0
+    assert rapport["identite"] == 1.0
+    assert rapport["mal_assemblages"] == 0
+    assert rapport["n50"] == rapport["ng50"] == len(reference)
+    mutant = reference[2000:2500] + ("A" if reference[2500] != "A" else "C") + reference[2501:3000]
+    chimere = reference[4000:4500] + reverse_complement(reference[6000:6500])
+    rapport = evaluate_contigs([reverse_complement(reference[:1000]), mutant, chimere], reference)
+    assert rapport["nbre_contigs"] == 3
+    #The chimera junction may extend a block by a few bases matching by chance.
+    assert 3000 <= rapport["fraction_genome"] * len(reference) <= 3005
+    assert 1 - 1 / 3000 <= rapport["identite"] < 1
+    assert rapport["mal_assemblages"] == 1
+    assert set(rapport["temps"]) == {"indexation", "alignement", "statistiques"}
+    assert nx_length([5, 3, 2], 10) == 5
+    assert nx_length([5, 3, 2], 14) == 3
+    assert nx_length([5, 3, 2], 40) == 0
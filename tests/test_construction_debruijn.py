@@ -3,12 +3,52 @@ import pytest
 import os
 import networkx as nx
 import pickle
+import gzip
+import numpy as np
 from .context import debruijn
+from .context import write_fastq
 #from .context import debruijn_comp
 from debruijn import read_fastq
+from debruijn import read_fastq_batches
 from debruijn import cut_kmer
 from debruijn import build_kmer_dict
 from debruijn import build_graph
+from debruijn import encode_kmer
+from debruijn import decode_kmer
+from debruijn import decode_kmers
+from debruijn import merge_sorted_counts
+from debruijn import cut_kmer_code
+from debruijn import encode_sequences
+from debruijn import reverse_complement
+from debruijn import get_contigs_bidirected
+from debruijn import fastq_chunk_bounds
+from debruijn import shard_indices
+from debruijn import BloomFilter
+from debruijn import abundance_threshold
+from debruijn import kmer_histogram
+from debruijn import spectrum_stats
+from debruijn import save_kmer_counts
+from debruijn import load_kmer_counts
+from debruijn import compact_graph
+from debruijn import path_average_weight
+from debruijn import ArrayGraph
+from debruijn import node_key
+from debruijn import simple_paths
+from debruijn import save_graph
+from debruijn import load_graph
+from debruijn import build_kmer_dicts
+from debruijn import add_pseudo_reads
+from debruijn import multi_k_assembly
+from debruijn import iter_contigs
+from debruijn import Assembler
+from debruijn import fastq_files
+from debruijn import pair_fastq_files
+from debruijn import read_fastq_pairs
+from debruijn import read_fastq_files_batches
+from debruijn import super_kmers
+from debruijn import partition_count
+from debruijn import parse_size
+from debruijn import merge_partitions
 
 
 def test_read_fastq():
@@ -18,6 +58,62 @@ def test_read_fastq():
     assert next(fastq_reader) == "TTTGAATTACAACATCCATATGTTCTTGATGCTGGAATTCCAATATCTCAGTTGACAGTGTGCCCTCACCAGTGGATCAATTTACGAACCAACAATTGTG"
 
 
+@pytest.fixture
+def small_fastq(tmp_path):
+    """Two 7-base reads, TCAGAGA and TCAGAGT"""
+    return write_fastq(tmp_path / "reads.fq", ["TCAGAGA", "TCAGAGT"])
+
+
+def test_read_fastq_quality_and_gzip(tmp_path):
+    """Quality lines starting with @ or + and gzip input"""
+    contenu = b"@r1\nACGTAC\n+\n@@@@@@\n@r2\nGGTTAA\n+r2\n+JJJJJ\n@r3\nTTTT\n+\nJJJJ"
+    fastq = tmp_path / "reads.fq"
+    fastq.write_bytes(contenu)
+    fastq_gz = tmp_path / "reads.fq.gz"
+    fastq_gz.write_bytes(gzip.compress(contenu))
+    for fichier in (fastq, fastq_gz):
+        assert list(read_fastq(str(fichier))) == ["ACGTAC", "GGTTAA", "TTTT"]
+    lots = list(read_fastq_batches(str(fastq), taille_bloc=7))
+    assert [sequence for lot in lots for sequence in lot] == [b"ACGTAC", b"GGTTAA", b"TTTT"]
+
+
+def test_paired_multi_file_input(tmp_path):
+    """Globs, R1/R2 pairs and a shared k-mer table over several files"""
+    reads = sorted(read_fastq(os.path.abspath(os.path.join(os.path.dirname(__file__), "test_two_reads.fq"))))
+    mates = [reverse_complement(read) for read in reads]
+    r1 = write_fastq(tmp_path / "lane1_R1_001.fq", reads)
+    r2 = write_fastq(tmp_path / "lane1_R2_001.fq", mates, compresse=True)
+    seul = write_fastq(tmp_path / "single_1.fq", reads[:1])
+    assert fastq_files(str(tmp_path / "lane1_R?_001.fq")) == [r1, r2]
+    with pytest.raises(FileNotFoundError):
+        fastq_files(str(tmp_path / "absent*.fq"))
+    assert pair_fastq_files([seul, r2, r1]) == [(seul,), (r1, r2)]
+    assert pair_fastq_files([r1]) == [(r1,)]
+    assert list(read_fastq_pairs(r1, r2)) == list(zip(reads, mates))
+    with pytest.raises(ValueError):
+        list(read_fastq_pairs(r1, seul))
+    lots = list(read_fastq_files_batches([r1, r2, seul], taille_bloc=64))
+    assert sorted(sequence.decode() for lot, _, _, _ in lots for sequence in lot) == sorted(reads + mates + reads[:1])
+    #Chaque read est repéré par sa paire de fichiers, son numéro de mate
+    #et son rang dans son fichier : les mates se retrouvent par leur rang.
+    reperes = {(paire, mate, premier + rang): sequence.decode()
+               for lot, paire, mate, premier in lots for rang, sequence in enumerate(lot)}
+    assert {(paire, mate) for paire, mate, _ in reperes} == {(0, 1), (0, 2), (1, 0)}
+    assert [(reperes[(0, 1, rang)], reperes[(0, 2, rang)]) for rang in range(len(reads))]\
+        == list(zip(reads, mates))
+    assert reperes[(1, 0, 0)] == reads[0]
+    assert [(paire, mate, premier) for _, paire, mate, premier in read_fastq_files_batches(r1)] == [(0, 0, 0)]
+    #Les fichiers sont comptés dans une même table, comme s'ils avaient
+    #été concaténés (en série comme en parallèle).
+    concatene = write_fastq(tmp_path / "concatene.fq", reads + mates + reads[:1])
+    attendu = dict(build_kmer_dict(concatene, 21))
+    assert dict(build_kmer_dict([r1, r2, seul], 21)) == attendu
+    assert dict(build_kmer_dict([r1, r2, seul], 21, threads=2)) == attendu
+    assert dict(build_kmer_dict(str(tmp_path / "lane1_R*_001.fq"), 21)) == dict(build_kmer_dict([r1, r2], 21))
+    base = str(tmp_path / "kmers.db")
+    assert dict(build_kmer_dict([r1, r2], 21, base=base)) == dict(build_kmer_dict([r1, r2], 21, base=base))
+
+
 def test_cut_kmer():
     """test Kmer cut"""
     kmer_reader = cut_kmer("TCAGA", 3)
@@ -35,6 +131,115 @@ def test_build_kmer_dict():
     assert "GAG" in kmer_dict
     assert kmer_dict["AGA"] == 2
 
+def test_encode_kmer():
+    assert encode_kmer("ACGT") == 0b00011011
+    assert decode_kmer(encode_kmer("TCAGA"), 5) == "TCAGA"
+    codes = list(cut_kmer_code("TCANGAGA", 3))
+    assert [decode_kmer(code, 3) for code in codes] == ["TCA", "GAG", "AGA"]
+    assert list(encode_sequences(["TCANGAGA"], 3)) == codes
+    assert list(encode_sequences(["TC", "AG"], 3)) == []
+    assert decode_kmers(encode_sequences(["TCANGAGA"], 3), 3) == ["TCA", "GAG", "AGA"]
+    assert decode_kmers(np.array([encode_kmer("T" * 40)], dtype=object), 40) == ["T" * 40]
+    assert decode_kmers(np.empty(0, dtype=np.uint64), 3) == []
+
+def test_merge_sorted_counts():
+    codes = np.array([2, 5, 9], dtype=np.uint64)
+    comptes = np.array([1, 1, 4], dtype=np.uint32)
+    codes, comptes = merge_sorted_counts(codes, comptes, np.array([1, 5, 7, 12], dtype=np.uint64),
+                                         np.array([3, 2, 1, 1], dtype=np.uint32))
+    assert codes.tolist() == [1, 2, 5, 7, 9, 12]
+    assert comptes.tolist() == [3, 1, 3, 1, 4, 1]
+
+def test_build_kmer_dict_large_k():
+    kmer_dict = build_kmer_dict(os.path.abspath(os.path.join(os.path.dirname(__file__), "test_two_reads.fq")), 40)
+    read = next(read_fastq(os.path.abspath(os.path.join(os.path.dirname(__file__), "test_two_reads.fq"))))
+    assert read[:40] in kmer_dict
+    assert kmer_dict[read[:40]] == 1
+    assert "A" * 40 not in kmer_dict
+
+def test_build_kmer_dict_canonical():
+    kmer_dict = build_kmer_dict(os.path.abspath(os.path.join(os.path.dirname(__file__), "test_build.fq")), 3, True)
+    #TCA/TGA CAG/CTG AGA/TCT GAG/CTC
+    assert len(kmer_dict) == 4
+    assert set(kmer_dict) == {"TCA", "CAG", "AGA", "CTC"}
+    assert kmer_dict["TCT"] == 2
+    assert kmer_dict["GAG"] == 1
+
+def test_get_contigs_bidirected():
+    sequence = "TTTGAATTACAACATCCATATGTTCTTGATGCTGG"
+    kmer_dict = {}
+    for read in [sequence[:20], reverse_complement(sequence[10:])]:
+        for kmer in cut_kmer(read, 9, canonique=True):
+            kmer_dict[kmer] = kmer_dict.get(kmer, 0) + 1
+    graph = build_graph(kmer_dict, canonique=True)
+    contigs = list(get_contigs_bidirected(graph))
+    assert len(contigs) == 1
+    assert contigs[0][0] in (sequence, reverse_complement(sequence))
+    assert contigs[0][1] == len(sequence)
+    #Les k-mers du chevauchement des deux reads sont vus deux fois.
+    (_, _, moyenne, mediane), = get_contigs_bidirected(graph, True)
+    assert moyenne == (2 * 2 + 25) / 27
+    assert mediane == 1
+
+def test_build_kmer_dict_threads(tmp_path):
+    fastq = tmp_path / "reads.fq"
+    with open(os.path.abspath(os.path.join(os.path.dirname(__file__), "test_two_reads.fq")), "rb") as reads:
+        contenu = reads.read()
+    fastq.write_bytes(contenu * 5)
+    bornes = fastq_chunk_bounds(str(fastq), 4)
+    assert bornes[0][0] == 0 and bornes[-1][1] == len(contenu) * 5
+    serie = build_kmer_dict(str(fastq), 21)
+    parallele = build_kmer_dict(str(fastq), 21, threads=2, dossier_temporaire=str(tmp_path))
+    assert dict(serie.items()) == dict(parallele.items())
+    assert list(parallele.codes) == sorted(parallele.codes)
+    assert os.listdir(str(tmp_path)) == ["reads.fq"]
+    #Codes concentrés au début de l'espace (tous les bits de poids fort
+    #à zéro) : les partitions tirées du hachage restent équilibrées.
+    codes = np.arange(2 ** 20, dtype=np.uint64)
+    partitions = np.bincount(shard_indices(codes, 8), minlength=8)
+    assert partitions.min() > 0.9 * len(codes) / 8
+
+def test_build_kmer_dict_min_count(small_fastq):
+    kmer_dict = build_kmer_dict(small_fastq, 3, comptes_min=2)
+    assert dict(kmer_dict.items()) == {"TCA": 2, "CAG": 2, "AGA": 3, "GAG": 2}
+    parallele = build_kmer_dict(small_fastq, 3, threads=2, comptes_min=2)
+    assert dict(parallele.items()) == dict(kmer_dict.items())
+    assert abundance_threshold([1, 1, 1, 2, 3, 3, 3, 3]) == 2
+    assert abundance_threshold([2, 2, 3, 4, 4, 4], 5) == 3
+
+def test_kmer_histogram(small_fastq):
+    kmer_dict = build_kmer_dict(small_fastq, 3, comptes_min=2)
+    assert list(kmer_dict.histogram()) == [0, 1, 3, 1]
+    histogramme = kmer_histogram([1] * 50 + [2] * 5 + [9] * 10 + [10] * 30 + [11] * 10)
+    stats = spectrum_stats(histogramme)
+    assert stats["seuil_erreurs"] == 3
+    assert stats["pic_couverture"] == 10
+    assert stats["couverture_mediane"] == 10
+    assert spectrum_stats(kmer_histogram([1] * 50 + [3] * 3 + [5] * 2))["couverture_mediane"] == 3
+    assert stats["taille_genome"] == 50
+
+def test_kmer_counts_database(tmp_path, small_fastq):
+    base = str(tmp_path / "kmers.db")
+    kmer_dict = build_kmer_dict(small_fastq, 3, base=base)
+    relu = load_kmer_counts(base)
+    assert dict(relu.items()) == dict(kmer_dict.items())
+    assert list(relu.histogram()) == list(kmer_dict.histogram())
+    assert dict(build_kmer_dict(small_fastq, 3, comptes_min=2, base=base).items())\
+        == {"TCA": 2, "CAG": 2, "AGA": 3, "GAG": 2}
+    grands = build_kmer_dict(os.path.abspath(os.path.join(os.path.dirname(__file__), "test_two_reads.fq")), 40)
+    save_kmer_counts(grands, base)
+    assert dict(load_kmer_counts(base).items()) == dict(grands.items())
+    # La table déjà projetée garde l'ancien fichier, remplacé d'un coup
+    assert dict(relu.items()) == dict(kmer_dict.items())
+    assert [nom for nom in os.listdir(tmp_path) if nom.startswith("kmers.db")] == ["kmers.db"]
+
+def test_bloom_filter():
+    filtre = BloomFilter(1024)
+    codes = encode_sequences(["TCAGAGAT"], 3)
+    assert not filtre.contains(codes).any()
+    filtre.add(codes[:2])
+    assert filtre.contains(codes[:2]).all()
+
 def test_build_graph():
     file = open(os.path.abspath(os.path.join(os.path.dirname(__file__), "kmer.pck")),'rb')
     kmer_dict = pickle.load(file)
@@ -67,3 +272,168 @@ def test_build_graph():
 #     assert "AG" in graph
 #     assert "GA" in graph
 #     assert graph.edges["AG", "GA"]['weight'] == 2
+
+def test_compact_graph():
+    #TCAGAGACC avec une répétition AGA et une fin alternative AGT.
+    kmer_dict = {"TCA": 2, "CAG": 2, "AGA": 4, "GAG": 3, "AGT": 1,
+                 "GAC": 5, "ACC": 5, "CCT": 3, "CTT": 7}
+    graph = build_graph(kmer_dict)
+    compact = compact_graph(graph)
+    assert set(compact.nodes) == {"TCA", "AG", "GA", "GT", "ACCTT"}
+    assert compact.number_of_edges() == 5
+    assert compact.nodes["ACCTT"]["nbre_aretes"] == 3
+    assert compact.nodes["ACCTT"]["poids_total"] == 15
+    assert compact.edges["GA", "ACCTT"]["weight"] == 5
+    assert path_average_weight(compact, ["TCA", "AG", "GA", "ACCTT"]) == \
+        path_average_weight(graph, ["CA", "AG", "GA", "AC"])
+
+def test_compact_array_graph():
+    """The array compaction gives the same graph as the node walk"""
+    #Un chemin qui se sépare en deux et un cycle isolé (GAGCTAGAG).
+    kmer_dict = {}
+    for sequence in ["ACGGTCATTGACCA", "TTGACCTGGA", "GAGCTAGAG"]:
+        for position in range(len(sequence) - 3):
+            kmer = sequence[position:position + 4]
+            kmer_dict[kmer] = kmer_dict.get(kmer, 0) + position + 1
+    graph = compact_graph(build_graph(kmer_dict))
+    array_graph = compact_graph(build_graph(kmer_dict, backend="array"))
+    assert array_graph.graph == graph.graph
+    assert list(array_graph.nodes(data=True)) == list(graph.nodes(data=True))
+    assert sorted(array_graph.edges(data=True)) == sorted(graph.edges(data=True))
+    assert array_graph.has_edge("AGAGCTAG", "AGAGCTAG")
+    #Une nouvelle compaction après nettoyage cumule les attributs.
+    for compacte in (graph, array_graph):
+        compacte.remove_node("CCA")
+    graph, array_graph = compact_graph(graph), compact_graph(array_graph)
+    assert "ACGGTCATTGACCTGGA" in array_graph
+    assert list(array_graph.nodes(data=True)) == list(graph.nodes(data=True))
+    assert sorted(array_graph.edges(data=True)) == sorted(graph.edges(data=True))
+
+def test_array_graph():
+    kmer_dict = build_kmer_dict(os.path.abspath(os.path.join(os.path.dirname(__file__), "test_two_reads.fq")), 21)
+    graph = build_graph(kmer_dict)
+    array_graph = build_graph(kmer_dict, backend="array")
+    assert isinstance(array_graph, ArrayGraph)
+    assert list(array_graph.nodes) == list(graph.nodes)
+    assert sorted(array_graph.edges(data=True)) == sorted(graph.edges(data=True))
+    array_graph = ArrayGraph()
+    #Les noeuds d'un ArrayGraph sont des séquences : le noeud i est noms[i].
+    noms = dict(enumerate(["AC", "CG", "GA", "GT", "TT", "TA", "TC"], 1))
+    for source, cible, poids in [(1, 2, 5), (3, 2, 10), (2, 4, 10), (4, 5, 3), (5, 6, 10), (5, 7, 10)]:
+        array_graph.add_edge(noms[source], noms[cible], weight=poids)
+    assert list(array_graph.successors("TT")) == ["TA", "TC"]
+    assert array_graph.in_degree("CG") == 2
+    assert array_graph.edges["CG", "GT"]["weight"] == 10
+    assert list(simple_paths(array_graph, "AC", "TA")) == [["AC", "CG", "GT", "TT", "TA"]]
+    array_graph.remove_node("CG")
+    assert "CG" not in array_graph
+    assert ("AC", "CG") not in array_graph.edges
+    assert array_graph.out_degree("AC") == 0
+    assert array_graph.in_degree("GT") == 0
+    assert array_graph.number_of_nodes() == 6
+    assert array_graph.number_of_edges() == 3
+    assert 2 not in array_graph
+    #Deux noeuds longs de même préfixe partagent leur clé.
+    long_a, long_b = "A" * 40, "A" * 39 + "C"
+    array_graph.add_edge(long_a, long_b, weight=4)
+    array_graph.add_edge("TC", long_a, weight=2)
+    assert node_key(long_a) == node_key(long_b) < 0 < node_key("TC")
+    assert list(array_graph.successors(long_a)) == [long_b]
+    assert list(array_graph.predecessors(long_a)) == ["TC"]
+    assert "A" * 39 + "G" not in array_graph
+    #Sans le cache des dernières recherches, les noeuds sont retrouvés
+    #dans l'index trié des clés.
+    copie = pickle.loads(pickle.dumps(array_graph))
+    assert list(copie.successors(long_a)) == [long_b]
+    assert sorted(copie.edges(data=True)) == sorted(array_graph.edges(data=True))
+
+def test_save_graph(tmp_path):
+    kmer_dict = build_kmer_dict(os.path.abspath(os.path.join(os.path.dirname(__file__), "test_two_reads.fq")), 21)
+    for backend in ("networkx", "array"):
+        graph = compact_graph(build_graph(kmer_dict, backend=backend))
+        graph.remove_node(next(iter(graph.nodes)))
+        fichier = str(tmp_path / (backend + ".npz"))
+        save_graph(graph, fichier)
+        relu = load_graph(fichier)
+        assert type(relu) is type(graph)
+        assert relu.graph == graph.graph
+        assert list(relu.nodes(data=True)) == list(graph.nodes(data=True))
+        assert sorted(relu.edges(data=True)) == sorted(graph.edges(data=True))
+
+def test_multi_k_assembly(tmp_path):
+    fichier = os.path.abspath(os.path.join(os.path.dirname(__file__), "test_two_reads.fq"))
+    comptes_21, comptes_31 = build_kmer_dicts(fichier, [21, 31])
+    assert dict(comptes_21.items()) == dict(build_kmer_dict(fichier, 21).items())
+    assert dict(comptes_31.items()) == dict(build_kmer_dict(fichier, 31).items())
+    read = next(read_fastq(fichier))
+    enrichi = add_pseudo_reads(comptes_31, [read])
+    assert enrichi[read[:31]] == comptes_31[read[:31]] + 1
+    assert len(enrichi) == len(comptes_31)
+    #Les pseudo-reads pèsent la couverture médiane des k-mers solides.
+    autre = sorted(read_fastq(fichier))[1]
+    couverts = build_kmer_dict(write_fastq(tmp_path / "couverts.fq", [read] * 5 + [autre]), 31)
+    enrichi = add_pseudo_reads(couverts, [autre])
+    assert enrichi[autre[:31]] == 1 + 5
+    assert enrichi[read[:31]] == 5
+    reads = sorted(read_fastq(fichier))
+    graph = multi_k_assembly(fichier, [21, 31])
+    assert sorted(contig for contig, taille in iter_contigs(graph)) == reads
+
+def test_assembler():
+    reads = sorted(read_fastq(os.path.abspath(os.path.join(os.path.dirname(__file__), "test_two_reads.fq"))))
+    assembleur = Assembler(21)
+    assert assembleur.add_reads(reads[:1]) == 80
+    assert assembleur.contigs() == [(reads[0], 100)]
+    assembleur.add_reads([reads[0], reads[1], reads[1]])
+    assert assembleur.nbre_reads == 4
+    assert assembleur.graph.edges[reads[0][:20], reads[0][1:21]]["weight"] == 2
+    assert sorted(contig for contig, taille in assembleur.contigs()) == reads
+    #Une erreur isolée crée une bulle qui est retirée localement.
+    erreur = reads[1][:50] + ("A" if reads[1][50] != "A" else "C") + reads[1][51:]
+    assembleur.add_reads([erreur])
+    assert sorted(contig for contig, taille in assembleur.contigs()) == reads
+
+
+def test_out_of_core_counting(tmp_path):
+    """Super-k-mer partitions give the same table as in-memory counting"""
+    reads = sorted(read_fastq(os.path.abspath(os.path.join(os.path.dirname(__file__), "test_two_reads.fq"))))
+    lectures = reads * 3 + [reverse_complement(reads[0])] + [reads[1][:40] + "N" + reads[1][41:]]\
+        + [reads[0][:60] + ("A" if reads[0][60] != "A" else "C") + reads[0][61:]]
+    sequences, partitions = super_kmers(lectures, 21, 7)
+    assert len(sequences) == len(partitions) and set(partitions.tolist()) <= set(range(7))
+    #Chaque k-mer se retrouve dans exactement un super-k-mer.
+    assert sorted(kmer for sequence in sequences for kmer in cut_kmer(sequence.decode(), 21))\
+        == sorted(kmer for lecture in lectures for kmer in cut_kmer(lecture, 21) if "N" not in kmer)
+    #Un k-mer et son reverse complément tombent dans la même partition.
+    partition = dict(zip(sequences, partitions.tolist()))
+    _, partitions_inverses = super_kmers([reverse_complement(reads[0])], 21, 7)
+    assert sorted(partitions_inverses.tolist()) == sorted(partition[sequence] for sequence in super_kmers([reads[0]], 21, 7)[0])
+    fastq = write_fastq(tmp_path / "reads.fq", lectures)
+    for taille_kmer, canonique, comptes_min, threads in ((21, False, 1, 1), (21, True, 2, 2), (21, False, "auto", 1), (35, True, 1, 1)):
+        attendu = build_kmer_dict(fastq, taille_kmer, canonique, comptes_min=comptes_min)
+        comptes = build_kmer_dict(fastq, taille_kmer, canonique, threads, comptes_min,
+                                  memoire_max=2 ** 10, dossier_temporaire=str(tmp_path))
+        assert partition_count(fastq, 2 ** 10) > 1
+        assert list(comptes.codes) == list(attendu.codes)
+        assert list(comptes.comptes) == list(attendu.comptes)
+        assert list(comptes.histogram()) == list(attendu.histogram())
+        assert comptes.comptes_min == attendu.comptes_min
+        #Avec une base, la table fusionnée est écrite directement sur disque.
+        base = str(tmp_path / "kmers.db")
+        comptes = build_kmer_dict(fastq, taille_kmer, canonique, threads, comptes_min, base=base,
+                                  memoire_max=2 ** 10, dossier_temporaire=str(tmp_path))
+        assert list(comptes.codes) == list(attendu.codes)
+        assert list(comptes.comptes) == list(attendu.comptes)
+        assert list(load_kmer_counts(base).histogram()) == list(attendu.histogram())
+        os.remove(base)
+    assert sorted(os.listdir(str(tmp_path))) == ["reads.fq"]
+    tables = [(np.array([1, 4, 9, 12], dtype=np.uint64), np.array([1, 2, 3, 4], dtype=np.uint32)),
+              (np.array([2, 3, 10], dtype=np.uint64), np.array([5, 1, 6], dtype=np.uint32)),
+              (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint32))]
+    blocs = list(merge_partitions(tables, seuil=2, taille_bloc=2))
+    assert len(blocs) > 1
+    assert np.concatenate([codes for codes, _ in blocs]).tolist() == [2, 4, 9, 10, 12]
+    assert np.concatenate([comptes for _, comptes in blocs]).tolist() == [5, 2, 3, 6, 4]
+    assert parse_size("512M") == 512 * 2 ** 20 and parse_size("4GB") == 4 * 2 ** 30
+    with pytest.raises(ValueError):
+        parse_size("beaucoup")
@@ -3,16 +3,37 @@ import pytest
 import os
 import networkx as nx
 import statistics
+import random
+import json
 from .context import debruijn
+from .context import write_fastq
 #from .context import debruijn_comp
 from debruijn import std
 from debruijn import path_average_weight
+from debruijn import path_weight_stats
 from debruijn import remove_paths
 from debruijn import select_best_path
 from debruijn import solve_bubble
 from debruijn import simplify_bubbles
 from debruijn import solve_entry_tips
 from debruijn import solve_out_tips
+from debruijn import find_bubbles
+from debruijn import bounded_bubble
+from debruijn import pop_bubbles
+from debruijn import tip_path
+from debruijn import clip_tips
+from debruijn import read_fastq
+from debruijn import build_kmer_dict
+from debruijn import build_graph
+from debruijn import clean_graph
+from debruijn import split_components
+from debruijn import StageMetrics
+from debruijn import reverse_complement
+from debruijn import get_contigs_bidirected
+from debruijn import iter_contigs
+from debruijn import clean_stage
+from debruijn import compact_graph
+from debruijn import DegreeIndex
 
 def test_std():
     assert round(std([9, 5, 15, 20]), 1) == 6.6
@@ -23,6 +44,19 @@ def test_path_weight():
     graph.add_weighted_edges_from([(1, 2, 5), (3, 2, 10), (2, 4, 10), (4, 5, 3), 
                                    (5, 6, 10), (5, 7, 10)])
     assert path_average_weight(graph, [1, 2, 4, 5] ) == 6.0
+    #Only consecutive edges count, not shortcuts between path nodes.
+    graph.add_edge(1, 4, weight=100)
+    assert path_average_weight(graph, [1, 2, 4, 5] ) == 6.0
+    stats = path_weight_stats(graph, [[1, 2, 4, 5], [3, 2, 4], [5, 7]])
+    assert list(stats["moyenne"]) == [6.0, 10.0, 10.0]
+    assert list(stats["minimum"]) == [3, 10, 10]
+    assert round(stats["ecart_type"][0], 2) == round(std([5, 10, 3]), 2)
+    assert stats["ecart_type"][2] == 0.0
+    #Un chemin d'un seul noeud, au début, au milieu ou à la fin.
+    stats = path_weight_stats(graph, [[2], [3, 2, 4], [6], [5, 7], [7]])
+    assert list(stats["moyenne"]) == [0.0, 10.0, 0.0, 10.0, 0.0]
+    assert list(stats["minimum"]) == [0.0, 10.0, 0.0, 10.0, 0.0]
+    assert list(stats["ecart_type"]) == [0.0, 0.0, 0.0, 0.0, 0.0]
 
 def test_remove_paths():
     graph_1 = nx.DiGraph()
@@ -95,6 +129,15 @@ def test_select_best_path():
                             (9, 5), (5, 6), (5, 7)])
     graph_5 = select_best_path(graph_5, [[2, 4, 5], [2, 8, 9, 5]],
                                          [1, 4], [10, 10])
+    # Random choice only among the heaviest and longest paths
+    for graine in range(5):
+        graph_6 = nx.DiGraph()
+        graph_6.add_edges_from([(1, 2), (1, 3), (1, 4), (2, 5), (3, 5), (4, 5)])
+        graph_6 = select_best_path(graph_6, [[1, 2, 5], [1, 3, 5], [1, 4, 5]],
+                                   [9, 3, 3], [5, 10, 10], rng=random.Random(graine))
+        assert 1 in graph_6.nodes() and 5 in graph_6.nodes()
+        assert 2 not in graph_6.nodes()
+        assert (3 in graph_6.nodes()) != (4 in graph_6.nodes())
 
 def test_solve_bubble():
     graph_1 = nx.DiGraph()
@@ -143,6 +186,47 @@ def test_simplify_bubbles():
     assert (2,10) not in graph_1.edges()
     assert (10, 5) not in graph_1.edges()
 
+def test_find_bubbles():
+    graph_1 = nx.DiGraph()
+    #Bulle 2 -> 5 contenant une bulle imbriquée 8 -> 11, puis une
+    #pointe de sortie en 5 qui ne forme pas de bulle.
+    graph_1.add_weighted_edges_from([(1, 2, 10), (2, 4, 10), (4, 5, 10),
+                                     (2, 8, 3), (8, 9, 3), (8, 10, 3),
+                                     (9, 11, 3), (10, 11, 3), (11, 5, 3),
+                                     (5, 6, 10), (5, 7, 10)])
+    assert find_bubbles(graph_1) == [[8, 11], [2, 5]]
+    #Chemin alternatif qui rejoint un noeud du chemin conservé.
+    graph_2 = nx.DiGraph()
+    graph_2.add_weighted_edges_from([(1, 2, 10), (2, 3, 10), (3, 4, 10),
+                                     (2, 5, 2), (5, 3, 2), (4, 6, 10)])
+    assert find_bubbles(graph_2) == [[2, 3]]
+    graph_2 = simplify_bubbles(graph_2)
+    assert 5 not in graph_2.nodes()
+    assert 3 in graph_2.nodes()
+    assert (2, 3) in graph_2.edges()
+
+def test_pop_bubbles():
+    graph_1 = nx.DiGraph()
+    #Bulle 2 -> 5 dont le chemin faible est rejoint en 6 par une branche
+    #d'erreur venant de 8 : ce n'est pas une superbulle.
+    graph_1.add_weighted_edges_from([(1, 2, 10), (2, 3, 10), (3, 4, 10),
+                                     (4, 5, 10), (2, 6, 2), (6, 7, 2),
+                                     (7, 5, 2), (8, 6, 1), (5, 9, 10)])
+    assert find_bubbles(graph_1) == []
+    assert bounded_bubble(graph_1, 2, 10) == ([2, 3, 4, 5], [2, 6, 7, 5])
+    assert bounded_bubble(graph_1, 2, 2) is None
+    assert bounded_bubble(graph_1, 2, 3) is not None
+    statistiques = {}
+    graph_1 = pop_bubbles(graph_1, 10, statistiques=statistiques)
+    assert statistiques["bulles"] == 1
+    assert 6 not in graph_1.nodes() and 7 not in graph_1.nodes()
+    assert (3, 4) in graph_1.edges() and (4, 5) in graph_1.edges()
+    #Chemin faible réduit à une arête directe : rien n'est retiré.
+    graph_2 = nx.DiGraph()
+    graph_2.add_weighted_edges_from([(1, 2, 10), (2, 3, 10), (3, 4, 10),
+                                     (2, 4, 1)])
+    assert sorted(pop_bubbles(graph_2, 10).nodes()) == [1, 2, 3, 4]
+
 def test_solve_entry_tips():
     graph_1 = nx.DiGraph()
     graph_1.add_weighted_edges_from([(1, 2, 10), (3, 2, 2), (2, 4, 15), (4, 5, 15)])
@@ -168,3 +252,151 @@ def test_solve_out_tips():
     graph_2 = solve_out_tips(graph_2, [5, 7])  
     assert (4, 5) not in graph_2.edges()
     assert (6, 7) in graph_2.edges() 
+
+
+def test_clip_tips():
+    graph_1 = nx.DiGraph()
+    #Entrée principale 1 -> 2 -> 3 -> 4, pointe courte 10 -> 3,
+    #sortie principale 4 -> 5 -> 6 -> 7, pointe courte 5 -> 11 -> 12.
+    graph_1.add_weighted_edges_from([(1, 2, 10), (2, 3, 10), (10, 3, 2),
+                                     (3, 4, 10), (4, 5, 10), (5, 6, 10),
+                                     (6, 7, 10), (5, 11, 2), (11, 12, 2)])
+    assert tip_path(graph_1, 10) == [10, 3]
+    assert tip_path(graph_1, 12, entree=False) == [5, 11, 12]
+    assert tip_path(graph_1, 1) == [1, 2, 3]
+    graph_1, nbre_retirees = clip_tips(graph_1, 2)
+    assert nbre_retirees == 1
+    assert 10 not in graph_1.nodes()
+    assert 12 in graph_1.nodes()
+    graph_1, nbre_retirees = clip_tips(graph_1, 3)
+    assert nbre_retirees == 1
+    assert 11 not in graph_1.nodes()
+    assert 12 not in graph_1.nodes()
+    assert (5, 6) in graph_1.edges()
+    #Deux pointes seules : la meilleure est conservée.
+    graph_2 = nx.DiGraph()
+    graph_2.add_weighted_edges_from([(1, 3, 10), (2, 3, 2), (3, 4, 10)])
+    graph_2, nbre_retirees = clip_tips(graph_2, 5)
+    assert nbre_retirees == 1
+    assert 1 in graph_2.nodes()
+    assert 2 not in graph_2.nodes()
+    graph_3 = nx.DiGraph()
+    graph_3.add_weighted_edges_from([(1, 3, 10), (2, 3, 2), (3, 4, 10)])
+    graph_3, nbre_retirees = clip_tips(graph_3, 1, couverture_min=5)
+    assert 2 not in graph_3.nodes()
+
+@pytest.fixture
+def reads_with_errors(tmp_path):
+    """The two test reads and a fastq where each read is seen twice,
+    plus a copy with an error (bubble) and a truncated copy ending with
+    an error (tip)"""
+    reads = list(read_fastq(os.path.abspath(os.path.join(os.path.dirname(__file__), "test_two_reads.fq"))))
+    lectures = reads * 2 + [read[:50] + ("A" if read[50] != "A" else "C") + read[51:] for read in reads]\
+        + [read[:80] + ("A" if read[80] != "A" else "C") for read in reads]
+    return reads, write_fastq(tmp_path / "reads.fq", lectures)
+
+@pytest.fixture
+def noisy_genomes(tmp_path):
+    """Reads drawn from two random genomes (20x, 1% substitutions, half of
+    them reverse-complemented), giving many weak components"""
+    rng = random.Random(9)
+    genomes = ["".join(rng.choice("ACGT") for _ in range(taille)) for taille in (1500, 1000)]
+    lectures = []
+    for genome in genomes:
+        for _ in range(len(genome) // 5):
+            debut = rng.randrange(len(genome) - 100)
+            read = [base if rng.random() >= 0.01 else rng.choice("ACGT".replace(base, ""))
+                    for base in genome[debut:debut + 100]]
+            read = "".join(read)
+            lectures.append(reverse_complement(read) if rng.random() < 0.5 else read)
+    return write_fastq(tmp_path / "genomes.fq", lectures)
+
+def test_clean_graph_threads(noisy_genomes):
+    """Cleaning in parallel, or after shuffling the nodes, gives the same
+    contigs as cleaning in series"""
+    kmer_dict = build_kmer_dict(noisy_genomes, 21)
+    assert len(split_components(build_graph(kmer_dict), 4)) == 4
+    kmers = list(kmer_dict.items())
+    random.Random(0).shuffle(kmers)
+    for backend in ("networkx", "array"):
+        contigs = []
+        for threads, kmers_graph in ((1, kmer_dict), (3, kmer_dict), (1, dict(kmers))):
+            graph = clean_graph(build_graph(kmers_graph, backend=backend), 42, threads=threads)
+            contigs.append(sorted(contig for contig, _ in iter_contigs(graph)))
+        assert all(autres == contigs[0] for autres in contigs[1:])
+
+def test_clean_stage_frontier(monkeypatch, noisy_genomes):
+    """After the first round, bubbles and tips are only searched from the
+    nodes whose neighbourhood changed in the previous round"""
+    graph = compact_graph(build_graph(build_kmer_dict(noisy_genomes, 21)))
+    tours = [set()]
+    frontieres = []
+    def visiter(fonction):
+        def enveloppe(graph, noeud, *args, **kwargs):
+            tours[-1].add(noeud)
+            return fonction(graph, noeud, *args, **kwargs)
+        return enveloppe
+    for nom in ("superbubble_exit", "bounded_bubble", "tip_path"):
+        monkeypatch.setattr(debruijn, nom, visiter(getattr(debruijn, nom)))
+    pop_frontier = DegreeIndex.pop_frontier
+    def relever(index):
+        frontiere = pop_frontier(index)
+        frontieres.append(set(frontiere))
+        tours.append(set())
+        return frontiere
+    monkeypatch.setattr(DegreeIndex, "pop_frontier", relever)
+    clean_stage(graph, "final", 42)
+    assert len(frontieres) > 2 and not frontieres[-1]
+    assert len(tours[0]) > len(frontieres[0])
+    for visites, frontiere in zip(tours[1:], frontieres):
+        assert visites <= frontiere
+
+def test_clean_graph_bidirected(tmp_path, reads_with_errors):
+    """The bidirected graph is cleaned and compacted like the directed one,
+    whatever strand the reads come from"""
+    reads, fastq = reads_with_errors
+    lectures = list(read_fastq(fastq))
+    #Une lecture sur deux est lue sur le brin complémentaire
+    lectures = [reverse_complement(read) if numero % 2 else read for numero, read in enumerate(lectures)]
+    kmer_dict = build_kmer_dict(write_fastq(tmp_path / "brins.fq", lectures), 21, True)
+    graph = clean_graph(build_graph(kmer_dict, canonique=True), 42)
+    assert graph.graph["bidirige"]
+    assert graph.number_of_nodes() == 2
+    assert graph.number_of_edges() == 0
+    contigs = list(get_contigs_bidirected(graph))
+    assert sorted(min(contig, reverse_complement(contig)) for contig, _ in contigs)\
+        == sorted(min(read, reverse_complement(read)) for read in reads)
+    assert all(donnees["nbre_aretes"] == longueur - 20 for (_, donnees), (_, longueur)
+               in zip(graph.nodes(data=True), contigs))
+    #La couverture est celle du graph orienté construit sur les reads
+    #d'origine, qu'elle vienne des arêtes ou de la table des k-mers.
+    orientes = build_kmer_dict(fastq, 21)
+    attendues = {min(contig, reverse_complement(contig)): couvertures for contig, _, *couvertures
+                 in iter_contigs(clean_graph(build_graph(orientes), 42), True)}
+    for couverture in (True, kmer_dict):
+        assert {min(contig, reverse_complement(contig)): couvertures for contig, _, *couvertures
+                in get_contigs_bidirected(graph, couverture)} == attendues
+
+def test_clean_graph_metrics(tmp_path, reads_with_errors):
+    kmer_dict = build_kmer_dict(reads_with_errors[1], 21)
+    for threads in (1, 2):
+        mesures = StageMetrics(str(tmp_path / "profil") if threads == 1 else "")
+        graph = clean_graph(build_graph(kmer_dict), 42, threads=threads, mesures=mesures)
+        etapes = {mesure["etape"]: mesure for mesure in mesures.etapes}
+        assert list(etapes) == ["graph", "bubbles", "tips", "final"]
+        assert etapes["bubbles"]["bulles"] == 2
+        assert etapes["tips"]["pointes"] == 2
+        assert etapes["final"]["noeuds"] == graph.number_of_nodes() == 2
+        assert all(mesure["temps"] >= 0 for mesure in mesures.etapes)
+        assert ("pic_python" in etapes["tips"]) == (threads == 1)
+        if etapes["graph"]["rss_pic_processus"] is not None:
+            #Le pic du processus ne redescend pas, la hausse de chaque
+            #étape est au plus l'écart entre deux pics successifs.
+            pics = [mesure["rss_pic_processus"] for mesure in mesures.etapes]
+            assert pics == sorted(pics)
+            assert all(mesure["rss_hausse"] >= 0 for mesure in mesures.etapes)
+            assert sum(mesure["rss_hausse"] for mesure in mesures.etapes[1:]) <= pics[-1] - pics[0]
+    assert (tmp_path / "profil.tips.prof").exists()
+    mesures.save(str(tmp_path / "mesures.json"))
+    with open(str(tmp_path / "mesures.json")) as fichier:
+        assert [mesure["etape"] for mesure in json.load(fichier)["etapes"]] == list(etapes)